@@ -1,83 +1,337 @@
-import uuid
-from sqlalchemy.orm import Session
-from . import models, schemas
-from sqlalchemy.sql import text
-from sqlalchemy import inspect, Table, MetaData, func
-
-
-# Query a database table or view by its name and client ID with optional column selection
-def query_table_or_view(db: Session, table_or_view_name: str, filters: dict = None, columns: list = None):
-    
-    table = models.Base.metadata.tables[table_or_view_name]
-    # query = db.query(*[table.c[col] for col in columns] if columns else table).filter_by(client_id=client_id)
-    query = db.query(*[table.c[col] for col in columns] if columns else table)
-    if filters:
-        for key, value in filters.items():
-            query = query.filter(table.c[key] == value)
-    return query.all()
-
-# Retrieve the names of all tables and views in the database
-def get_all_tables_and_views(db: Session):
-    """
-    Get the names of all tables and views in the database.
-
-    :param db: The database session.
-    :return: A list of table and view names.
-    """
-    inspector = inspect(db.bind)
-    return inspector.get_table_names() + inspector.get_view_names()
-
-def get_table_or_view_columns(db: Session, table_or_view_name: str, schema: str = None):
-    """
-    Get the columns of a table or view.
-    
-    :param db: The database session.
-    :param table_or_view_name: The name of the table or view.
-    :param schema: The schema of the table or view (optional).
-    :return: A list of column names.
-    """
-    inspector = inspect(db.bind)
-    return [column['name'] for column in inspector.get_columns(table_or_view_name, schema=schema)]
-
-def query_table_with_columns(db: Session, table_name: str, text_columns: list, id_column: str, schema: str = None, filters: dict = None): 
-    """
-    Query a table and concatenate specified text columns into a single column.
-
-    :param db: The database session.
-    :param table_name: The name of the table to query.
-    :param text_columns: A list of text column names to concatenate.
-    :param id_column: The ID column name.
-    :param schema: The schema of the table (optional).
-    :return: A list of rows with concatenated text columns.
-    """
-    try:
-        meta = MetaData()
-        table = Table(table_name, meta, autoload_with=db.bind, schema=schema)
-
-        id_col = table.c[id_column]
-        
-        # Check if text_columns has more than one column
-        if len(text_columns) > 1:
-            # Concatenate all text columns
-            concatenated_column = func.concat(*[table.c[column] for column in text_columns])
-            
-        else:
-            # Use the single column directly
-            concatenated_column = table.c[text_columns[0]]
-
-        # Build the query
-        query = db.query(id_col, concatenated_column.label("concatenated_text"))
-
-        if filters:
-            for key, value in filters.items():
-                query = query.filter(table.c[key] == value)
-
-        # Execute the query and fetch results
-        results = query.all()
-
-        return results
-    
-    except AttributeError as e:
-        raise ValueError(f"Column not found: {e}") from e
-    except Exception as e:
-        raise RuntimeError(f"An error occurred while querying the table: {e}") from e
\ No newline at end of file
+import os
+import uuid
+import decimal
+import datetime
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy.orm import Session
+from . import models, schemas
+from sqlalchemy.sql import text
+from sqlalchemy import inspect, Table, MetaData, func, select
+
+# Number of rows read at a time when a table is streamed, see `stream_table_with_columns`
+STREAM_CHUNK_SIZE = 10000
+
+# Number of ID range partitions a table is split into, and number of connections
+# reading them concurrently, see `stream_table_partitioned`
+INGEST_PARTITIONS = int(os.getenv("INGEST_PARTITIONS", 8))
+INGEST_CONNECTIONS = int(os.getenv("INGEST_CONNECTIONS", 4))
+
+
+# Query a database table or view by its name and client ID with optional column selection
+def query_table_or_view(db: Session, table_or_view_name: str, filters: dict = None, columns: list = None):
+    
+    table = models.Base.metadata.tables[table_or_view_name]
+    # query = db.query(*[table.c[col] for col in columns] if columns else table).filter_by(client_id=client_id)
+    query = db.query(*[table.c[col] for col in columns] if columns else table)
+    if filters:
+        for key, value in filters.items():
+            query = query.filter(table.c[key] == value)
+    return query.all()
+
+# Retrieve the names of all tables and views in the database
+def get_all_tables_and_views(db: Session):
+    """
+    Get the names of all tables and views in the database.
+
+    :param db: The database session.
+    :return: A list of table and view names.
+    """
+    inspector = inspect(db.bind)
+    return inspector.get_table_names() + inspector.get_view_names()
+
+def get_table_or_view_columns(db: Session, table_or_view_name: str, schema: str = None):
+    """
+    Get the columns of a table or view.
+    
+    :param db: The database session.
+    :param table_or_view_name: The name of the table or view.
+    :param schema: The schema of the table or view (optional).
+    :return: A list of column names.
+    """
+    inspector = inspect(db.bind)
+    return [column['name'] for column in inspector.get_columns(table_or_view_name, schema=schema)]
+
+def table_column(table: Table, column: str):
+    """
+    Get a column of a reflected table.
+
+    :raises ValueError: If the column does not exist.
+    """
+    try:
+        return table.c[column]
+    except KeyError:
+        raise ValueError(f"Column not found: {column}") from None
+
+def column_value(column, value):
+    """
+    Convert a value stored as a string, e.g. a sync watermark, to the type of a
+    column, so that the column is compared with a value of its own type.
+
+    :raises ValueError: If the value is not valid for the column.
+    """
+    if not isinstance(value, str):
+        return value
+    try:
+        python_type = column.type.python_type
+    except NotImplementedError:
+        return value
+    if python_type in (datetime.datetime, datetime.date, datetime.time):
+        return python_type.fromisoformat(value)
+    if python_type in (int, float, decimal.Decimal):
+        return python_type(value)
+    return value
+
+def text_columns_query(db: Session, table_name: str, text_columns: list, id_column: str, schema: str = None, filters: dict = None, id_range: tuple = None, updated_range: tuple = None, extra_columns: list = None):
+    """
+    Build a query of the ID column of a table and its text columns concatenated into
+    a single column, see `query_table_with_columns`, followed by `extra_columns`
+    (e.g. the filter columns of a search index) as they are. `id_range` restricts the rows
+    to a (low, high) range of IDs, low included and high excluded, None for no bound.
+    `updated_range` restricts the rows to those whose (column, since, until) update
+    column value is between since and until, both included, None for no bound.
+
+    :raises ValueError: If a column does not exist.
+    """
+    meta = MetaData()
+    table = Table(table_name, meta, autoload_with=db.bind, schema=schema)
+
+    id_col = table_column(table, id_column)
+
+    # Check if text_columns has more than one column
+    if len(text_columns) > 1:
+        # Concatenate all text columns
+        concatenated_column = func.concat(*[table_column(table, column) for column in text_columns])
+
+    else:
+        # Use the single column directly
+        concatenated_column = table_column(table, text_columns[0])
+
+    # Build the query
+    query = db.query(id_col, concatenated_column.label("concatenated_text"),
+                     *[table_column(table, column) for column in extra_columns or []])
+
+    if filters:
+        for key, value in filters.items():
+            query = query.filter(table_column(table, key) == value)
+
+    if id_range:
+        low, high = id_range
+        if low is not None:
+            query = query.filter(id_col >= low)
+        if high is not None:
+            query = query.filter(id_col < high)
+
+    if updated_range:
+        column, since, until = updated_range
+        updated_col = table_column(table, column)
+        # watermarks are stored as strings, see `search_crud.update_sync_watermark`
+        if since is not None:
+            query = query.filter(updated_col >= column_value(updated_col, since))
+        if until is not None:
+            query = query.filter(updated_col <= column_value(updated_col, until))
+
+    return query
+
+def query_table_with_columns(db: Session, table_name: str, text_columns: list, id_column: str, schema: str = None, filters: dict = None): 
+    """
+    Query a table and concatenate specified text columns into a single column.
+
+    :param db: The database session.
+    :param table_name: The name of the table to query.
+    :param text_columns: A list of text column names to concatenate.
+    :param id_column: The ID column name.
+    :param schema: The schema of the table (optional).
+    :return: A list of rows with concatenated text columns.
+    :raises ValueError: If a column does not exist.
+    """
+    try:
+        query = text_columns_query(db, table_name, text_columns, id_column, schema, filters)
+
+        # Execute the query and fetch results
+        results = query.all()
+
+        return results
+    
+    except ValueError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"An error occurred while querying the table: {e}") from e
+
+def stream_table_with_columns(db: Session, table_name: str, text_columns: list, id_column: str, schema: str = None, filters: dict = None, chunk_size: int = STREAM_CHUNK_SIZE, id_range: tuple = None, updated_range: tuple = None, extra_columns: list = None):
+    """
+    Stream a table with its text columns concatenated into a single column, in chunks.
+    Rows are read through a server side cursor (`yield_per`), so only one chunk of
+    the table is held in memory at a time.
+
+    :param db: The database session.
+    :param table_name: The name of the table to query.
+    :param text_columns: A list of text column names to concatenate.
+    :param id_column: The ID column name.
+    :param schema: The schema of the table (optional).
+    :param chunk_size: The number of rows per chunk.
+    :param id_range: A (low, high) range of IDs to read, see `text_columns_query`.
+    :param updated_range: A (column, since, until) range of update times to read, see `text_columns_query`.
+    :param extra_columns: Columns read after the text, see `text_columns_query`.
+    :return: A generator of lists of (id, text, *extra column values) tuples.
+    :raises ValueError: If a column does not exist.
+    """
+    try:
+        query = text_columns_query(db, table_name, text_columns, id_column, schema, filters, id_range, updated_range,
+                                   extra_columns)
+        result = db.execute(query.statement, execution_options={"yield_per": chunk_size})
+
+        for partition in result.partitions():
+            yield [tuple(row) for row in partition]
+
+    except ValueError:
+        raise
+    except Exception as e:
+        raise RuntimeError(f"An error occurred while querying the table: {e}") from e
+
+def id_partitions(db: Session, table_name: str, id_column: str, schema: str = None, partitions: int = INGEST_PARTITIONS, min_rows: int = STREAM_CHUNK_SIZE):
+    """
+    Split the rows of a table into ranges of IDs of about the same size.
+    Integer IDs are split into ranges of equal width between the lowest and the
+    highest ID; other IDs into ranges of the same number of IDs, in ID order.
+
+    :param db: The database session.
+    :param table_name: The name of the table.
+    :param id_column: The ID column name.
+    :param schema: The schema of the table (optional).
+    :param partitions: The number of partitions.
+    :param min_rows: The number of rows below which the table is not split.
+    :return: A list of (low, high) ID ranges, see `text_columns_query`.
+    :raises ValueError: If the ID column does not exist.
+    """
+    table = Table(table_name, MetaData(), autoload_with=db.bind, schema=schema)
+    id_col = table_column(table, id_column)
+
+    count = db.execute(select(func.count()).select_from(table)).scalar()
+    if partitions < 2 or count < min_rows:
+        return [(None, None)]
+
+    try:
+        integer_ids = id_col.type.python_type is int
+    except NotImplementedError:
+        integer_ids = False
+
+    if integer_ids:
+        low, high = db.execute(select(func.min(id_col), func.max(id_col))).one()
+        width = -(-(high - low + 1) // partitions)
+        bounds = [low + i * width for i in range(1, partitions)]
+    else:
+        # every `step`-th ID starts a range, read in one pass over the IDs in order
+        # rather than with an OFFSET per bound, which goes through the IDs again each time
+        step = -(-count // partitions)
+        numbered = select(id_col.label('id'), func.row_number().over(order_by=id_col).label('row')).subquery()
+        bounds = db.execute(select(numbered.c.id).where(numbered.c.row > 1, (numbered.c.row - 1) % step == 0)
+                            .order_by(numbered.c.row)).scalars().all()
+        # repeated IDs would make empty partitions
+        bounds = sorted(set(bounds))
+
+    return list(zip([None] + bounds, bounds + [None]))
+
+def stream_table_partitioned(db: Session, table_name: str, text_columns: list, id_column: str, schema: str = None, filters: dict = None, chunk_size: int = STREAM_CHUNK_SIZE, partitions: int = INGEST_PARTITIONS, connections: int = INGEST_CONNECTIONS, extra_columns: list = None):
+    """
+    Stream a table in chunks like `stream_table_with_columns`, reading ranges of IDs
+    (see `id_partitions`) concurrently over up to `connections` database
+    connections. Chunks are yielded as they arrive from any partition, so rows are
+    not in ID order. At most two chunks per connection wait to be consumed.
+
+    :param db: The database session; partitions are read in sessions on the same engine.
+    :return: A generator of lists of (id, text, *extra column values) tuples.
+    """
+    ranges = id_partitions(db, table_name, id_column, schema, partitions, chunk_size)
+    if len(ranges) == 1:
+        yield from stream_table_with_columns(db, table_name, text_columns, id_column, schema, filters, chunk_size,
+                                             extra_columns=extra_columns)
+        return
+
+    chunks = queue.Queue(maxsize=2 * connections)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        # give up when the consumer is gone, rather than block forever on a full queue
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def read(id_range):
+        session = Session(bind=db.get_bind())
+        try:
+            for chunk in stream_table_with_columns(session, table_name, text_columns, id_column, schema,
+                                                   filters, chunk_size, id_range, extra_columns=extra_columns):
+                if not put(chunk):
+                    return
+        except Exception as e:
+            put(e)
+        finally:
+            session.close()
+            put(done)
+
+    with ThreadPoolExecutor(max_workers=connections) as executor:
+        for id_range in ranges:
+            executor.submit(read, id_range)
+        try:
+            remaining = len(ranges)
+            while remaining:
+                item = chunks.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    yield item
+        finally:
+            stopped.set()
+
+def stream_table_ids(db: Session, table_name: str, id_column: str, schema: str = None, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Stream the IDs of the rows of a table, in chunks, see `stream_table_with_columns`.
+
+    :return: A generator of lists of IDs.
+    """
+    try:
+        table = Table(table_name, MetaData(), autoload_with=db.bind, schema=schema)
+        result = db.execute(select(table.c[id_column]), execution_options={"yield_per": chunk_size})
+
+        for partition in result.partitions():
+            yield [row[0] for row in partition]
+
+    except KeyError as e:
+        raise ValueError(f"Column not found: {e}") from e
+    except Exception as e:
+        raise RuntimeError(f"An error occurred while querying the table: {e}") from e
+
+def max_column_value(db: Session, table_name: str, column: str, schema: str = None):
+    """
+    Get the highest value of a column of a table, e.g. the latest update time.
+
+    :return: The highest value, or None if the table is empty.
+    """
+    try:
+        table = Table(table_name, MetaData(), autoload_with=db.bind, schema=schema)
+        return db.execute(select(func.max(table.c[column]))).scalar()
+
+    except KeyError as e:
+        raise ValueError(f"Column not found: {e}") from e
+    except Exception as e:
+        raise RuntimeError(f"An error occurred while querying the table: {e}") from e
+
+def count_rows(db: Session, table_name: str, schema: str = None):
+    """
+    Count the rows of a table.
+    """
+    try:
+        table = Table(table_name, MetaData(), autoload_with=db.bind, schema=schema)
+        return db.execute(select(func.count()).select_from(table)).scalar()
+
+    except Exception as e:
+        raise RuntimeError(f"An error occurred while querying the table: {e}") from e
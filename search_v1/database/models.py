@@ -1,81 +1,106 @@
-from sqlalchemy import Column, Integer, String, Text
-from .database import Base
-
-# Models for the Account Service
-# These models represent the database tables for the account service.
-class Organization(Base):
-    __tablename__ = 'organization'
-    __table_args__ = {'schema': 'ai'}
-
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    name = Column(String)
-    description = Column(Text)
-    contact_name = Column(String)
-    contact_phone = Column(String)
-    contact_email = Column(String)
-    contact_address = Column(String)
-    organization_id = Column(String)
-    organization_type = Column(String)
-
-class User(Base):
-    __tablename__ = 'user'
-    __table_args__ = {'schema': 'ai'}
-
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    full_name = Column(String)
-    username = Column(String)
-    password = Column(String)
-    email = Column(String)
-    organization_id = Column(String)
-    role = Column(String)
-    is_active = Column(Integer)
-    user_id = Column(String)
-
-
-# Models for the Search Service
-# These models represent the database tables for the search service.
-class SearchIndex(Base):
-    __tablename__ = 'search_index'
-    __table_args__ = {'schema': 'ai'}
-
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    global_id = Column(String)
-    title = Column(String)
-    description = Column(String)
-    table_name = Column(String)
-    text_columns = Column(Text)
-    id_col = Column(String)
-    org_id = Column(String)
-    source = Column(String)
-    schema_name = Column(String)
-    created_by = Column(String)
-
-class IndexDocument(Base):
-    __tablename__ = 'index_document'
-    __table_args__ = {'schema': 'ai'}
-
-    id = Column(Integer, primary_key=True, index=True)
-    global_id = Column(String)
-    index_id = Column(Integer)
-    filename = Column(String)
-    filepath = Column(String)
-    client_id = Column(String)
-
-
-# Models for the Connection Service
-# These models represent the database tables for the connection service.
-class Connection(Base):
-    __tablename__ = 'connection'
-    __table_args__ = {'schema': 'ai'}
-
-    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
-    connection_id = Column(String)
-    connection_name = Column(String)
-    connection_type = Column(String)
-    host = Column(String)
-    port = Column(Integer)
-    username = Column(String)
-    password = Column(String)
-    database_name = Column(String)
-    schema_name = Column(String)
-    client_id = Column(String)
\ No newline at end of file
+from sqlalchemy import Column, Integer, String, Text, inspect
+from sqlalchemy.sql import text
+from .database import Base
+
+# Models for the Account Service
+# These models represent the database tables for the account service.
+class Organization(Base):
+    __tablename__ = 'organization'
+    __table_args__ = {'schema': 'ai'}
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    name = Column(String)
+    description = Column(Text)
+    contact_name = Column(String)
+    contact_phone = Column(String)
+    contact_email = Column(String)
+    contact_address = Column(String)
+    organization_id = Column(String)
+    organization_type = Column(String)
+
+class User(Base):
+    __tablename__ = 'user'
+    __table_args__ = {'schema': 'ai'}
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    full_name = Column(String)
+    username = Column(String)
+    password = Column(String)
+    email = Column(String)
+    organization_id = Column(String)
+    role = Column(String)
+    is_active = Column(Integer)
+    user_id = Column(String)
+
+
+# Models for the Search Service
+# These models represent the database tables for the search service.
+class SearchIndex(Base):
+    __tablename__ = 'search_index'
+    __table_args__ = {'schema': 'ai'}
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    global_id = Column(String)
+    title = Column(String)
+    description = Column(String)
+    table_name = Column(String)
+    text_columns = Column(Text)
+    id_col = Column(String)
+    org_id = Column(String)
+    source = Column(String)
+    schema_name = Column(String)
+    created_by = Column(String)
+    # column holding the last update time (or version) of the source rows, and its
+    # highest value seen by the last sync, see `index_router.sync_index`
+    updated_col = Column(String)
+    sync_watermark = Column(String)
+
+class IndexDocument(Base):
+    __tablename__ = 'index_document'
+    __table_args__ = {'schema': 'ai'}
+
+    id = Column(Integer, primary_key=True, index=True)
+    global_id = Column(String)
+    index_id = Column(Integer)
+    filename = Column(String)
+    filepath = Column(String)
+    client_id = Column(String)
+
+
+# Models for the Connection Service
+# These models represent the database tables for the connection service.
+class Connection(Base):
+    __tablename__ = 'connection'
+    __table_args__ = {'schema': 'ai'}
+
+    id = Column(Integer, primary_key=True, index=True, autoincrement=True)
+    connection_id = Column(String)
+    connection_name = Column(String)
+    connection_type = Column(String)
+    host = Column(String)
+    port = Column(Integer)
+    username = Column(String)
+    password = Column(String)
+    database_name = Column(String)
+    schema_name = Column(String)
+    client_id = Column(String)
+
+
+def add_missing_columns(engine):
+    """
+    Add the columns of the models missing from their existing tables.
+    `create_all` only creates missing tables, so the columns added to a model
+    since its table was created, e.g. `SearchIndex.updated_col`, are added here.
+    They are nullable, so existing rows read as None.
+    """
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    with engine.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name, schema=table.schema):
+                continue
+            existing = {column['name'] for column in inspector.get_columns(table.name, schema=table.schema)}
+            for column in table.columns:
+                if column.name not in existing:
+                    connection.execute(text(f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN "
+                                            f"{preparer.quote(column.name)} {column.type.compile(dialect=engine.dialect)}"))
@@ -1,76 +1,133 @@
-from pydantic import BaseModel
-
-class OrganizationBase(BaseModel):
-    name: str | None = None
-    description: str | None = None
-    contact_name: str | None = None
-    contact_phone: str | None = None
-    contact_email: str | None = None
-    contact_address: str | None = None
-    organization_id: str | None = None
-    organization_type: str | None = None
-
-class OrganizationCreate(OrganizationBase):
-    pass
-
-class Organization(OrganizationBase):
-    id: int
-
-    class Config:
-        from_attributes = True
-
-class UserBase(BaseModel):
-    full_name: str | None = None
-    username: str | None = None
-    password: str | None = None
-    email: str | None = None
-    organization_id: str | None = None
-    role: str | None = None
-    is_active: int | None = None
-    user_id: str | None = None
-
-class UserCreate(UserBase):
-    pass
-
-class User(UserBase):
-    id: int
-
-    class Config:
-        from_attributes = True
-
-class SearchIndexBase(BaseModel):
-    global_id: str | None = None
-    title: str | None = None
-    description: str | None = None
-    table_name: str | None = None
-    text_columns: str | None = None
-    id_col: str | None = None
-    org_id: str | None = None
-    source: str | None = None
-    schema_name: str | None = None
-
-class SearchIndexCreate(SearchIndexBase):
-    pass
-
-class SearchIndex(SearchIndexBase):
-    id: int
-    created_by: str | None = None
-
-    class Config:
-        from_attributes = True
-
-
-class IndexDocumentBase(BaseModel):
-    global_id: str 
-    index_id: str
-    filename: str
-    filepath: str
-
-class IndexDocumentCreate(IndexDocumentBase):
-    pass
-
-class IndexDocument(IndexDocumentBase):
-    id: int
-
-    class Config:
-        from_attributes = True
\ No newline at end of file
+from pydantic import BaseModel, Field
+
+class OrganizationBase(BaseModel):
+    name: str | None = None
+    description: str | None = None
+    contact_name: str | None = None
+    contact_phone: str | None = None
+    contact_email: str | None = None
+    contact_address: str | None = None
+    organization_id: str | None = None
+    organization_type: str | None = None
+
+class OrganizationCreate(OrganizationBase):
+    pass
+
+class Organization(OrganizationBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class UserBase(BaseModel):
+    full_name: str | None = None
+    username: str | None = None
+    password: str | None = None
+    email: str | None = None
+    organization_id: str | None = None
+    role: str | None = None
+    is_active: int | None = None
+    user_id: str | None = None
+
+class UserCreate(UserBase):
+    pass
+
+class User(UserBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class SearchIndexBase(BaseModel):
+    global_id: str | None = None
+    title: str | None = None
+    description: str | None = None
+    table_name: str | None = None
+    text_columns: str | None = None
+    id_col: str | None = None
+    org_id: str | None = None
+    source: str | None = None
+    schema_name: str | None = None
+    # column holding the last update time (or version) of the source rows; without
+    # one, syncs compare the contents of every row
+    updated_col: str | None = None
+
+class AnalyzerSettings(BaseModel):
+    # regular expression matching one token
+    token_pattern: str = r"\w+"
+    lowercase: bool = True
+    # remove accents, e.g. "café" -> "cafe"
+    fold_unicode: bool = True
+    # words to drop, or the name of a built in list ("english")
+    stopwords: list[str] | str | None = None
+    # "porter" or a Snowball language such as "english"; requires nltk
+    stemmer: str | None = None
+
+class IndexSettings(BaseModel):
+    # how documents and queries are split into terms
+    analyzer: AnalyzerSettings = AnalyzerSettings()
+    # store token character offsets to speed up snippet generation
+    store_offsets: bool = False
+    # store positional postings for phrase / proximity queries and proximity ranking
+    store_positions: bool = False
+    # maximum number of terms a wildcard query word (e.g. `inv*2024`) expands to
+    max_expansions: int = 64
+    # number of shards the documents are split into by ID hash; queries run on all
+    # shards in parallel
+    shards: int = 1
+    # compression of the document texts kept for results and snippets: None,
+    # "zlib" or "zstd" (requires the zstandard package)
+    doc_compression: str | None = "zlib"
+    # non-text columns whose values are indexed for filtering, e.g. ["status", "category"]
+    filter_columns: list[str] = []
+
+class SearchIndexCreate(SearchIndexBase):
+    settings: IndexSettings | None = None
+
+class SearchIndex(SearchIndexBase):
+    id: int
+    created_by: str | None = None
+    sync_watermark: str | None = None
+
+    class Config:
+        from_attributes = True
+
+
+class IndexDocumentBase(BaseModel):
+    global_id: str 
+    index_id: str
+    filename: str
+    filepath: str
+
+class IndexDocumentCreate(IndexDocumentBase):
+    pass
+
+class IndexDocument(IndexDocumentBase):
+    id: int
+
+    class Config:
+        from_attributes = True
+
+class SearchQuery(BaseModel):
+    query: str
+    method: str = "full_text"
+    # bounded like the query parameters of the search endpoints
+    top_k: int = Field(10, ge=1, le=1000)
+    offset: int = Field(0, ge=0)
+    fields: str | None = None
+    filter: str | None = None
+
+class BatchSearchRequest(BaseModel):
+    queries: list[SearchQuery]
+    # milliseconds the whole batch may run for, the server timeout when not set
+    timeout_ms: int | None = Field(None, ge=1)
+
+class FederatedSearchRequest(SearchQuery):
+    index_ids: list[str]
+    # milliseconds the search may run for, the server timeout when not set
+    timeout_ms: int | None = Field(None, ge=1)
+
+class DocumentUpdate(BaseModel):
+    text: str
+    # values of the filter columns of the index, by column
+    attributes: dict[str, str] | None = None
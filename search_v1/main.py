@@ -1,27 +1,39 @@
-from fastapi import FastAPI
-from routers import search_router, index_router, account_router
-
-# Define the title, description, and version of the API
-title = "Search Service API"
-description = """
-📝 This is an API for Search Service and provides endpoints for searching and indexing text data.
-"""
-version = "0.1"
-
-# Create the FastAPI app instance
-app = FastAPI(
-    title=title,
-    description=description,
-    version=version
-)
-
-
-# add routers to the app
-app.include_router(search_router.router, prefix="/api/v1/search", tags=["Search"])
-app.include_router(index_router.router, prefix="/api/v1/index", tags=["Index"])
-app.include_router(account_router.router, prefix="/api/v1/account", tags=["Account"])
-
-# # Define the root endpoint
-# @app.get("/")
-# def read_root():
-#     return {"message": "Welcome to the PxMO Search API"}
+from contextlib import asynccontextmanager
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+from routers import search_router, index_router, account_router
+from services.generations import collect_all_generations
+
+# Define the title, description, and version of the API
+title = "Search Service API"
+description = """
+📝 This is an API for Search Service and provides endpoints for searching and indexing text data.
+"""
+version = "0.1"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # remove the index generations replaced before the last shutdown
+    await run_in_threadpool(collect_all_generations)
+    yield
+
+
+# Create the FastAPI app instance
+app = FastAPI(
+    title=title,
+    description=description,
+    version=version,
+    lifespan=lifespan
+)
+
+
+# add routers to the app
+app.include_router(search_router.router, prefix="/api/v1/search", tags=["Search"])
+app.include_router(index_router.router, prefix="/api/v1/index", tags=["Index"])
+app.include_router(account_router.router, prefix="/api/v1/account", tags=["Account"])
+
+# # Define the root endpoint
+# @app.get("/")
+# def read_root():
+#     return {"message": "Welcome to the PxMO Search API"}
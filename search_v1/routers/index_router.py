@@ -1,60 +1,379 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse
-from database import schemas, models, search_crud
-from database.database import SessionLocal, engine, get_db
-from sqlalchemy.orm import Session
-from services.text_search import TextSearch
-from services.vector_search import VectorSearch
-
-router = APIRouter()
-
-@router.post("/create", summary="Create a new search index",
-            description="Create a new search index in the database.")
-def create_index_from_db(search_index: schemas.SearchIndexCreate, db: Session = Depends(get_db)):
-    """
-    Create a new search index in the database.
-    """
-    search_index = search_crud.create_search_index(db=db, search_index=search_index)
-    search_index_id = search_index.global_id
-
-    # create the index using the TextSearch class
-    text_search = TextSearch(
-        index_file=search_index_id
-    )
-
-    # get searchable columns from the search index
-    searchable_columns = search_index.text_columns.split(",")
-
-    # get the table name from the search index
-    table_name = search_index.table_name
-
-    # get the id column from the search index
-    id_column = search_index.id_col
-
-    # get the schema name from the search index
-    schema_name = search_index.schema_name
-
-    # extract data from the database and add it to the index
-    text_search.add_data(
-        db=db,
-        table_name=table_name,
-        text_columns=searchable_columns,
-        id_column=id_column,
-        schema=schema_name
-    )
-
-    # create the vector index
-    vector_search = VectorSearch(
-        file_id=search_index_id,
-    )
-    
-    vector_search.create_index(
-        data=[{id_column: row[0], "concatenated_text": row[1]} for row in text_search.data],
-        text_column="concatenated_text",
-        id_column=id_column
-    )
-
-    return {
-        "message": "Search index created successfully",
-        "id": search_index.global_id
-    }
+import logging
+import tempfile
+from contextlib import closing
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, BackgroundTasks, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse
+from database import schemas, models, search_crud, data_crud
+from database.database import SessionLocal, engine, get_db
+from sqlalchemy.orm import Session
+from services.text_search import TextSearch
+from services.vector_search import VectorSearch, get_vector_search, refresh_vector_search
+from services.analyzer import Analyzer
+from services.document_store import compressor
+from services.index_cache import index_lock, get_text_search, refresh_text_search
+from services.segments import merge_segments
+from services.shards import build_index, document_index_name, remove_index_files, index_settings
+from services.generations import current_index_name, generation_name, new_generation, swap_generation, remove_generation_files
+from services.sync import sync_index
+from services.jobs import Job, get_job_runner
+from services.snapshots import export_snapshot, import_snapshot
+
+router = APIRouter()
+
+@router.post("/create", status_code=202, summary="Create a new search index",
+            description="Create a new search index in the database and build it in the background.")
+def create_index_from_db(search_index: schemas.SearchIndexCreate, db: Session = Depends(get_db)):
+    """
+    Create a new search index in the database.
+    The text and vector indexes are built by a background job, so the request
+    returns right away with the ID of the job; its progress is reported by
+    `GET /jobs/{job_id}`.
+    """
+    settings = (search_index.settings or schemas.IndexSettings()).model_dump()
+    validate_settings(settings)
+
+    # check the source columns now, rather than fail in the background job
+    try:
+        columns = data_crud.get_table_or_view_columns(db, search_index.table_name, search_index.schema_name)
+    except Exception:
+        raise HTTPException(status_code=400, detail=f"Table not found: {search_index.table_name}")
+    required = (search_index.text_columns or "").split(",") + [search_index.id_col] + settings["filter_columns"]
+    if search_index.updated_col:
+        required.append(search_index.updated_col)
+    missing = [column for column in required if column not in columns]
+    if missing:
+        raise HTTPException(status_code=400, detail=f"Column not found: {', '.join(map(str, missing))}")
+
+    search_index = search_crud.create_search_index(db=db, search_index=search_index)
+    search_index_id = search_index.global_id
+
+    job = get_job_runner().submit(Job('build', search_index_id, on_cancel=lambda: discard_index_build(search_index_id)),
+                                  run_index_build, search_index_id, settings)
+
+    return {
+        "message": "Search index build submitted",
+        "id": search_index_id,
+        "job_id": job.id
+    }
+
+def validate_settings(settings: dict):
+    try:
+        Analyzer.from_settings(settings["analyzer"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if settings["shards"] < 1:
+        raise HTTPException(status_code=400, detail="An index needs at least one shard")
+    try:
+        compressor(settings["doc_compression"])
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def run_index_build(job: Job, search_index_id: str, settings: dict, generation: int = 0):
+    """
+    Build the text and vector indexes of a generation of a search index, as a
+    background job. A later generation is swapped in once it is complete.
+    A failed or cancelled build leaves nothing behind: the files of the generation
+    are removed, and for a new index the search index as well.
+    """
+    db = SessionLocal()
+    try:
+        search_index = search_crud.get_search_index(db=db, search_index_id=search_index_id)
+
+        # get searchable columns from the search index
+        searchable_columns = search_index.text_columns.split(",")
+
+        # get the table name from the search index
+        table_name = search_index.table_name
+
+        # get the id column from the search index
+        id_column = search_index.id_col
+
+        # get the schema name from the search index
+        schema_name = search_index.schema_name
+
+        job.total_rows = data_crud.count_rows(db, table_name, schema_name)
+
+        # read the watermark before the rows, so that rows changed during the build are
+        # picked up by the next sync
+        watermark = None
+        if search_index.updated_col:
+            watermark = data_crud.max_column_value(db, table_name, search_index.updated_col, schema_name)
+
+        # stream the rows from the database into the text and vector indexes, reading
+        # ranges of IDs concurrently
+        chunks = data_crud.stream_table_partitioned(
+            db=db,
+            table_name=table_name,
+            text_columns=searchable_columns,
+            id_column=id_column,
+            schema=schema_name,
+            extra_columns=settings["filter_columns"]
+        )
+        with closing(chunks):
+            build_index(generation_name(search_index_id, generation), settings, chunks, progress=job.advance)
+        if generation:
+            swap_generation(search_index_id, generation)
+        if watermark is not None:
+            search_crud.update_sync_watermark(db, search_index_id, watermark)
+
+    except BaseException:
+        discard_index_build(search_index_id, generation)
+        raise
+    finally:
+        db.close()
+
+def discard_index_build(search_index_id: str, generation: int = 0):
+    """
+    Remove what a failed or cancelled build leaves behind: the files of the
+    generation, and for a new index the search index as well.
+    """
+    if generation:
+        remove_generation_files(search_index_id, generation)
+        return
+    remove_index_files(search_index_id)
+    db = SessionLocal()
+    try:
+        search_crud.delete_search_index(db=db, search_index_id=search_index_id)
+    finally:
+        db.close()
+
+@router.post("/{index_id}/rebuild", status_code=202, summary="Rebuild a search index",
+            description="Rebuild a search index from its source table in the background, without interrupting searches.")
+def rebuild_index(index_id: str, settings: schemas.IndexSettings | None = None, db: Session = Depends(get_db)):
+    """
+    Rebuild a search index from its source table, with new settings or the settings
+    it was built with. The new generation is built side by side with the current
+    one, which keeps serving queries, and swapped in once it is complete, see
+    `generations.swap_generation`. Documents changed through the API while the
+    rebuild runs are not carried over.
+    """
+    get_index_or_404(db, index_id)
+    settings = (settings or schemas.IndexSettings(**index_settings(current_index_name(index_id)))).model_dump()
+    validate_settings(settings)
+
+    generation = new_generation(index_id)
+    job = get_job_runner().submit(Job('rebuild', index_id, on_cancel=lambda: discard_index_build(index_id, generation)),
+                                  run_index_build, index_id, settings, generation)
+
+    return {
+        "message": "Search index rebuild submitted",
+        "id": index_id,
+        "job_id": job.id
+    }
+
+@router.get("/{index_id}/export", summary="Export a search index snapshot",
+            description="Download a consistent, checksummed snapshot of a search index as a tar archive.")
+def export_index(index_id: str, db: Session = Depends(get_db)):
+    """
+    Export a snapshot of a search index: its text and vector indexes and its
+    metadata, streamed as a tar archive. Import it on another node with
+    `POST /import` to serve the index there without rebuilding it.
+    """
+    search_index = get_index_or_404(db, index_id)
+    metadata = {column.name: getattr(search_index, column.name)
+                for column in models.SearchIndex.__table__.columns if column.name != "id"}
+
+    return StreamingResponse(
+        export_snapshot(index_id, metadata),
+        media_type="application/x-tar",
+        headers={"Content-Disposition": f'attachment; filename="{index_id}.tar"'}
+    )
+
+def restore_index(archive, db: Session):
+    metadata = import_snapshot(archive)
+    return search_crud.restore_search_index(db=db, values=metadata)
+
+@router.post("/import", summary="Import a search index snapshot",
+            description="Import a snapshot exported with `GET /{index_id}/export`, sent as the request body.")
+async def import_index(request: Request, db: Session = Depends(get_db)):
+    """
+    Import a snapshot of a search index as a new generation of the index, creating
+    the search index if it does not exist yet. The archive is spooled to disk as
+    it arrives; the imported generation is swapped in once every checksum matches.
+    """
+    with tempfile.TemporaryFile(dir="data") as archive:
+        async for chunk in request.stream():
+            archive.write(chunk)
+        archive.seek(0)
+        try:
+            search_index = await run_in_threadpool(restore_index, archive, db)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return {
+        "message": "Search index imported successfully",
+        "id": search_index.global_id
+    }
+
+@router.get("/jobs/{job_id}", summary="Get the status of an index job",
+            description="Get the status and progress of a background index build.")
+def get_job(job_id: str):
+    """
+    Get the status of a background job: queued, running, completed, failed or
+    cancelled, the rows read, indexed and embedded so far and the estimated
+    seconds left.
+    """
+    job = get_job_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+@router.post("/jobs/{job_id}/cancel", summary="Cancel an index job",
+            description="Cancel a queued or running background index build.")
+def cancel_job(job_id: str):
+    """
+    Cancel a background job. A running build stops after its current chunk of rows.
+    """
+    job = get_job_runner().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not job.cancel():
+        raise HTTPException(status_code=409, detail=f"Job already {job.status}")
+    return {
+        "message": "Job cancellation requested",
+        "id": job_id
+    }
+
+def get_index_or_404(db: Session, index_id: str):
+    search_index = search_crud.get_search_index(db=db, search_index_id=index_id)
+    if search_index is None:
+        raise HTTPException(status_code=404, detail="Search index not found")
+    return search_index
+
+def merge_text_index(index_id: str):
+    """
+    Merge the segments of a text index until the merge policy is satisfied.
+    Runs as a background task after the writes that leave too many segments or
+    deleted documents behind.
+    """
+    with index_lock(index_id):
+        # checkpoint the journal first, so that its deletes are seen by the merge policy
+        TextSearch(index_file=index_id).save_index()
+        # and the vector journal with it, so that it does not grow without bound
+        vector_search = VectorSearch(file_id=index_id)
+        if vector_search.journal.size:
+            vector_search.save_index(vector_search.vector_index_file, vector_search.doc_file,
+                                     vector_search.embedding_file)
+        merges = 0
+        while merge_segments(index_id):
+            merges += 1
+        logging.info(f"Merged segments of index {index_id} in {merges} rounds")
+
+@router.post("/{index_id}/sync", summary="Sync a search index with its source table",
+            description="Apply the rows added, changed or deleted in the source table since the last sync.")
+def sync_index_from_db(index_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Sync a search index with its source table.
+    With an update column, only the rows updated since the watermark recorded by
+    the previous sync are read, plus the IDs of every row to find deleted rows;
+    otherwise every row is read and compared to the indexed contents by hash.
+    The watermark is only moved once the changes are saved, so a failed sync is
+    simply retried by the next one.
+    """
+    search_index = get_index_or_404(db, index_id)
+    searchable_columns = search_index.text_columns.split(",")
+    table_name = search_index.table_name
+    id_column = search_index.id_col
+    schema_name = search_index.schema_name
+    filter_columns = index_settings(current_index_name(index_id)).get("filter_columns") or []
+
+    try:
+        if search_index.updated_col:
+            watermark = data_crud.max_column_value(db, table_name, search_index.updated_col, schema_name)
+            chunks = data_crud.stream_table_with_columns(
+                db=db,
+                table_name=table_name,
+                text_columns=searchable_columns,
+                id_column=id_column,
+                schema=schema_name,
+                updated_range=(search_index.updated_col, search_index.sync_watermark, watermark),
+                extra_columns=filter_columns
+            )
+            # the IDs are read once the changed rows are applied, to find the deleted rows
+            source_ids = data_crud.stream_table_ids(db, table_name, id_column, schema_name)
+            changes = sync_index(index_id, chunks, source_ids)
+            if watermark is not None:
+                search_crud.update_sync_watermark(db, index_id, watermark)
+        else:
+            chunks = data_crud.stream_table_partitioned(
+                db=db,
+                table_name=table_name,
+                text_columns=searchable_columns,
+                id_column=id_column,
+                schema=schema_name,
+                extra_columns=filter_columns
+            )
+            changes = sync_index(index_id, chunks)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    for index_name in changes['merge']:
+        background_tasks.add_task(merge_text_index, index_name)
+
+    return {
+        "message": "Search index synced successfully",
+        "id": index_id,
+        "upserted": changes['upserted'],
+        "deleted": changes['deleted']
+    }
+
+@router.put("/{index_id}/documents/{doc_id}", summary="Add or update a document",
+            description="Index a new version of a document in the text and vector indexes.")
+def update_document(index_id: str, doc_id: str, document: schemas.DocumentUpdate,
+                    background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Add or update a document in the text and vector indexes.
+    The new version is appended to the text index journal; the previous version is
+    tombstoned and removed from the posting lists by a background segment merge.
+    The document is embedded again and its new vector appended to the vector index
+    journal. The cached indexes are changed in place, so only the change is written.
+    """
+    get_index_or_404(db, index_id)
+    # a document of a sharded index is only stored in its shard
+    index_name = document_index_name(index_id, doc_id)
+    with index_lock(index_name):
+        text_search = get_text_search(index_name)
+        doc_id = text_search.resolve_doc_id(doc_id)
+        updated = text_search.update_document(doc_id, document.text, document.attributes)
+        refresh_text_search(index_name)
+        if text_search.needs_merge():
+            background_tasks.add_task(merge_text_index, index_name)
+
+        # the ordinal of the new version is where filters find its attributes
+        vector_search = get_vector_search(index_name)
+        vector_search.update_document(doc_id, document.text, text_search.ordinals[doc_id])
+        refresh_vector_search(index_name)
+
+    return {
+        "message": "Document updated successfully" if updated else "Document added successfully",
+        "id": doc_id
+    }
+
+@router.delete("/{index_id}/documents/{doc_id}", summary="Delete a document",
+            description="Delete a document from the text and vector indexes.")
+def delete_document(index_id: str, doc_id: str, background_tasks: BackgroundTasks, db: Session = Depends(get_db)):
+    """
+    Delete a document from the text and vector indexes.
+    The document is filtered out of text search results right away and removed
+    from the posting lists by a background segment merge; its vector is removed.
+    """
+    get_index_or_404(db, index_id)
+    index_name = document_index_name(index_id, doc_id)
+    with index_lock(index_name):
+        text_search = get_text_search(index_name)
+        doc_id = text_search.resolve_doc_id(doc_id)
+        if not text_search.delete_document(doc_id):
+            raise HTTPException(status_code=404, detail="Document not found")
+        refresh_text_search(index_name)
+        if text_search.needs_merge():
+            background_tasks.add_task(merge_text_index, index_name)
+
+        vector_search = get_vector_search(index_name)
+        vector_search.delete_document(doc_id)
+        refresh_vector_search(index_name)
+
+    return {
+        "message": "Document deleted successfully",
+        "id": doc_id
+    }
@@ -1,134 +1,327 @@
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
-from fastapi.responses import FileResponse
-from database import schemas, models, search_crud
-from database.database import SessionLocal, engine, get_db
-from sqlalchemy.orm import Session
-from services.text_search import TextSearch
-from services.vector_search import VectorSearch
-
-models.Base.metadata.create_all(bind=engine)
-
-router = APIRouter()
-
-IDX_SRC = "data/7a9a67d9-9062-47a1-a8d1-d72ba2913523_text.pkl"
-
-@router.get("/{index_id}/ranked_naive", summary="Ranked Search using TF-IDF",
-            description="Search for documents based on the query and search type.")
-async def ranked_search(query: str, index_id: str):
-    try:
-        selected_documents = TextSearch(
-            index_file=index_id
-        ).ranked_search(query)
-
-        return {
-            "results": selected_documents
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-@router.get("/{index_id}/full_text", summary="Ranked Search using BM25",
-            description="Search for documents based on the query and search type.")
-async def ranked_search_bm25(query: str, index_id: str):
-    try:
-        selected_documents = TextSearch(
-            index_file=index_id
-        ).bm25_search(query)
-
-        return {
-            "results": selected_documents
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-@router.get("/{index_id}/boolean_ranked", summary="Ranked Search with Boolean Search First",
-            description="Perform a ranked search (TF-IDF) on documents after performing a boolean search.")
-async def boolean_ranked_search(query: str, index_id: str):
-    try:
-        selected_documents = TextSearch(
-            index_file=index_id
-        ).boolean_ranked_search(query)
-
-        return {
-            "results": selected_documents
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-@router.get("/{index_id}/exact", summary="Exact Search with strict boolean search",
-            description="Search for documents based on keywords.")
-async def keyword_search(query: str, index_id: str):
-    """
-    Search for documents based on keywords.
-
-    - **keywords**: A list of keywords to search for.
-    """
-    try:
-        selected_documents = TextSearch(
-            index_file=index_id
-        ).boolean_search(query)
-
-        return {
-            "results": selected_documents
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-
-@router.get("/{index_id}/fuzzy", summary="Fuzzy Search",
-            description="Perform a fuzzy search on documents.")
-async def fuzzy_search(query: str, index_id: str):
-    """
-    Perform a fuzzy search on documents.
-
-    - **query**: The fuzzy search query string.
-    """
-    try:
-        selected_documents = TextSearch(
-            index_file=index_id
-        ).fuzzy_search(query)
-
-        return {
-            "results": selected_documents
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-@router.get("/{index_id}/similarity", summary="Similarity Search",
-            description="Perform a similarity search on documents.")
-async def similarity_search(query: str, index_id: str):
-    """
-    Perform a similarity search on documents.
-
-    - **query**: The similarity search query string.
-    """
-    try:
-        # Perform similarity search using the VectorSearch class
-        vSearch = VectorSearch(
-            file_id=index_id
-        )
-        
-        selected_documents = vSearch.similarity_search_lite(query)
-
-        return {
-            "results": selected_documents
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
-    
-@router.get("/{index_id}/exact_similarity", summary="Exact Similarity Search",
-            description="Perform an exact similarity search on documents.")
-async def exact_similarity_search(query: str, index_id: str):
-    """
-    Perform an exact similarity search on documents.
-
-    - **query**: The exact similarity search query string.
-    """
-    try:
-        # Perform exact similarity search using the VectorSearch class
-        selected_documents = VectorSearch(file_id=index_id).boolean_semantic_search(query)
-
-        return {
-            "results": selected_documents
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
\ No newline at end of file
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, Query
+from fastapi.responses import FileResponse, ORJSONResponse, StreamingResponse
+from database import schemas, models, search_crud
+from database.database import SessionLocal, engine, get_db
+from sqlalchemy.orm import Session
+import orjson
+from services.text_search import TextSearch
+from services.vector_search import VectorSearch
+from services.shards import open_text_index, open_vector_index
+from services.federation import open_federated_index
+from services.deadlines import request_deadline, expired
+from services.search_results import parse_fields
+from services.query_parser import QueryParseError
+
+models.Base.metadata.create_all(bind=engine)
+models.add_missing_columns(engine)
+
+# search responses can be large, so serialize them with orjson
+router = APIRouter(default_response_class=ORJSONResponse)
+
+IDX_SRC = "data/7a9a67d9-9062-47a1-a8d1-d72ba2913523_text.pkl"
+
+def get_page(
+    top_k: int = Query(10, ge=1, le=1000, description="The number of results to return."),
+    offset: int = Query(0, ge=0, description="The number of results to skip."),
+    fields: str | None = Query(None, description="Comma separated result fields to return, e.g. `id,score,snippets`."),
+    filter: str | None = Query(None, description="Only return documents matching a filter on the filter columns of the index, "
+                                                 "e.g. `status:open (category:books OR category:music) -org:42`."),
+    timeout_ms: int | None = Query(None, ge=1, description="The milliseconds the search may run for, after which the best "
+                                                           "results found so far are returned with `partial` set; "
+                                                           "streams end with a `partial` line instead. "
+                                                           "Defaults to the server timeout.")
+):
+    """
+    Pagination, field projection, filter and deadline parameters shared by the search endpoints.
+    """
+    try:
+        return {"top_k": top_k, "offset": offset, "fields": parse_fields(fields), "filters": filter,
+                "deadline": request_deadline(timeout_ms)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def ndjson_response(results, deadline=None):
+    """
+    Stream search results as newline delimited JSON, one result per line.
+    Results are serialized as they are produced, so memory use and the time to the
+    first byte do not depend on the number of results. The stream stops at the
+    deadline of the request, with a last `{"partial": true}` line.
+    """
+    return StreamingResponse(ndjson_lines(results, deadline), media_type="application/x-ndjson")
+
+def ndjson_lines(results, deadline):
+    for result in results:
+        if expired(deadline):
+            yield orjson.dumps({"partial": True}) + b"\n"
+            return
+        yield orjson.dumps(result) + b"\n"
+
+STREAM_QUERY = Query(False, description="Stream every result as NDJSON instead of returning one page.")
+
+FACETS_QUERY = Query(None, description="Comma separated filter columns whose values are counted over every match, "
+                                       "e.g. `category,status`.")
+
+def search_response(index, query, method, page, facets):
+    """
+    Run a query for one page of results, along with the number of matches with
+    each value of the requested facet columns when there are any. `partial` tells
+    whether the search ran out of time, see `deadlines.Deadline`.
+    """
+    deadline = page["deadline"]
+    response = {"results": index.search(query, method, **page),
+                "partial": deadline is not None and deadline.reached}
+    if facets:
+        columns = [column.strip() for column in facets.split(",") if column.strip()]
+        response["facets"] = index.facet_counts(query, method, columns, filters=page["filters"])
+    return response
+
+@router.get("/{index_id}/ranked_naive", summary="Ranked Search using TF-IDF",
+            description="Search for documents based on the query and search type.")
+def ranked_search(query: str, index_id: str, page: dict = Depends(get_page), stream: bool = STREAM_QUERY,
+                        facets: str | None = FACETS_QUERY):
+    try:
+        text_search = open_text_index(index_id)
+        if stream:
+            return ndjson_response(text_search.iter_search(query, "ranked_naive", fields=page["fields"], filters=page["filters"]), page["deadline"])
+
+        return search_response(text_search, query, "ranked_naive", page, facets)
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.get("/{index_id}/full_text", summary="Ranked Search using BM25",
+            description="Search for documents based on the query and search type.")
+def ranked_search_bm25(query: str, index_id: str, page: dict = Depends(get_page), stream: bool = STREAM_QUERY,
+                             facets: str | None = FACETS_QUERY):
+    try:
+        text_search = open_text_index(index_id)
+        if stream:
+            return ndjson_response(text_search.iter_search(query, "full_text", fields=page["fields"], filters=page["filters"]), page["deadline"])
+
+        return search_response(text_search, query, "full_text", page, facets)
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.get("/{index_id}/boolean_ranked", summary="Ranked Search with Boolean Search First",
+            description="Perform a ranked search (TF-IDF) on documents after performing a boolean search.")
+def boolean_ranked_search(query: str, index_id: str, page: dict = Depends(get_page), stream: bool = STREAM_QUERY,
+                                facets: str | None = FACETS_QUERY):
+    try:
+        text_search = open_text_index(index_id)
+        if stream:
+            return ndjson_response(text_search.iter_search(query, "boolean_ranked", fields=page["fields"], filters=page["filters"]), page["deadline"])
+
+        return search_response(text_search, query, "boolean_ranked", page, facets)
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.get("/{index_id}/exact", summary="Exact Search with strict boolean search",
+            description="Search for documents based on keywords.")
+def keyword_search(query: str, index_id: str, page: dict = Depends(get_page), stream: bool = STREAM_QUERY,
+                         facets: str | None = FACETS_QUERY):
+    """
+    Search for documents based on keywords.
+
+    - **query**: A boolean query. Words are combined with AND unless joined by `OR`,
+      `NOT` (or a leading `-`) excludes words, parentheses group clauses and quoted
+      phrases must match exactly, e.g. `invoice (2023 OR 2024) -draft "purchase order"`.
+      `"purchase order"~3` matches the words within 3 other words of each other.
+      `*` matches any characters within a word, e.g. `inv*2024` or `*X42*`.
+    """
+    try:
+        text_search = open_text_index(index_id)
+        if stream:
+            return ndjson_response(text_search.iter_search(query, "exact", fields=page["fields"], filters=page["filters"]), page["deadline"])
+
+        return search_response(text_search, query, "exact", page, facets)
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+
+@router.get("/{index_id}/fuzzy", summary="Fuzzy Search",
+            description="Perform a fuzzy search on documents.")
+def fuzzy_search(query: str, index_id: str, page: dict = Depends(get_page), stream: bool = STREAM_QUERY,
+                       facets: str | None = FACETS_QUERY):
+    """
+    Perform a fuzzy search on documents.
+
+    - **query**: The fuzzy search query string.
+    """
+    try:
+        text_search = open_text_index(index_id)
+        if stream:
+            return ndjson_response(text_search.iter_search(query, "fuzzy", fields=page["fields"], filters=page["filters"]), page["deadline"])
+
+        return search_response(text_search, query, "fuzzy", page, facets)
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.get("/{index_id}/autocomplete", summary="Autocomplete",
+            description="Suggest completions for a partially typed query.")
+def autocomplete(prefix: str, index_id: str,
+                       top_n: int = Query(10, ge=1, le=100, description="The number of completions to return.")):
+    """
+    Suggest completions for a partially typed query.
+
+    - **prefix**: The text typed so far; its last word is completed with the indexed
+      terms starting with it, most frequent first.
+    """
+    try:
+        text_search = open_text_index(index_id, cached=True)
+
+        return {
+            "results": text_search.autocomplete(prefix, top_n=top_n)
+        }
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/{index_id}/similarity", summary="Similarity Search",
+            description="Perform a similarity search on documents.")
+def similarity_search(query: str, index_id: str, page: dict = Depends(get_page), stream: bool = STREAM_QUERY,
+                            facets: str | None = FACETS_QUERY):
+    """
+    Perform a similarity search on documents.
+
+    - **query**: The similarity search query string.
+    """
+    try:
+        # Perform similarity search using the VectorSearch class
+        vSearch = open_vector_index(index_id)
+        
+        if stream:
+            return ndjson_response(vSearch.iter_search(query, "similarity", fields=page["fields"], filters=page["filters"]), page["deadline"])
+
+        return search_response(vSearch, query, "similarity", page, facets)
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+@router.get("/{index_id}/exact_similarity", summary="Exact Similarity Search",
+            description="Perform an exact similarity search on documents.")
+def exact_similarity_search(query: str, index_id: str, page: dict = Depends(get_page), stream: bool = STREAM_QUERY,
+                                  facets: str | None = FACETS_QUERY):
+    """
+    Perform an exact similarity search on documents.
+
+    - **query**: The exact similarity search query string.
+    """
+    try:
+        # Perform exact similarity search using the VectorSearch class
+        vSearch = open_vector_index(index_id)
+        if stream:
+            return ndjson_response(vSearch.iter_search(query, "exact_similarity", fields=page["fields"], filters=page["filters"]), page["deadline"])
+
+        return search_response(vSearch, query, "exact_similarity", page, facets)
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/{index_id}/batch", summary="Batch Search",
+            description="Evaluate many queries against an index in one call.")
+def batch_search(batch: schemas.BatchSearchRequest, index_id: str):
+    """
+    Evaluate many queries against an index in one call.
+
+    - **queries**: The queries to run, each with its own `query`, `method`, `top_k`,
+      `offset`, `fields` and `filter`. Supported methods are the text search methods
+      (`ranked_naive`, `full_text`, `boolean_ranked`, `boolean_bm25`, `exact`, `fuzzy`)
+      and the vector search methods (`similarity`, `exact_similarity`).
+    - **timeout_ms**: The milliseconds the whole batch may run for, see the single
+      index search endpoints.
+
+    Results are returned in request order. Each query result has `partial` set when
+    the batch ran out of time before the query was complete.
+    """
+    queries = [q.model_dump() for q in batch.queries]
+    for q in queries:
+        if q["method"] not in TextSearch.SEARCH_METHODS and q["method"] not in VectorSearch.SEARCH_METHODS:
+            raise HTTPException(status_code=400, detail=f"Unknown search method: {q['method']}")
+        try:
+            q["fields"] = parse_fields(q["fields"])
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    deadline = request_deadline(batch.timeout_ms)
+    for q in queries:
+        # every query runs until the deadline of the batch, and is flagged partial on its own
+        q["deadline"] = deadline and deadline.share()
+
+    try:
+        results = [None] * len(queries)
+
+        # text queries share a single index load and IDF lookups
+        text_positions = [i for i, q in enumerate(queries) if q["method"] in TextSearch.SEARCH_METHODS]
+        if text_positions:
+            text_results = open_text_index(index_id).search_batch([queries[i] for i in text_positions])
+            for i, result in zip(text_positions, text_results):
+                results[i] = result
+
+        # vector queries share a single model load, one encode and one FAISS search
+        vector_positions = [i for i, q in enumerate(queries) if q["method"] in VectorSearch.SEARCH_METHODS]
+        if vector_positions:
+            vector_results = open_vector_index(index_id).search_batch([queries[i] for i in vector_positions])
+            for i, result in zip(vector_positions, vector_results):
+                results[i] = result
+
+        return {
+            "results": [
+                {"query": q["query"], "method": q["method"], "results": result,
+                 "partial": q["deadline"] is not None and q["deadline"].reached}
+                for q, result in zip(queries, results)
+            ]
+        }
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/federated", summary="Federated Search",
+            description="Run one query against several search indexes and merge the results.")
+def federated_search(search: schemas.FederatedSearchRequest, db: Session = Depends(get_db)):
+    """
+    Run one query against several search indexes and merge the results into one page.
+
+    - **index_ids**: The IDs of the search indexes to search.
+    - **query**, **method**, **top_k**, **offset**, **fields**, **filter**: As for a
+      single index, see the batch search.
+    - **timeout_ms**: The milliseconds the search may run for, see the single index
+      search endpoints.
+
+    Ranked text methods score every index with the statistics of all of them, and
+    vector methods compare cosine similarities of the same model, so scores are
+    comparable across indexes. Each result carries the `index_id` it comes from.
+    """
+    if not search.index_ids:
+        raise HTTPException(status_code=400, detail="No search index to search")
+    missing = [index_id for index_id in search.index_ids
+               if search_crud.get_search_index(db=db, search_index_id=index_id) is None]
+    if missing:
+        raise HTTPException(status_code=404, detail=f"Search index not found: {', '.join(missing)}")
+    try:
+        fields = parse_fields(search.fields)
+        index = open_federated_index(search.index_ids, search.method)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    deadline = request_deadline(search.timeout_ms)
+    try:
+        return {
+            "results": index.search(search.query, search.method, top_k=search.top_k, offset=search.offset,
+                                    fields=fields, filters=search.filter, deadline=deadline),
+            "partial": deadline is not None and deadline.reached
+        }
+    except QueryParseError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {e}")
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -0,0 +1,176 @@
+import re
+import unicodedata
+from functools import lru_cache
+
+from services.term_dictionary import is_wildcard
+
+# Tokenizer of new indexes: runs of letters, digits and underscores
+DEFAULT_TOKEN_PATTERN = r"\w+"
+
+# Tokenizer of indexes created before analyzers were configurable: whitespace
+# separated words, the same tokens `str.split` produces
+WHITESPACE_TOKEN_PATTERN = r"\S+"
+
+# Query words containing a wildcard are kept whole, see `Analyzer.analyze_query`
+WILDCARD_TOKEN_PATTERN = r"\S*\*\S*"
+
+# Number of analyzed queries, folded tokens and stems kept in memory per analyzer
+QUERY_CACHE_SIZE = 4096
+TOKEN_CACHE_SIZE = 65536
+
+ENGLISH_STOPWORDS = frozenset("""
+a an and are as at be but by for from has have he in is it its of on or she that
+the their then there these they this to was were will with
+""".split())
+
+STOPWORD_LISTS = {
+    'english': ENGLISH_STOPWORDS,
+}
+
+
+def fold(token):
+    """
+    Remove the accents of a token, e.g. 'Café' -> 'Cafe'.
+    """
+    decomposed = unicodedata.normalize('NFKD', token)
+    return ''.join(char for char in decomposed if not unicodedata.combining(char))
+
+
+def load_stemmer(name):
+    """
+    Get the stem function of a stemmer. Stemming uses the optional nltk package.
+
+    :param name: 'porter', or a language supported by the nltk Snowball stemmer, e.g. 'english'.
+    :return: A callable stemming a single token.
+    :raises ValueError: If nltk is not installed or the stemmer is unknown.
+    """
+    try:
+        from nltk.stem import PorterStemmer, SnowballStemmer
+    except ImportError:
+        raise ValueError("Stemming requires the nltk package")
+
+    if name == 'porter':
+        return PorterStemmer().stem
+    if name not in SnowballStemmer.languages:
+        raise ValueError(f"Unknown stemmer: {name}")
+    return SnowballStemmer(name).stem
+
+
+class Analyzer:
+    """
+    Turns text into the terms stored in and looked up from the inverted index.
+
+    Tokens are matched with a compiled regular expression, then lower cased, folded
+    to ASCII, filtered against a stopword list and stemmed, each step being
+    optional. The same analyzer must be used to build and to query an index, so
+    it is configured per index (see `from_settings`).
+
+    :param token_pattern: The regular expression matching one token.
+    :param lowercase: Whether to lower case tokens.
+    :param fold_unicode: Whether to remove accents from tokens.
+    :param stopwords: A list of words to drop, the name of a built in list (see
+        `STOPWORD_LISTS`) or None.
+    :param stemmer: The name of a stemmer (see `load_stemmer`) or None.
+    :raises ValueError: If the token pattern, stopword list or stemmer is invalid.
+    """
+
+    def __init__(self, token_pattern=DEFAULT_TOKEN_PATTERN, lowercase=True, fold_unicode=True,
+                 stopwords=None, stemmer=None):
+        try:
+            self.token_pattern = re.compile(token_pattern)
+            self.query_pattern = re.compile(f"{WILDCARD_TOKEN_PATTERN}|{token_pattern}")
+        except re.error as e:
+            raise ValueError(f"Invalid token pattern: {e}")
+        self.lowercase = lowercase
+        self.fold_unicode = fold_unicode
+
+        if isinstance(stopwords, str):
+            if stopwords not in STOPWORD_LISTS:
+                raise ValueError(f"Unknown stopword list: {stopwords}")
+            stopwords = STOPWORD_LISTS[stopwords]
+        self.stopwords = frozenset(self.normalize(word) for word in stopwords or ())
+
+        self.stem = lru_cache(maxsize=TOKEN_CACHE_SIZE)(load_stemmer(stemmer)) if stemmer else None
+        self.fold = lru_cache(maxsize=TOKEN_CACHE_SIZE)(fold)
+        self.analyze_query = lru_cache(maxsize=QUERY_CACHE_SIZE)(self._analyze_query)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """
+        Create the analyzer of an index from its `analyzer` setting.
+        Indexes without the setting predate configurable analyzers and keep
+        splitting on whitespace.
+        """
+        if settings is None:
+            return cls(WHITESPACE_TOKEN_PATTERN, lowercase=False, fold_unicode=False)
+        return cls(**settings)
+
+    def normalize(self, token):
+        """
+        Lower case and fold a token, as configured.
+        """
+        if self.lowercase:
+            token = token.lower()
+        if self.fold_unicode and not token.isascii():
+            token = self.fold(token)
+        return token
+
+    def analyze_token(self, token):
+        """
+        Get the term of a single token.
+
+        :return: The term, or None for a stopword.
+        """
+        term = self.normalize(token)
+        if term in self.stopwords:
+            return None
+        return self.stem(term) if self.stem else term
+
+    def tokens(self, text):
+        """
+        Analyze a text.
+        Positions count every token, so dropped stopwords leave gaps and phrases
+        still only match words that are next to each other.
+
+        :param text: The text to analyze.
+        :return: A generator of (position, term, start, end) tuples, start and end
+            being the character offsets of the token in the text.
+        """
+        pattern = self.token_pattern
+        if not (self.stopwords or self.stem) and (not self.fold_unicode or text.isascii()):
+            # fast path: no per token work besides lower casing, done on the whole text
+            lowered = text.lower() if self.lowercase else text
+            # lower casing may change the length of some characters, in which case
+            # offsets into the lower cased text would be wrong
+            if len(lowered) == len(text):
+                for position, match in enumerate(pattern.finditer(text)):
+                    start, end = match.span()
+                    yield position, lowered[start:end], start, end
+                return
+
+        for position, match in enumerate(pattern.finditer(text)):
+            term = self.analyze_token(match.group())
+            if term is not None:
+                yield position, term, match.start(), match.end()
+
+    def terms(self, text):
+        """
+        Get the terms of a text, in order.
+        """
+        return [term for _, term, _, _ in self.tokens(text)]
+
+    def _analyze_query(self, text):
+        """
+        Analyze query text. Words containing a wildcard are normalized but not split,
+        so the pattern can be expanded against the analyzed terms of the index.
+        Results are cached, see `analyze_query`.
+
+        :return: A tuple of (position, term) pairs.
+        """
+        analyzed = []
+        for position, match in enumerate(self.query_pattern.finditer(text)):
+            token = match.group()
+            term = self.normalize(token) if is_wildcard(token) else self.analyze_token(token)
+            if term is not None:
+                analyzed.append((position, term))
+        return tuple(analyzed)
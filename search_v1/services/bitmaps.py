@@ -0,0 +1,187 @@
+from array import array
+
+import numpy as np
+
+# Ordinals are split into containers of 2**16 values, keyed by their high bits
+CONTAINER_BITS = 16
+CONTAINER_SIZE = 1 << CONTAINER_BITS
+LOW_MASK = CONTAINER_SIZE - 1
+
+# Containers holding up to this many values are sorted arrays of the low bits of
+# their values (uint16), fuller ones are bitsets of 2**16 bits (uint8)
+ARRAY_MAX = 4096
+
+
+def to_values(container):
+    """
+    Get the sorted low bits of the values of a container.
+    """
+    if container.dtype == np.uint16:
+        return container
+    return np.flatnonzero(np.unpackbits(container, bitorder='little')).astype(np.uint16)
+
+
+def to_bitset(container):
+    if container.dtype == np.uint8:
+        return container
+    bits = np.zeros(CONTAINER_SIZE, dtype=bool)
+    bits[container] = True
+    return np.packbits(bits, bitorder='little')
+
+
+def cardinality(container):
+    if container.dtype == np.uint16:
+        return len(container)
+    return int(np.unpackbits(container).sum())
+
+
+def normalize(container):
+    """
+    Store a container in its compact form, see `ARRAY_MAX`. Returns None if empty.
+    """
+    count = cardinality(container)
+    if not count:
+        return None
+    if count <= ARRAY_MAX:
+        return to_values(container)
+    return to_bitset(container)
+
+
+def contains(container, lows):
+    """
+    Check which of the low bits in `lows` are values of a container.
+    """
+    if container.dtype == np.uint8:
+        return ((container[lows >> 3] >> (lows & 7).astype(np.uint8)) & 1).astype(bool)
+    found = np.searchsorted(container, lows)
+    found[found == len(container)] = 0
+    return container[found] == lows
+
+
+class Bitmap:
+    """
+    A compressed bitmap of document ordinals, laid out like a roaring bitmap:
+    ordinals are grouped by their high bits into containers of 2**16 values, each
+    a sorted array when sparse or a bitset when dense (see `ARRAY_MAX`), so a
+    bitmap never takes much more than 2 bytes per value, nor more than a bit per
+    possible value. Bitmaps are combined container by container and checked
+    against posting lists with vectorized lookups.
+
+    :param containers: A dict of containers by high bits, see `normalize`.
+    """
+    __slots__ = ('containers',)
+
+    def __init__(self, containers=None):
+        self.containers = containers or {}
+
+    @classmethod
+    def from_sorted(cls, ordinals):
+        """
+        Build a bitmap from sorted, distinct ordinals.
+        """
+        ordinals = np.asarray(ordinals, dtype=np.uint32)
+        if not len(ordinals):
+            return cls()
+        keys, starts = np.unique(ordinals >> CONTAINER_BITS, return_index=True)
+        ends = np.append(starts[1:], len(ordinals))
+        return cls({
+            key: normalize((ordinals[start:end] & LOW_MASK).astype(np.uint16))
+            for key, start, end in zip(keys.tolist(), starts.tolist(), ends.tolist())
+        })
+
+    def __len__(self):
+        return sum(cardinality(container) for container in self.containers.values())
+
+    def __bool__(self):
+        return bool(self.containers)
+
+    def __contains__(self, ordinal):
+        container = self.containers.get(ordinal >> CONTAINER_BITS)
+        return container is not None and bool(contains(container, np.array([ordinal & LOW_MASK], dtype=np.uint16))[0])
+
+    def __eq__(self, other):
+        return isinstance(other, Bitmap) and np.array_equal(self.to_numpy(), other.to_numpy())
+
+    def __and__(self, other):
+        containers = {}
+        for key in self.containers.keys() & other.containers.keys():
+            a, b = self.containers[key], other.containers[key]
+            if a.dtype == np.uint8 and b.dtype == np.uint8:
+                container = normalize(a & b)
+            else:
+                if a.dtype == np.uint8:
+                    a, b = b, a
+                container = normalize(a[contains(b, a)])
+            if container is not None:
+                containers[key] = container
+        return Bitmap(containers)
+
+    def __or__(self, other):
+        containers = dict(self.containers)
+        for key, b in other.containers.items():
+            a = containers.get(key)
+            if a is None:
+                containers[key] = b
+            elif a.dtype == np.uint16 and b.dtype == np.uint16:
+                containers[key] = normalize(np.union1d(a, b))
+            else:
+                containers[key] = to_bitset(a) | to_bitset(b)
+        return Bitmap(containers)
+
+    def __sub__(self, other):
+        containers = {}
+        for key, a in self.containers.items():
+            b = other.containers.get(key)
+            if b is None:
+                containers[key] = a
+                continue
+            if a.dtype == np.uint8:
+                container = normalize(a & ~to_bitset(b))
+            else:
+                container = normalize(a[~contains(b, a)])
+            if container is not None:
+                containers[key] = container
+        return Bitmap(containers)
+
+    def to_numpy(self):
+        """
+        Get the ordinals of the bitmap as a sorted numpy array.
+        """
+        if not self.containers:
+            return np.zeros(0, dtype=np.uint32)
+        return np.concatenate([
+            (np.uint32(key) << CONTAINER_BITS) | to_values(self.containers[key]).astype(np.uint32)
+            for key in sorted(self.containers)
+        ])
+
+    def to_array(self):
+        """
+        Get the ordinals of the bitmap as a sorted posting list.
+        """
+        return array('I', self.to_numpy().tobytes())
+
+    def mask(self, ordinals):
+        """
+        Check which ordinals are in the bitmap.
+
+        :param ordinals: A sequence or array of ordinals, in any order; negative
+            values are never in the bitmap.
+        :return: A numpy array of booleans.
+        """
+        ordinals = np.asarray(ordinals, dtype=np.int64)
+        found = np.zeros(len(ordinals), dtype=bool)
+        keys = ordinals >> CONTAINER_BITS
+        for key, container in self.containers.items():
+            selected = np.flatnonzero(keys == key)
+            if len(selected):
+                found[selected] = contains(container, (ordinals[selected] & LOW_MASK).astype(np.uint16))
+        return found
+
+    def select(self, postings):
+        """
+        Intersect a sorted posting list with the bitmap.
+
+        :return: A sorted array of the ordinals of `postings` in the bitmap.
+        """
+        postings = np.frombuffer(postings, dtype=np.uint32) if isinstance(postings, array) else np.asarray(postings, dtype=np.uint32)
+        return array('I', postings[self.mask(postings)].tobytes())
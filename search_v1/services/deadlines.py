@@ -0,0 +1,73 @@
+import os
+import time
+
+# Milliseconds a search request may run for when it does not set a timeout;
+# 0 lets requests run to completion
+SEARCH_TIMEOUT_MS = int(os.getenv("SEARCH_TIMEOUT_MS", 10000))
+
+# Number of items a loop goes through between two looks at the clock, see `bounded`
+CHECK_INTERVAL = 1024
+
+
+class Deadline:
+    """
+    The time by which a search request should be answered.
+    Deadlines are cooperative: scoring and candidate loops check them (see
+    `bounded`) and stop early, and the search returns the best results found by
+    then. Once passed, a deadline stays `reached`, so the response can be flagged
+    as partial. Deadlines use the monotonic clock, which the processes of a
+    machine share, so they can be sent to the worker processes along with a query.
+
+    :param timeout_ms: The milliseconds from now the request may run for.
+    """
+
+    def __init__(self, timeout_ms):
+        self.expires_at = time.monotonic() + timeout_ms / 1000
+        self.reached = False
+
+    def expired(self):
+        if not self.reached and time.monotonic() >= self.expires_at:
+            self.reached = True
+        return self.reached
+
+    def share(self):
+        """
+        Get a deadline expiring at the same time which is reached on its own, e.g.
+        for each query of a batch, so that each query can be flagged as partial.
+        """
+        deadline = Deadline(0)
+        deadline.expires_at = self.expires_at
+        return deadline
+
+
+def request_deadline(timeout_ms=None):
+    """
+    Get the deadline of a search request: `timeout_ms` from now, or the server
+    default `SEARCH_TIMEOUT_MS`. Returns None when there is no time limit.
+    """
+    timeout_ms = timeout_ms or SEARCH_TIMEOUT_MS
+    return Deadline(timeout_ms) if timeout_ms > 0 else None
+
+
+def expired(deadline):
+    """
+    Check whether a deadline, or None for no deadline, has passed.
+    """
+    return deadline is not None and deadline.expired()
+
+
+def bounded(items, deadline, interval=CHECK_INTERVAL):
+    """
+    Go through items until a deadline passes, looking at the clock every
+    `interval` items. Without a deadline the items are returned as they are.
+    """
+    if deadline is None:
+        return items
+    return iter_bounded(items, deadline, interval)
+
+
+def iter_bounded(items, deadline, interval):
+    for i, item in enumerate(items):
+        if i % interval == 0 and deadline.expired():
+            return
+        yield item
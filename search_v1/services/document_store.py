@@ -1,127 +1,285 @@
-import os
-from PyPDF2 import PdfReader
-import logging
-
-class DocumentStore:
-    def __init__(self):
-        self.documents = {}
-
-    def add_document(self, doc_id, document):
-        """
-        Add a document to the store.
-        
-        :param doc_id: Unique identifier for the document.
-        :param document: The document content.
-        """
-        self.documents[doc_id] = document
-        print(f"Document with ID {doc_id} added to the store.")
-
-    def get_document(self, doc_id):
-        """
-        Retrieve a document from the store.
-        
-        :param doc_id: Unique identifier for the document.
-        :return: The document content or None if not found.
-        """
-        return self.documents.get(doc_id, None)
-    
-    def delete_document(self, doc_id):
-        """
-        Delete a document from the store.
-        
-        :param doc_id: Unique identifier for the document.
-        """
-        if doc_id in self.documents:
-            del self.documents[doc_id]
-            print(f"Document with ID {doc_id} deleted from the store.")
-        else:
-            print(f"Document with ID {doc_id} not found in the store.")
-
-    def list_documents(self):
-        """
-        List all documents in the store.
-        
-        :return: A list of document IDs.
-        """
-        return list(self.documents.keys())
-    
-    def clear_store(self):
-        """
-        Clear all documents from the store.
-        """
-        self.documents.clear()
-        logging.info("All documents have been cleared from the store.")
-
-    
-    def load_documents_from_directory(self, directory_path):
-        """
-        Load documents from a specified directory into the store.
-        
-        :param directory_path: Path to the directory containing documents.
-        """
-        if not os.path.isdir(directory_path):
-            print(f"Error: {directory_path} is not a valid directory. Please provide a valid directory path, e.g., '/path/to/documents' or 'C:\\Users\\User\\Documents'.")
-            return
-        
-        for filename in os.listdir(directory_path):
-            if filename.startswith('.'):
-                continue
-            file_path = os.path.join(directory_path, filename)
-            if os.path.isfile(file_path):
-                try:
-                    with open(file_path, 'r', encoding='utf-8') as file:
-                        content = file.read()
-                        self.add_document(filename, content)
-                except Exception as e:
-                    logging.info(f"Error reading {filename}: {type(e).__name__} - {e}")
-        logging.info(f"All documents from {directory_path} have been loaded into the store.")
-
-    def load_pdf_documents_from_directory(self, directory_path):
-        """
-        Load PDF documents from a specified directory into the store.
-        
-        :param directory_path: Path to the directory containing PDF documents.
-        """
-
-        if not os.path.isdir(directory_path):
-            logging.info(f"Error: {directory_path} is not a valid directory.")
-            return
-
-        for filename in os.listdir(directory_path):
-            if filename.lower().endswith('.pdf'):
-                file_path = os.path.join(directory_path, filename)
-                if os.path.isfile(file_path):
-                    try:
-                        reader = PdfReader(file_path)
-                        content = ""
-                        for page in reader.pages:
-                            content += page.extract_text()
-                        self.add_document(filename, content)
-                    except Exception as e:
-                        logging.info(f"Error reading {filename}: {e}")
-        logging.info(f"All PDF documents from {directory_path} have been loaded into the store.")
-
-
-    def split_document_into_chunks(self, doc_id, chunk_size=1000, overlap=200):
-        """
-        Split a document into smaller text chunks with overlaps. Each chunk will have a maximum size of `chunk_size` characters, and consecutive chunks will overlap by `overlap` characters. The overlap is applied at the end of one chunk and the beginning of the next.
-        
-        :param doc_id: Unique identifier for the document.
-        :param chunk_size: The maximum size of each chunk in characters.
-        :param overlap: The number of overlapping characters between consecutive chunks. Must be smaller than `chunk_size`.
-        :return: A generator yielding text chunks or None if the document is not found.
-        """
-        document = self.get_document(doc_id)
-        if document is None:
-            logging.info(f"Document with ID {doc_id} not found in the store.")
-            return None
-        
-        if overlap >= chunk_size:
-            logging.info("Error: Overlap must be smaller than the chunk size.")
-            return None
-
-        def chunk_generator():
-            for i in range(0, len(document), chunk_size - overlap):
-                yield document[i:i + chunk_size]
-        
-        return chunk_generator()
\ No newline at end of file
+import os
+import zlib
+import struct
+import threading
+from PyPDF2 import PdfReader
+import logging
+
+# Flag byte written before every record of a document store file: how the text is encoded
+RAW, ZLIB, ZSTD, NONE = 0, 1, 2, 255
+
+# Offset tables start with this header, followed by the end offset of every record
+STORE_HEADER = b'DOCSTOR1'
+OFFSET = struct.Struct('<Q')
+
+
+def compressor(name):
+    """
+    Get the compression of document store records.
+
+    :param name: None, 'zlib', or 'zstd' (requires the optional zstandard package).
+    :return: The record flag and a function compressing bytes.
+    :raises ValueError: If the compression is unknown or zstandard is not installed.
+    """
+    if name is None:
+        return RAW, None
+    if name == 'zlib':
+        return ZLIB, zlib.compress
+    if name == 'zstd':
+        try:
+            import zstandard
+        except ImportError:
+            raise ValueError("zstd compression requires the zstandard package")
+        return ZSTD, zstandard.ZstdCompressor().compress
+    raise ValueError(f"Unknown document compression: {name}")
+
+
+def encode_record(text, flag, compress):
+    if text is None:
+        return bytes([NONE])
+    data = text.encode('utf-8')
+    if compress is not None:
+        compressed = compress(data)
+        # short texts do not compress, they are stored as they are
+        if len(compressed) < len(data):
+            return bytes([flag]) + compressed
+    return bytes([RAW]) + data
+
+
+def decode_record(record):
+    flag, data = record[0], record[1:]
+    if flag == NONE:
+        return None
+    if flag == ZLIB:
+        data = zlib.decompress(data)
+    elif flag == ZSTD:
+        import zstandard
+        data = zstandard.ZstdDecompressor().decompress(data)
+    return data.decode('utf-8')
+
+
+class DocumentStore:
+    """
+    A store of documents.
+    Documents added with `add_document` are kept in memory by ID. A store with a
+    path also holds the texts of the documents of an index on disk, addressed by
+    ordinal: an append-only file of (optionally compressed) records and an offset
+    table holding where each record ends. Texts are read one at a time with
+    `fetch`, so only the documents actually returned are ever loaded.
+
+    :param path: The path of the store files, without extension.
+    :param compression: The compression of new records, see `compressor`.
+    """
+    def __init__(self, path=None, compression=None):
+        self.documents = {}
+        self.path = path
+        self.compression = compression
+        self._blob_fd = None
+        self._offsets_fd = None
+        self._lock = threading.Lock()
+
+    def add_document(self, doc_id, document):
+        """
+        Add a document to the store.
+        
+        :param doc_id: Unique identifier for the document.
+        :param document: The document content.
+        """
+        self.documents[doc_id] = document
+        print(f"Document with ID {doc_id} added to the store.")
+
+    def get_document(self, doc_id):
+        """
+        Retrieve a document from the store.
+        
+        :param doc_id: Unique identifier for the document.
+        :return: The document content or None if not found.
+        """
+        return self.documents.get(doc_id, None)
+    
+    def delete_document(self, doc_id):
+        """
+        Delete a document from the store.
+        
+        :param doc_id: Unique identifier for the document.
+        """
+        if doc_id in self.documents:
+            del self.documents[doc_id]
+            print(f"Document with ID {doc_id} deleted from the store.")
+        else:
+            print(f"Document with ID {doc_id} not found in the store.")
+
+    def list_documents(self):
+        """
+        List all documents in the store.
+        
+        :return: A list of document IDs.
+        """
+        return list(self.documents.keys())
+    
+    def clear_store(self):
+        """
+        Clear all documents from the store.
+        """
+        self.documents.clear()
+        logging.info("All documents have been cleared from the store.")
+
+    
+    def load_documents_from_directory(self, directory_path):
+        """
+        Load documents from a specified directory into the store.
+        
+        :param directory_path: Path to the directory containing documents.
+        """
+        if not os.path.isdir(directory_path):
+            print(f"Error: {directory_path} is not a valid directory. Please provide a valid directory path, e.g., '/path/to/documents' or 'C:\\Users\\User\\Documents'.")
+            return
+        
+        for filename in os.listdir(directory_path):
+            if filename.startswith('.'):
+                continue
+            file_path = os.path.join(directory_path, filename)
+            if os.path.isfile(file_path):
+                try:
+                    with open(file_path, 'r', encoding='utf-8') as file:
+                        content = file.read()
+                        self.add_document(filename, content)
+                except Exception as e:
+                    logging.info(f"Error reading {filename}: {type(e).__name__} - {e}")
+        logging.info(f"All documents from {directory_path} have been loaded into the store.")
+
+    def load_pdf_documents_from_directory(self, directory_path):
+        """
+        Load PDF documents from a specified directory into the store.
+        
+        :param directory_path: Path to the directory containing PDF documents.
+        """
+
+        if not os.path.isdir(directory_path):
+            logging.info(f"Error: {directory_path} is not a valid directory.")
+            return
+
+        for filename in os.listdir(directory_path):
+            if filename.lower().endswith('.pdf'):
+                file_path = os.path.join(directory_path, filename)
+                if os.path.isfile(file_path):
+                    try:
+                        reader = PdfReader(file_path)
+                        content = ""
+                        for page in reader.pages:
+                            content += page.extract_text()
+                        self.add_document(filename, content)
+                    except Exception as e:
+                        logging.info(f"Error reading {filename}: {e}")
+        logging.info(f"All PDF documents from {directory_path} have been loaded into the store.")
+
+
+    def split_document_into_chunks(self, doc_id, chunk_size=1000, overlap=200):
+        """
+        Split a document into smaller text chunks with overlaps. Each chunk will have a maximum size of `chunk_size` characters, and consecutive chunks will overlap by `overlap` characters. The overlap is applied at the end of one chunk and the beginning of the next.
+        
+        :param doc_id: Unique identifier for the document.
+        :param chunk_size: The maximum size of each chunk in characters.
+        :param overlap: The number of overlapping characters between consecutive chunks. Must be smaller than `chunk_size`.
+        :return: A generator yielding text chunks or None if the document is not found.
+        """
+        document = self.get_document(doc_id)
+        if document is None:
+            logging.info(f"Document with ID {doc_id} not found in the store.")
+            return None
+        
+        if overlap >= chunk_size:
+            logging.info("Error: Overlap must be smaller than the chunk size.")
+            return None
+
+        def chunk_generator():
+            for i in range(0, len(document), chunk_size - overlap):
+                yield document[i:i + chunk_size]
+        
+        return chunk_generator()
+
+    def blob_file(self):
+        return f"{self.path}.bin"
+
+    def offsets_file(self):
+        return f"{self.path}.idx"
+
+    def append_documents(self, texts, start):
+        """
+        Append the texts of documents to the store files, from ordinal `start` on.
+        Records from `start` on left by an interrupted append are dropped first, so
+        the ordinal of every record is its position. The records are synced to disk
+        before the offset table, which never points past the written records.
+
+        :param texts: The texts, in ordinal order.
+        :param start: The ordinal of the first text.
+        """
+        flag, compress = compressor(self.compression)
+        if not os.path.exists(self.offsets_file()):
+            with open(self.offsets_file(), 'wb') as f:
+                f.write(STORE_HEADER)
+        with open(self.offsets_file(), 'r+b') as offsets, open(self.blob_file(), 'ab+') as blob:
+            if start:
+                offsets.seek(len(STORE_HEADER) + (start - 1) * OFFSET.size)
+                end, = OFFSET.unpack(offsets.read(OFFSET.size))
+            else:
+                end = 0
+            offsets.truncate(len(STORE_HEADER) + start * OFFSET.size)
+            blob.truncate(end)
+
+            ends = bytearray()
+            for text in texts:
+                record = encode_record(text, flag, compress)
+                blob.write(record)
+                end += len(record)
+                ends += OFFSET.pack(end)
+            blob.flush()
+            os.fsync(blob.fileno())
+
+            offsets.seek(0, os.SEEK_END)
+            offsets.write(ends)
+            offsets.flush()
+            os.fsync(offsets.fileno())
+
+    def fetch(self, ordinal):
+        """
+        Read the text of a document from the store files.
+
+        :param ordinal: The ordinal of the document.
+        :return: The text of the document.
+        """
+        if self._offsets_fd is None:
+            with self._lock:
+                if self._offsets_fd is None:
+                    flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0)
+                    self._blob_fd = os.open(self.blob_file(), flags)
+                    self._offsets_fd = os.open(self.offsets_file(), flags)
+
+        if ordinal:
+            start, end = struct.unpack('<QQ', self.read_at(self._offsets_fd, 2 * OFFSET.size,
+                                                           len(STORE_HEADER) + (ordinal - 1) * OFFSET.size))
+        else:
+            start, = OFFSET.unpack(self.read_at(self._offsets_fd, OFFSET.size, len(STORE_HEADER)))
+            start, end = 0, start
+        return decode_record(self.read_at(self._blob_fd, end - start, start))
+
+    def read_at(self, fd, size, offset):
+        """
+        Read bytes at an offset of a store file.
+        `os.pread` leaves the file position alone, so concurrent reads need no lock.
+        Where it is missing, e.g. on Windows, the file position is moved under a lock.
+        """
+        if hasattr(os, 'pread'):
+            return os.pread(fd, size, offset)
+        with self._lock:
+            os.lseek(fd, offset, os.SEEK_SET)
+            return os.read(fd, size)
+
+    def close(self):
+        for fd in (self._blob_fd, self._offsets_fd):
+            if fd is not None:
+                os.close(fd)
+        self._blob_fd = self._offsets_fd = None
+
+    def __del__(self):
+        self.close()
@@ -0,0 +1,68 @@
+from services.shards import ShardedTextSearch, ShardedVectorSearch, shard_names
+from services.text_search import TextSearch
+from services.vector_search import VectorSearch
+from services.generations import current_index_name
+
+
+class FederatedIndex:
+    """
+    Several search indexes searched as one collection.
+    Every shard of every index is queried in parallel in the worker processes,
+    as the shards of a single index are (see `shards.ShardedIndex`), and each
+    result is labelled with the ID of the search index it comes from.
+
+    :param index_ids: The IDs of the search indexes, searched in this order.
+    """
+
+    def __init__(self, index_ids):
+        self.index_ids = list(dict.fromkeys(index_ids))
+        self.shard_names = []
+        # the ID of the search index of each shard, in `shard_names` order
+        self.shard_index_ids = []
+        for index_id in self.index_ids:
+            for name in shard_names(current_index_name(index_id)):
+                self.shard_names.append(name)
+                self.shard_index_ids.append(index_id)
+
+    def label(self, shard_results):
+        return [labelled(results, index_id) for index_id, results in zip(self.shard_index_ids, shard_results)]
+
+
+def labelled(results, index_id):
+    """
+    Lazily label the results of a shard with the ID of its search index.
+    """
+    for result in results:
+        yield {**result, 'index_id': index_id}
+
+
+class FederatedTextSearch(FederatedIndex, ShardedTextSearch):
+    """
+    A text search over several search indexes. Ranked queries are scored with the
+    summed collection statistics of every index, as if their documents were one
+    collection, so that BM25 and TF-IDF scores are comparable across indexes.
+    """
+
+
+class FederatedVectorSearch(FederatedIndex, ShardedVectorSearch):
+    """
+    A vector search over several search indexes. Cosine similarities of the same
+    embedding model are on the same scale whatever the index, so the best results
+    of every index are merged as they are.
+    """
+
+
+def open_federated_index(index_ids, method):
+    """
+    Open several search indexes for a federated query with a search method.
+
+    :param index_ids: The IDs of the search indexes.
+    :param method: The public name of a text or vector search method.
+    :return: A FederatedTextSearch or FederatedVectorSearch instance.
+    :raises ValueError: If the method is not a known search method.
+    """
+    if method in TextSearch.SEARCH_METHODS:
+        return FederatedTextSearch(index_ids)
+    if method in VectorSearch.SEARCH_METHODS:
+        return FederatedVectorSearch(index_ids)
+    raise ValueError(f"Unknown search method: {method}")
@@ -0,0 +1,125 @@
+import re
+
+from services.bitmaps import Bitmap
+from services.query_parser import QueryParser, QueryParseError, And, Or, Not, OPERATORS
+
+# Filter tokens: parentheses, operators and `column:value` clauses, whose value
+# may be quoted to hold spaces or parentheses
+FILTER_TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|(-)?([A-Za-z_][A-Za-z0-9_]*):(?:"([^"]*)"|([^\s()"]+))|(\S+))')
+
+
+class Match:
+    def __init__(self, column, value):
+        self.column = column
+        self.value = value
+
+    def __repr__(self):
+        return f"Match({self.column!r}, {self.value!r})"
+
+
+def tokenize_filter(expression):
+    """
+    Split a filter expression into tokens, see `query_parser.tokenize_query`.
+
+    :return: A list of (kind, value) tuples, kind being one of '(', ')', 'op' or
+        'match' with a (column, value) value.
+    :raises QueryParseError: If the expression holds anything but clauses and operators.
+    """
+    tokens = []
+    position = 0
+    expression = expression.rstrip()
+    while position < len(expression):
+        match = FILTER_TOKEN_PATTERN.match(expression, position)
+        open_paren, close_paren, negated, column, quoted, value, word = match.groups()
+        if open_paren:
+            tokens.append(('(', open_paren))
+        elif close_paren:
+            tokens.append((')', close_paren))
+        elif column:
+            if negated:
+                tokens.append(('op', 'NOT'))
+            tokens.append(('match', (column, quoted if quoted is not None else value)))
+        elif word in OPERATORS:
+            tokens.append(('op', word))
+        else:
+            raise QueryParseError(f"Expected column:value at position {match.start(7)}, got '{word}'")
+        position = match.end()
+    return tokens
+
+
+class FilterParser(QueryParser):
+    """
+    Parser for filter expressions: `column:value` clauses combined like the words
+    of a boolean query, e.g. `status:open (category:books OR category:music) -org:42`.
+    """
+
+    def __init__(self, expression):
+        self.tokens = tokenize_filter(expression)
+        self.position = 0
+
+    def parse_atom(self):
+        kind, value = self.peek()
+        if kind == 'match':
+            self.position += 1
+            return Match(*value)
+        return super().parse_atom()
+
+
+def parse_filter(expression):
+    """
+    Parse a filter expression, see `FilterParser`.
+
+    :return: The root node of the filter tree, or None for an empty expression.
+    :raises QueryParseError: If the expression is not well formed.
+    """
+    return FilterParser(expression).parse()
+
+
+def filter_columns(node):
+    """
+    Collect the columns a filter tree refers to.
+    """
+    if node is None:
+        return set()
+    if isinstance(node, Match):
+        return {node.column}
+    if isinstance(node, Not):
+        return filter_columns(node.child)
+    return set().union(*(filter_columns(child) for child in node.children))
+
+
+def evaluate_filter(node, value_bitmap, universe):
+    """
+    Evaluate a filter tree over per value bitmaps.
+    Conjunctions subtract their negated clauses from the others, so only a filter
+    made of negations alone is complemented against `universe`.
+
+    :param node: The root node of the filter tree.
+    :param value_bitmap: A callable taking a column and a value and returning the
+        bitmap of the documents with that value.
+    :param universe: A callable returning the bitmap of every live document.
+    :return: The bitmap of the matching documents.
+    """
+    if isinstance(node, Match):
+        return value_bitmap(node.column, node.value)
+    if isinstance(node, Or):
+        result = Bitmap()
+        for child in node.children:
+            result = result | evaluate_filter(child, value_bitmap, universe)
+        return result
+    if isinstance(node, Not):
+        return universe() - evaluate_filter(node.child, value_bitmap, universe)
+    if isinstance(node, And):
+        positive = [child for child in node.children if not isinstance(child, Not)]
+        negative = [child.child for child in node.children if isinstance(child, Not)]
+        result = evaluate_filter(positive[0], value_bitmap, universe) if positive else universe()
+        for child in positive[1:]:
+            if not result:
+                return result
+            result = result & evaluate_filter(child, value_bitmap, universe)
+        for child in negative:
+            if not result:
+                return result
+            result = result - evaluate_filter(child, value_bitmap, universe)
+        return result
+    raise TypeError(f"Unknown filter node: {node!r}")
@@ -0,0 +1,137 @@
+import os
+import glob
+import time
+import logging
+import threading
+
+from services.segments import write_pickle, read_pickle
+
+# Seconds the files of a replaced generation are kept, so that queries which
+# resolved the previous generation can still load it
+GENERATION_GRACE_SECONDS = 60
+
+_generations = {}
+_generations_lock = threading.Lock()
+
+
+def generation_file(index_id):
+    return f"data/{index_id}_generation.pkl"
+
+
+def generation_name(index_id, generation):
+    """
+    Get the name of the index files of a generation of a search index. The first
+    generation uses the ID of the search index, so indexes built before generations
+    existed are generation 0.
+    """
+    return index_id if generation == 0 else f"{index_id}_gen{generation}"
+
+
+def read_generations(index_id):
+    try:
+        return read_pickle(generation_file(index_id))
+    except FileNotFoundError:
+        return {'generation': 0, 'next_generation': 1, 'obsolete': []}
+
+
+def current_index_name(index_id):
+    """
+    Get the name of the index files of the current generation of a search index.
+    Readers resolve the name once per query and load that generation; the pointer
+    file is replaced atomically, so no lock is needed. The pointer is only re-read
+    when it changes on disk.
+
+    :param index_id: The ID of the search index.
+    :return: The name to open the text and vector indexes with.
+    """
+    try:
+        stat = os.stat(generation_file(index_id))
+    except FileNotFoundError:
+        return index_id
+    version = (stat.st_mtime_ns, stat.st_size)
+
+    cached = _generations.get(index_id)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    name = generation_name(index_id, read_generations(index_id)['generation'])
+    _generations[index_id] = (version, name)
+    return name
+
+
+def new_generation(index_id):
+    """
+    Reserve the number of a new generation of a search index, to build it side by
+    side with the current one.
+    """
+    with _generations_lock:
+        generations = read_generations(index_id)
+        generation = generations['next_generation']
+        generations['next_generation'] += 1
+        write_pickle(generation_file(index_id), generations)
+        return generation
+
+
+def swap_generation(index_id, generation):
+    """
+    Make a fully built generation the current generation of a search index.
+    Queries already running finish on the generation they loaded; the files of the
+    replaced generation are removed after `GENERATION_GRACE_SECONDS`, see
+    `collect_generations`. Generations replaced before and left behind, e.g. by a
+    restart before their removal was due, are removed now.
+    """
+    with _generations_lock:
+        generations = read_generations(index_id)
+        generations['obsolete'].append((generations['generation'], time.time()))
+        generations['generation'] = generation
+        write_pickle(generation_file(index_id), generations)
+
+    collect_generations(index_id)
+    timer = threading.Timer(GENERATION_GRACE_SECONDS, collect_generations, args=(index_id,))
+    timer.daemon = True
+    timer.start()
+    logging.info(f"Search index {index_id} switched to generation {generation}")
+
+
+def collect_generations(index_id):
+    """
+    Remove the files of the generations of a search index replaced more than
+    `GENERATION_GRACE_SECONDS` ago.
+    """
+    with _generations_lock:
+        generations = read_generations(index_id)
+        now = time.time()
+        expired = [generation for generation, replaced in generations['obsolete']
+                   if now - replaced >= GENERATION_GRACE_SECONDS]
+        if not expired:
+            return
+        generations['obsolete'] = [(generation, replaced) for generation, replaced in generations['obsolete']
+                                   if now - replaced < GENERATION_GRACE_SECONDS]
+        write_pickle(generation_file(index_id), generations)
+
+    for generation in expired:
+        remove_generation_files(index_id, generation)
+
+
+def collect_all_generations():
+    """
+    Remove the files of the generations of every search index replaced more than
+    `GENERATION_GRACE_SECONDS` ago, e.g. at startup: the timers started by
+    `swap_generation` do not survive a restart.
+    """
+    for path in glob.glob("data/*_generation.pkl"):
+        collect_generations(os.path.basename(path)[:-len("_generation.pkl")])
+
+
+def remove_generation_files(index_id, generation):
+    """
+    Remove the files of one generation of a search index, every shard included.
+    """
+    name = generation_name(index_id, generation)
+    for path in glob.glob(f"data/{glob.escape(name)}_*"):
+        if generation == 0 and os.path.basename(path).startswith(f"{index_id}_gen"):
+            # files of the later generations, and the generation pointer
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
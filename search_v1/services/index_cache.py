@@ -0,0 +1,93 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager, ExitStack
+
+from services.text_search import TextSearch
+from services.journal import journal_file
+
+# Maximum number of text indexes kept loaded in memory
+MAX_CACHED_INDEXES = int(os.getenv("MAX_CACHED_INDEXES", 8))
+
+_text_indexes = OrderedDict()
+
+_index_locks = {}
+_index_locks_lock = threading.Lock()
+
+
+def index_lock(index_id):
+    """
+    Get the lock serializing the writes to an index within this process.
+    Writers load, change and save the index manifest, so two concurrent
+    writers (e.g. an update and a background segment merge) would lose one of
+    the changes.
+
+    :param index_id: The ID of the search index.
+    :return: A threading.Lock.
+    """
+    with _index_locks_lock:
+        return _index_locks.setdefault(index_id, threading.Lock())
+
+
+@contextmanager
+def index_locks(index_names):
+    """
+    Hold the write locks of several indexes, e.g. of every shard of a search index.
+    The locks are taken in the order given, so callers must list the names in a
+    consistent order (shard order) to avoid deadlocks.
+    """
+    with ExitStack() as stack:
+        for index_name in index_names:
+            stack.enter_context(index_lock(index_name))
+        yield
+
+
+def file_version(path):
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def get_text_search(index_id):
+    """
+    Get a loaded text index, keeping recently used indexes in memory.
+    Loading an index unpickles the whole index file, which is far too slow for
+    per keystroke requests such as autocomplete. Cached indexes are reloaded when
+    their manifest or journal changes on disk, and the least recently used index
+    is dropped once `MAX_CACHED_INDEXES` are loaded.
+
+    :param index_id: The ID of the search index.
+    :return: A TextSearch instance.
+    """
+    version = text_index_version(index_id)
+
+    cached = _text_indexes.get(index_id)
+    if cached is not None and cached[0] == version:
+        _text_indexes.move_to_end(index_id)
+        return cached[1]
+
+    text_search = TextSearch(index_file=index_id)
+    _text_indexes[index_id] = (version, text_search)
+    _text_indexes.move_to_end(index_id)
+    while len(_text_indexes) > MAX_CACHED_INDEXES:
+        _text_indexes.popitem(last=False)
+    return text_search
+
+
+def text_index_version(index_id):
+    return file_version(f"data/{index_id}_ivf.pkl"), file_version(journal_file(index_id))
+
+
+def refresh_text_search(index_id):
+    """
+    Record the files of a cached text index as current once it was changed in place
+    by this process, e.g. by a document update under the index lock, so that it is
+    not reloaded for its own change.
+
+    :param index_id: The ID of the search index.
+    """
+    cached = _text_indexes.get(index_id)
+    if cached is not None:
+        _text_indexes[index_id] = (text_index_version(index_id), cached[1])
@@ -0,0 +1,184 @@
+import os
+import time
+import uuid
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Number of index builds run at the same time; further builds wait in the queue
+BUILD_CONCURRENCY = int(os.getenv("BUILD_CONCURRENCY", 2))
+
+# Number of finished jobs whose status is kept
+MAX_FINISHED_JOBS = 100
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = 'queued', 'running', 'completed', 'failed', 'cancelled'
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+class JobCancelled(Exception):
+    """
+    Raised inside a job once it is cancelled, see `Job.advance`.
+    """
+
+
+class Job:
+    """
+    A background job and its progress.
+    Job functions report progress with `advance`, which is also where a cancelled
+    job stops: cancellation is cooperative, so a job stops at its next progress
+    report rather than in the middle of a write.
+
+    :param kind: The kind of job, e.g. 'build'.
+    :param index_id: The ID of the search index the job works on.
+    :param on_cancel: A function called when the job is cancelled before it starts,
+        to clean up what was set up for it, since the job function never runs.
+    """
+
+    def __init__(self, kind, index_id, on_cancel=None):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.index_id = index_id
+        self.on_cancel = on_cancel
+        self.status = QUEUED
+        self.error = None
+        # number of rows to process, when known
+        self.total_rows = None
+        self.progress = {'rows_read': 0, 'rows_indexed': 0, 'rows_embedded': 0}
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._cancelled = threading.Event()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def advance(self, stage, count):
+        """
+        Report that `count` more rows went through a stage of the job.
+
+        :raises JobCancelled: If the job was cancelled.
+        """
+        if self.cancelled:
+            raise JobCancelled()
+        self.progress[stage] += count
+
+    def cancel(self):
+        """
+        Ask the job to stop.
+
+        :return: False if the job had already finished.
+        """
+        if self.status not in (QUEUED, RUNNING):
+            return False
+        self._cancelled.set()
+        return True
+
+    def eta(self):
+        """
+        Estimate the seconds left, from the rate of the slowest stage so far.
+        """
+        if self.status != RUNNING or not self.total_rows:
+            return None
+        done = min(self.progress.values())
+        if not done:
+            return None
+        elapsed = time.time() - self.started_at
+        return max(self.total_rows - done, 0) * elapsed / done
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'index_id': self.index_id,
+            'status': self.status,
+            'error': self.error,
+            'total_rows': self.total_rows,
+            **self.progress,
+            'eta_seconds': self.eta(),
+            'submitted_at': self.submitted_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+        }
+
+
+class JobRunner:
+    """
+    Runs jobs in a bounded pool of threads of this process. Jobs beyond
+    `max_workers` wait in the queue. Job statuses are kept in memory, so they are
+    only known to the server process that runs the job.
+
+    :param max_workers: The number of jobs run at the same time.
+    """
+
+    def __init__(self, max_workers=BUILD_CONCURRENCY):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='index-job')
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def submit(self, job, function, *args):
+        """
+        Queue a job. The function is called with the job and `args`.
+
+        :return: The job.
+        """
+        with self.lock:
+            self.jobs[job.id] = job
+        self.executor.submit(self.run, job, function, args)
+        return job
+
+    def run(self, job, function, args):
+        if job.cancelled:
+            try:
+                if job.on_cancel is not None:
+                    job.on_cancel()
+            except Exception:
+                logging.exception(f"Failed to clean up cancelled {job.kind} job {job.id} of index {job.index_id}")
+            finally:
+                job.status = CANCELLED
+                job.finished_at = time.time()
+                self.prune()
+            return
+
+        job.status = RUNNING
+        job.started_at = time.time()
+        try:
+            function(job, *args)
+            job.status = COMPLETED
+        except JobCancelled:
+            job.status = CANCELLED
+            logging.info(f"Cancelled {job.kind} job {job.id} of index {job.index_id}")
+        except Exception as e:
+            job.status = FAILED
+            job.error = str(e)
+            logging.exception(f"Failed {job.kind} job {job.id} of index {job.index_id}")
+        finally:
+            job.finished_at = time.time()
+            self.prune()
+
+    def prune(self):
+        """
+        Forget the oldest finished jobs beyond `MAX_FINISHED_JOBS`.
+        """
+        with self.lock:
+            finished = [job_id for job_id, job in self.jobs.items() if job.finished_at is not None]
+            for job_id in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+                del self.jobs[job_id]
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+
+def get_job_runner():
+    """
+    Get the job runner of this process, started on first use.
+    """
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = JobRunner()
+        return _runner
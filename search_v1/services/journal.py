@@ -0,0 +1,140 @@
+import os
+import struct
+import zlib
+import pickle
+import logging
+
+from services.segments import replacing
+
+# Number of records appended without an explicit commit after which the journal
+# is synced to disk anyway, see `Journal.append`
+JOURNAL_SYNC_RECORDS = 1000
+
+# Every record is prefixed with the length and the CRC32 of its pickled payload,
+# so a record torn by a crash is detected and dropped on replay
+RECORD_HEADER = struct.Struct('<II')
+
+
+def journal_file(index_name):
+    return f"data/{index_name}_journal.log"
+
+
+def encode_record(record):
+    payload = pickle.dumps(record, protocol=pickle.HIGHEST_PROTOCOL)
+    return RECORD_HEADER.pack(len(payload), zlib.crc32(payload)) + payload
+
+
+class Journal:
+    """
+    Append-only write-ahead journal of the changes made to an index since its
+    manifest was last written.
+
+    Records are appended as they are made and synced to disk in batches: on
+    `commit`, or every `JOURNAL_SYNC_RECORDS` records. Each manifest names the
+    generation of the journal that follows it; the first record of a journal
+    holds its generation, so a journal left behind by a crash right after a new
+    manifest was written is recognised as stale and ignored.
+
+    :param path: The path of the journal file.
+    :param generation: The generation of the journal, from the manifest.
+    """
+
+    def __init__(self, path, generation=0):
+        self.path = path
+        self.generation = generation
+        self.file = None
+        # size of the valid part of the journal file, set by `replay`
+        self.size = 0
+        self.unsynced = 0
+
+    def replay(self):
+        """
+        Read the records of the journal, in order. Reading stops at the first
+        incomplete or corrupted record, which can only be the last one written
+        before a crash.
+
+        :return: A generator of records.
+        """
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+
+        with f:
+            size = 0
+            while True:
+                header = f.read(RECORD_HEADER.size)
+                if not header:
+                    break
+                if len(header) < RECORD_HEADER.size:
+                    logging.warning(f"Ignoring an incomplete record at the end of journal {self.path}")
+                    break
+                length, checksum = RECORD_HEADER.unpack(header)
+                payload = f.read(length)
+                if len(payload) < length or zlib.crc32(payload) != checksum:
+                    logging.warning(f"Ignoring an incomplete record at the end of journal {self.path}")
+                    break
+
+                record = pickle.loads(payload)
+                if size == 0 and record != ('journal', self.generation):
+                    # journal of a previous generation, its changes are in the manifest
+                    return
+                size += RECORD_HEADER.size + length
+                self.size = size
+                if record[0] != 'journal':
+                    yield record
+
+    def open(self):
+        """
+        Open the journal for appending. A journal of the current generation is
+        truncated to its valid part, see `replay`; otherwise a new journal is
+        started.
+        """
+        if self.size:
+            self.file = open(self.path, 'r+b')
+            self.file.truncate(self.size)
+            self.file.seek(self.size)
+            return
+
+        with replacing(self.path) as temp_path, open(temp_path, 'wb') as f:
+            f.write(encode_record(('journal', self.generation)))
+            f.flush()
+            os.fsync(f.fileno())
+        self.file = open(self.path, 'ab')
+
+    def append(self, record):
+        """
+        Append a record to the journal. The record is only durable once the journal
+        is committed.
+        """
+        if self.file is None:
+            self.open()
+        self.file.write(encode_record(record))
+        self.unsynced += 1
+        if self.unsynced >= JOURNAL_SYNC_RECORDS:
+            self.commit()
+
+    def commit(self):
+        """
+        Sync the records appended since the last commit to disk, with one fsync.
+        """
+        if self.file is None or not self.unsynced:
+            return
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+
+    def reset(self, generation):
+        """
+        Start a new generation of the journal once the manifest holds all its changes.
+        """
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+        self.generation = generation
+        self.size = 0
+        self.unsynced = 0
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,106 @@
+import heapq
+
+
+def encode_positions(positions):
+    """
+    Encode the sorted token positions of a word in a document.
+    Each position is stored as the difference to the previous one, written as a
+    variable length integer (7 bits per byte), so the positions of frequent words
+    mostly take a single byte each.
+
+    :param positions: The sorted token positions.
+    :return: The encoded positions.
+    """
+    encoded = bytearray()
+    previous = 0
+    for position in positions:
+        delta = position - previous
+        previous = position
+        while delta >= 0x80:
+            encoded.append(delta & 0x7f | 0x80)
+            delta >>= 7
+        encoded.append(delta)
+    return bytes(encoded)
+
+
+def decode_positions(encoded):
+    """
+    Decode positions written by `encode_positions`.
+
+    :param encoded: The encoded positions.
+    :return: A list of the sorted token positions.
+    """
+    positions = []
+    position = 0
+    delta = 0
+    shift = 0
+    for byte in encoded:
+        delta |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            position += delta
+            positions.append(position)
+            delta = 0
+            shift = 0
+    return positions
+
+
+def min_span(position_lists):
+    """
+    Find the smallest window of tokens containing at least one position of every list.
+    The lists are merged in position order while a sliding window keeps track of
+    how many lists it covers.
+
+    :param position_lists: Sorted token positions, one list per word.
+    :return: The number of tokens in the smallest window, or None if a list is empty.
+    """
+    if not position_lists or not all(position_lists):
+        return None
+
+    merged = heapq.merge(*(zip(positions, [word] * len(positions))
+                           for word, positions in enumerate(position_lists)))
+    window = []
+    counts = [0] * len(position_lists)
+    covered = 0
+    low = 0
+    best = None
+    for position, word in merged:
+        window.append((position, word))
+        if not counts[word]:
+            covered += 1
+        counts[word] += 1
+        while covered == len(position_lists):
+            first, first_word = window[low]
+            span = position - first + 1
+            if best is None or span < best:
+                best = span
+            counts[first_word] -= 1
+            if not counts[first_word]:
+                covered -= 1
+            low += 1
+    return best
+
+
+def match_positions(position_lists, slop=0, offsets=None):
+    """
+    Check whether the words of a phrase occur in a document.
+
+    :param position_lists: Sorted token positions of each phrase word, in phrase order.
+    :param slop: 0 to require the words next to each other and in order, otherwise
+        the number of other tokens allowed in the window holding the words, in any order.
+    :param offsets: The position of each word relative to the first one for an exact
+        phrase, consecutive positions by default.
+    :return: True if the phrase matches.
+    """
+    if slop:
+        span = min_span(position_lists)
+        return span is not None and span <= len(position_lists) + slop
+
+    offsets = offsets or range(len(position_lists))
+    starts = set(position_lists[0])
+    for offset, positions in zip(offsets[1:], position_lists[1:]):
+        starts.intersection_update(position - offset for position in positions)
+        if not starts:
+            return False
+    return bool(starts)
@@ -0,0 +1,135 @@
+from array import array
+from bisect import bisect_left
+
+# Lists more than this many times longer than the list they are intersected
+# with are probed by galloping instead of being scanned.
+GALLOP_RATIO = 8
+
+
+def gallop(postings, target, low=0):
+    """
+    Find the first position in a sorted posting list holding a value >= target.
+    The search probes exponentially growing steps from `low` before bisecting, so
+    it is cheap when consecutive targets are close together.
+
+    :param postings: A sorted posting list.
+    :param target: The value to search for.
+    :param low: The position to start searching from.
+    :return: The position of the first value >= target, or len(postings).
+    """
+    size = len(postings)
+    step = 1
+    high = low
+    while high < size and postings[high] < target:
+        low = high + 1
+        high += step
+        step <<= 1
+    return bisect_left(postings, target, low, min(high, size))
+
+
+def iter_intersect(postings_lists, exclude=()):
+    """
+    Lazily intersect sorted posting lists.
+    The shortest list drives the intersection and every candidate is galloped
+    to in the other lists, so the cost depends on the shortest list rather than
+    the longest one.
+
+    :param postings_lists: The sorted posting lists to intersect.
+    :param exclude: Sorted posting lists whose values must not be in the result.
+    :return: A generator of the values present in all lists and in none of `exclude`.
+    """
+    if not postings_lists:
+        return
+    postings_lists = sorted(postings_lists, key=len)
+    driver, others = postings_lists[0], postings_lists[1:]
+    positions = [0] * len(others)
+    exclude_positions = [0] * len(exclude)
+
+    for value in driver:
+        matched = True
+        for i, other in enumerate(others):
+            positions[i] = gallop(other, value, positions[i])
+            if positions[i] == len(other):
+                # the other list is exhausted, nothing further can match
+                return
+            if other[positions[i]] != value:
+                matched = False
+                break
+        if not matched:
+            continue
+
+        excluded = False
+        for i, other in enumerate(exclude):
+            exclude_positions[i] = gallop(other, value, exclude_positions[i])
+            if exclude_positions[i] < len(other) and other[exclude_positions[i]] == value:
+                excluded = True
+                break
+        if not excluded:
+            yield value
+
+
+def locate(postings, ordinals):
+    """
+    Find where documents are stored in a posting list, to read the per document
+    data kept alongside it (term frequencies, positions).
+
+    :param postings: A sorted posting list.
+    :param ordinals: Sorted document ordinals.
+    :return: A generator of (ordinal, position in `postings`) pairs for the ordinals
+        present in the posting list.
+    """
+    position = 0
+    size = len(postings)
+    for ordinal in ordinals:
+        position = gallop(postings, ordinal, position)
+        if position == size:
+            return
+        if postings[position] == ordinal:
+            yield ordinal, position
+
+
+def intersect(a, b):
+    """
+    Intersect two sorted posting lists.
+    Lists of skewed sizes are intersected by galloping through the longer one,
+    lists of similar sizes through a hash set.
+
+    :return: A sorted array of the values present in both lists.
+    """
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return array('I')
+    if len(b) > GALLOP_RATIO * len(a):
+        return array('I', iter_intersect([a, b]))
+    return array('I', sorted(set(a).intersection(b)))
+
+
+def union(postings_lists):
+    """
+    Merge sorted posting lists.
+
+    :return: A sorted array of the values present in any list.
+    """
+    if not postings_lists:
+        return array('I')
+    if len(postings_lists) == 1:
+        return array('I', postings_lists[0])
+    merged = set()
+    for postings in postings_lists:
+        merged.update(postings)
+    return array('I', sorted(merged))
+
+
+def difference(a, b):
+    """
+    Remove the values of a sorted posting list from another one.
+
+    :return: A sorted array of the values of `a` that are not in `b`.
+    """
+    if not a or not b:
+        return array('I', a)
+    if len(b) > GALLOP_RATIO * len(a):
+        return array('I', iter_intersect([a], exclude=[b]))
+    excluded = set(b)
+    return array('I', (value for value in a if value not in excluded))
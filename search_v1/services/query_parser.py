@@ -0,0 +1,343 @@
+import re
+from array import array
+
+from services.postings import iter_intersect, intersect, union, difference
+
+# Query tokens: parentheses, quoted phrases with an optional ~N proximity and bare
+# words. A bare word may not contain parentheses or quotes.
+QUERY_TOKEN_PATTERN = re.compile(r'\s*(?:(\()|(\))|"([^"]*)"(?:~(\d+))?|([^\s()"]+))')
+OPERATORS = ('AND', 'OR', 'NOT')
+
+
+class QueryParseError(ValueError):
+    """
+    Raised when a boolean query is not well formed.
+    """
+
+
+class Term:
+    def __init__(self, word):
+        self.word = word
+
+    def __repr__(self):
+        return f"Term({self.word!r})"
+
+
+class Phrase:
+    def __init__(self, words, slop=0, offsets=None):
+        self.words = words
+        # number of other words allowed between the phrase words, 0 for an exact phrase
+        self.slop = slop
+        # position of each word relative to the first one; stopwords removed by the
+        # analyzer leave gaps
+        self.offsets = offsets or list(range(len(words)))
+
+    def __repr__(self):
+        return f"Phrase({self.words!r}, slop={self.slop})"
+
+
+class And:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"And({self.children!r})"
+
+
+class Or:
+    def __init__(self, children):
+        self.children = children
+
+    def __repr__(self):
+        return f"Or({self.children!r})"
+
+
+class Not:
+    def __init__(self, child):
+        self.child = child
+
+    def __repr__(self):
+        return f"Not({self.child!r})"
+
+
+def tokenize_query(query):
+    """
+    Split a boolean query into tokens.
+
+    :param query: The query string.
+    :return: A list of (kind, value) tuples, kind being one of '(', ')', 'phrase',
+        'op' or 'word'.
+    :raises QueryParseError: If a quote is not closed.
+    """
+    tokens = []
+    position = 0
+    query = query.rstrip()
+    while position < len(query):
+        match = QUERY_TOKEN_PATTERN.match(query, position)
+        if not match:
+            raise QueryParseError(f"Unclosed quote at position {query.index(chr(34), position)}")
+        open_paren, close_paren, phrase, slop, word = match.groups()
+        if open_paren:
+            tokens.append(('(', open_paren))
+        elif close_paren:
+            tokens.append((')', close_paren))
+        elif phrase is not None:
+            tokens.append(('phrase', (phrase, int(slop or 0))))
+        elif word in OPERATORS:
+            tokens.append(('op', word))
+        elif word.startswith('-') and len(word) > 1:
+            tokens.append(('op', 'NOT'))
+            tokens.append(('word', word[1:]))
+        else:
+            tokens.append(('word', word))
+        position = match.end()
+    return tokens
+
+
+class QueryParser:
+    """
+    Recursive descent parser for boolean queries.
+
+    Grammar (operators are upper case, AND is implied between adjacent clauses)::
+
+        query   := or_expr
+        or_expr := and_expr ('OR' and_expr)*
+        and_expr:= not_expr (['AND'] not_expr)*
+        not_expr:= ('NOT' | '-') not_expr | atom
+        atom    := '(' or_expr ')' | '"' words '"' ['~' N] | word
+    """
+
+    def __init__(self, query):
+        self.tokens = tokenize_query(query)
+        self.position = 0
+
+    def parse(self):
+        """
+        Parse the query.
+
+        :return: The root node of the query tree, or None for an empty query.
+        :raises QueryParseError: If the query is not well formed.
+        """
+        if not self.tokens:
+            return None
+        node = self.parse_or()
+        if self.position < len(self.tokens):
+            raise QueryParseError(f"Unexpected '{self.tokens[self.position][1]}'")
+        return node
+
+    def peek(self):
+        return self.tokens[self.position] if self.position < len(self.tokens) else (None, None)
+
+    def parse_or(self):
+        children = [self.parse_and()]
+        while self.peek() == ('op', 'OR'):
+            self.position += 1
+            children.append(self.parse_and())
+        return children[0] if len(children) == 1 else Or(children)
+
+    def parse_and(self):
+        children = [self.parse_not()]
+        while True:
+            kind, value = self.peek()
+            if kind == 'op' and value == 'AND':
+                self.position += 1
+            elif kind in (None, ')') or (kind == 'op' and value == 'OR'):
+                break
+            children.append(self.parse_not())
+        return children[0] if len(children) == 1 else And(children)
+
+    def parse_not(self):
+        if self.peek() == ('op', 'NOT'):
+            self.position += 1
+            return Not(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        kind, value = self.peek()
+        self.position += 1
+        if kind == '(':
+            node = self.parse_or()
+            if self.peek()[0] != ')':
+                raise QueryParseError("Missing closing parenthesis")
+            self.position += 1
+            return node
+        if kind == 'phrase':
+            phrase, slop = value
+            words = phrase.split()
+            if not words:
+                raise QueryParseError("Empty phrase")
+            return Term(words[0]) if len(words) == 1 else Phrase(words, slop)
+        if kind == 'word':
+            return Term(value)
+        if kind is None:
+            raise QueryParseError("Unexpected end of query")
+        raise QueryParseError(f"Unexpected '{value}'")
+
+
+def parse_query(query):
+    """
+    Parse a boolean query string, see `QueryParser`.
+    """
+    return QueryParser(query).parse()
+
+
+def analyze_query_tree(node, analyze):
+    """
+    Replace the words of a query tree by the terms of the index analyzer.
+    A word analyzed to several terms (e.g. 'e-mail') becomes a phrase, and words
+    analyzed to no term (stopwords) are dropped along with the clauses left empty.
+
+    :param node: The root node of the query tree.
+    :param analyze: A callable returning the (position, term) pairs of a text.
+    :return: The root node of the analyzed tree, or None if no term is left.
+    """
+    if node is None:
+        return None
+    if isinstance(node, Term):
+        return terms_node(analyze(node.word))
+    if isinstance(node, Phrase):
+        return terms_node(analyze(' '.join(node.words)), node.slop)
+    if isinstance(node, Not):
+        child = analyze_query_tree(node.child, analyze)
+        return Not(child) if child is not None else None
+
+    children = [child for child in (analyze_query_tree(child, analyze) for child in node.children)
+                if child is not None]
+    if not children:
+        return None
+    return children[0] if len(children) == 1 else type(node)(children)
+
+
+def terms_node(terms, slop=0):
+    """
+    Build the query node matching analyzed (position, term) pairs.
+    """
+    if not terms:
+        return None
+    if len(terms) == 1:
+        return Term(terms[0][1])
+    first = terms[0][0]
+    return Phrase([term for _, term in terms], slop, [position - first for position, _ in terms])
+
+
+def positive_words(node):
+    """
+    Collect the words of a query that documents are expected to contain, i.e.
+    all words that are not negated.
+
+    :param node: The root node of the query tree.
+    :return: A list of words, in query order.
+    """
+    if node is None or isinstance(node, Not):
+        return []
+    if isinstance(node, Term):
+        return [node.word]
+    if isinstance(node, Phrase):
+        return list(node.words)
+    return [word for child in node.children for word in positive_words(child)]
+
+
+class QueryPlanner:
+    """
+    Cost based evaluation of boolean query trees over sorted posting lists.
+
+    Conjunctions are evaluated cheapest clause first and stop as soon as the
+    intermediate result is empty, negations are subtracted from the positive
+    clauses instead of being materialized, and intersections of lists of skewed
+    sizes gallop through the longer list.
+
+    :param postings: A callable returning the sorted posting list of a word.
+    :param all_docs: A callable returning the sorted list of all document ordinals.
+    :param match_phrase: A callable taking a phrase node and a sorted candidate list,
+        returning the candidates containing the phrase (or its words within the
+        phrase slop).
+    """
+
+    def __init__(self, postings, all_docs, match_phrase):
+        self.postings = postings
+        self.all_docs = all_docs
+        self.match_phrase = match_phrase
+
+    def estimate(self, node):
+        """
+        Estimate the number of documents matching a node.
+        """
+        if isinstance(node, Term):
+            return len(self.postings(node.word))
+        if isinstance(node, Phrase):
+            return min(len(self.postings(word)) for word in node.words)
+        if isinstance(node, And):
+            positive = [self.estimate(child) for child in node.children if not isinstance(child, Not)]
+            return min(positive) if positive else len(self.all_docs())
+        if isinstance(node, Or):
+            return sum(self.estimate(child) for child in node.children)
+        if isinstance(node, Not):
+            return len(self.all_docs()) - self.estimate(node.child)
+        raise TypeError(f"Unknown query node: {node!r}")
+
+    def execute(self, node):
+        """
+        Evaluate a node.
+
+        :return: A sorted array of the matching document ordinals.
+        """
+        if node is None:
+            return array('I')
+        if isinstance(node, Term):
+            return self.postings(node.word)
+        if isinstance(node, Phrase):
+            return self.execute_phrase(node)
+        if isinstance(node, And):
+            return self.execute_and(node)
+        if isinstance(node, Or):
+            return union([self.execute(child) for child in node.children])
+        if isinstance(node, Not):
+            return difference(self.all_docs(), self.execute(node.child))
+        raise TypeError(f"Unknown query node: {node!r}")
+
+    def execute_phrase(self, node):
+        candidates = self.execute_phrase_candidates(node)
+        return self.match_phrase(node, candidates) if candidates else candidates
+
+    def execute_and(self, node):
+        positive = sorted(
+            (child for child in node.children if not isinstance(child, Not)),
+            key=self.estimate
+        )
+        negative = [child.child for child in node.children if isinstance(child, Not)]
+
+        result = self.execute(positive[0]) if positive else self.all_docs()
+        for child in positive[1:]:
+            if not result:
+                return result
+            if isinstance(child, Phrase):
+                # only verify the phrase on the documents still in the running
+                result = self.match_phrase(child, intersect(result, self.execute_phrase_candidates(child)))
+            else:
+                result = intersect(result, self.execute(child))
+
+        for child in negative:
+            if not result:
+                return result
+            result = difference(result, self.execute(child))
+        return result
+
+    def execute_phrase_candidates(self, node):
+        return array('I', iter_intersect([self.postings(word) for word in node.words]))
+
+    def iterate(self, node):
+        """
+        Lazily evaluate a node. Conjunctions of plain words (the common case) are
+        intersected lazily, other queries are evaluated with `execute`.
+
+        :return: An iterator over the matching document ordinals, in order.
+        """
+        if isinstance(node, And) and all(
+            isinstance(child, Term) or (isinstance(child, Not) and isinstance(child.child, Term))
+            for child in node.children
+        ):
+            positive = [self.postings(child.word) for child in node.children if isinstance(child, Term)]
+            negative = [self.postings(child.child.word) for child in node.children if isinstance(child, Not)]
+            if positive:
+                return iter_intersect(positive, exclude=negative)
+        return iter(self.execute(node))
@@ -0,0 +1,97 @@
+import heapq
+from operator import itemgetter
+
+# Fields that can be requested for each search result. Results contain the
+# default fields unless a projection is given.
+RESULT_FIELDS = ('text', 'score', 'id', 'snippets')
+DEFAULT_FIELDS = ('text', 'score', 'id')
+
+
+def parse_fields(fields):
+    """
+    Parse a field projection as given on the search endpoints.
+
+    :param fields: A comma separated string (e.g. "id,score"), a list of field names or None.
+    :return: A tuple of field names, or None for the default fields.
+    :raises ValueError: If an unknown field is requested.
+    """
+    if fields is None:
+        return None
+    if isinstance(fields, str):
+        fields = [field.strip() for field in fields.split(',') if field.strip()]
+    unknown = [field for field in fields if field not in RESULT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown result fields: {', '.join(unknown)}")
+    return tuple(fields) or None
+
+
+def ranked_page(doc_scores, top_k=None, offset=0):
+    """
+    Select one page of scored documents, highest score first.
+    When a page size is given only `offset + top_k` entries are kept in a heap,
+    so the full ranking is never sorted or materialized.
+
+    :param doc_scores: An iterable of (doc_id, score) pairs, e.g. `dict.items()`.
+    :param top_k: The page size, or None for all results.
+    :param offset: The number of results to skip.
+    :return: A list of (doc_id, score) pairs.
+    """
+    if top_k is None:
+        return sorted(doc_scores, key=itemgetter(1), reverse=True)[offset:]
+    return heapq.nlargest(offset + top_k, doc_scores, key=itemgetter(1))[offset:]
+
+
+def iter_ranked(doc_scores):
+    """
+    Lazily yield scored documents, highest score first.
+    The scores are heapified in linear time and popped one at a time, so the first
+    results are available without sorting the whole ranking.
+
+    :param doc_scores: An iterable of (doc_id, score) pairs, e.g. `dict.items()`.
+    :return: A generator of (doc_id, score) pairs.
+    """
+    heap = [(-score, position, doc_id) for position, (doc_id, score) in enumerate(doc_scores)]
+    heapq.heapify(heap)
+    while heap:
+        neg_score, _, doc_id = heapq.heappop(heap)
+        yield doc_id, -neg_score
+
+
+def unranked_page(doc_ids, top_k=None, offset=0):
+    """
+    Select one page of unscored documents. Documents are ordered by ID (or ordinal)
+    so that consecutive pages of the same query do not overlap.
+
+    :param doc_ids: An iterable of document IDs or ordinals.
+    :param top_k: The page size, or None for all results.
+    :param offset: The number of results to skip.
+    :return: A list of document IDs or ordinals.
+    """
+    if top_k is None:
+        return sorted(doc_ids)[offset:]
+    return heapq.nsmallest(offset + top_k, doc_ids)[offset:]
+
+
+def make_result(doc_id, get_text, score=None, fields=None, get_snippets=None):
+    """
+    Build a single search result, fetching the document text and snippets only if
+    they are requested.
+
+    :param doc_id: The document ID.
+    :param get_text: A callable returning the text of the document.
+    :param score: The score of the document, or None for unranked searches.
+    :param fields: The requested fields as returned by `parse_fields`.
+    :param get_snippets: A callable returning the snippets of the document, if supported.
+    :return: A result dictionary.
+    """
+    fields = fields or DEFAULT_FIELDS
+    result = {}
+    if 'text' in fields:
+        result['text'] = get_text()
+    if score is not None and 'score' in fields:
+        result['score'] = score
+    if 'id' in fields:
+        result['id'] = doc_id
+    if 'snippets' in fields and get_snippets is not None:
+        result['snippets'] = get_snippets()
+    return result
@@ -0,0 +1,270 @@
+import os
+import time
+import uuid
+import pickle
+import logging
+from array import array
+from math import log
+from contextlib import contextmanager
+
+from services.bitmaps import Bitmap
+
+# Number of documents buffered in memory before they are flushed as a new segment
+SEGMENT_BUFFER_SIZE = 5000
+
+# Number of adjacent segments of the same size tier merged into one
+MERGE_FACTOR = 4
+
+# Share of deleted documents above which a segment is rewritten without them
+EXPUNGE_RATIO = 0.05
+
+# Seconds the files of merged segments are kept, so that readers which loaded the
+# previous manifest can still read them
+SEGMENT_GRACE_SECONDS = 60
+
+# Tombstone values, per document ordinal
+LIVE, DELETED, PURGED = 0, 1, 2
+
+
+def manifest_file(index_name):
+    return f"data/{index_name}_ivf.pkl"
+
+
+def segment_file(index_name, segment_name):
+    return f"data/{index_name}_seg{segment_name}.pkl"
+
+
+@contextmanager
+def replacing(path):
+    """
+    Write a file atomically: yield a temporary path to write the file to, which
+    then replaces `path`, so readers never see a partially written file. The
+    temporary path is unique to the writer, so concurrent writers of the same file
+    (e.g. two processes saving an index) never write into each other's file; the
+    last one to finish wins. The temporary file is removed if writing fails.
+    """
+    temp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp"
+    try:
+        yield temp_path
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+def write_pickle(path, data, sync=True):
+    """
+    Write a pickle atomically, see `replacing`. Unless `sync` is False, the data is
+    synced to disk before the rename so that a crash cannot leave an empty file
+    behind either.
+    """
+    with replacing(path) as temp_path, open(temp_path, 'wb') as f:
+        pickle.dump(data, f)
+        if sync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def read_pickle(path):
+    with open(path, 'rb') as f:
+        return pickle.load(f)
+
+
+def live_count(segment, tombstones):
+    """
+    Count the documents of a segment that are not deleted.
+    """
+    size = segment['end'] - segment['start']
+    return (size - tombstones.count(DELETED, segment['start'], segment['end'])
+            - tombstones.count(PURGED, segment['start'], segment['end']))
+
+
+def size_tier(segment, tombstones):
+    """
+    Get the size tier of a segment: segments of 1-3 live documents are in tier 0,
+    4-15 in tier 1, 16-63 in tier 2, etc.
+    """
+    return int(log(max(live_count(segment, tombstones), 1), MERGE_FACTOR) + 1e-9)
+
+
+def select_merges(segments, tombstones, expunge_deletes=False):
+    """
+    Choose the segments to merge.
+    Runs of `MERGE_FACTOR` adjacent segments of the same size tier are merged, so
+    the number of segments grows logarithmically with the number of documents.
+    Segments with more than `EXPUNGE_RATIO` deleted documents (or any deleted
+    document when expunging) are rewritten on their own. Only adjacent segments
+    are merged, so every segment keeps covering a contiguous range of ordinals.
+
+    :param segments: The segment entries of the manifest, in ordinal order.
+    :param tombstones: The tombstones of the index.
+    :param expunge_deletes: Whether to rewrite every segment with deleted documents.
+    :return: A list of (first, last) positions of the runs of segments to merge.
+    """
+    runs = []
+    position = 0
+    while position < len(segments):
+        tier = size_tier(segments[position], tombstones)
+        end = position
+        while end < len(segments) and end - position < MERGE_FACTOR and size_tier(segments[end], tombstones) == tier:
+            end += 1
+        if end - position == MERGE_FACTOR:
+            runs.append((position, end - 1))
+            position = end
+            continue
+
+        segment = segments[position]
+        deleted = segment_deletes(segment, tombstones)
+        if deleted and (expunge_deletes or deleted > EXPUNGE_RATIO * (segment['end'] - segment['start'])):
+            runs.append((position, position))
+        position += 1
+    return runs
+
+
+def segment_deletes(segment, tombstones):
+    """
+    Count the deleted documents still present in the posting lists of a segment.
+    """
+    return tombstones.count(DELETED, segment['start'], segment['end'])
+
+
+def merge_segment_data(segments, tombstones):
+    """
+    Merge the contents of adjacent segments, dropping deleted documents.
+    The segments cover consecutive ranges of ordinals, so the posting lists of
+    each word are merged by concatenation. Deleted documents keep their ordinal
+    but lose their postings, and their tombstones are set to PURGED. Texts are in
+    the document store of the index; segments written before it existed also hold
+    theirs, which are only kept when every merged segment has them. The value
+    bitmaps of the filter columns are combined, without the deleted documents.
+
+    :param segments: The segment contents, in ordinal order.
+    :param tombstones: The tombstones of the index, updated in place.
+    :return: The contents of the merged segment.
+    """
+    merged = {
+        'start': segments[0]['start'],
+        'doc_ids': [],
+        'doc_lengths': array('I'),
+        'token_offsets': {},
+        'filters': {},
+        'index': {},
+        'term_freqs': {},
+        'positions': {},
+    }
+    if all('documents' in segment for segment in segments):
+        merged['documents'] = []
+    for segment in segments:
+        start = segment['start']
+        for i, doc_id in enumerate(segment['doc_ids']):
+            live = not tombstones[start + i]
+            merged['doc_ids'].append(doc_id if live else None)
+            merged['doc_lengths'].append(segment['doc_lengths'][i] if live else 0)
+            if 'documents' in merged:
+                merged['documents'].append(segment['documents'][i] if live else None)
+        merged['token_offsets'].update(
+            (ordinal, offsets) for ordinal, offsets in segment['token_offsets'].items() if not tombstones[ordinal]
+        )
+        for column, bitmaps in segment.get('filters', {}).items():
+            merged_bitmaps = merged['filters'].setdefault(column, {})
+            for value, bitmap in bitmaps.items():
+                merged_bitmaps[value] = merged_bitmaps[value] | bitmap if value in merged_bitmaps else bitmap
+
+        has_deletes = any(tombstones[start:start + len(segment['doc_ids'])])
+        for word, postings in segment['index'].items():
+            term_freqs = segment['term_freqs'][word]
+            positions = segment['positions'].get(word)
+            if has_deletes:
+                keep = [i for i, ordinal in enumerate(postings) if not tombstones[ordinal]]
+                if not keep:
+                    continue
+                postings = array('I', (postings[i] for i in keep))
+                term_freqs = array('I', (term_freqs[i] for i in keep))
+                if positions is not None:
+                    positions = [positions[i] for i in keep]
+            extend_postings(merged, word, postings, term_freqs, positions)
+
+    end = merged['start'] + len(merged['doc_ids'])
+    deleted = Bitmap.from_sorted([ordinal for ordinal in range(merged['start'], end) if tombstones[ordinal]])
+    if deleted:
+        for column, bitmaps in merged['filters'].items():
+            merged['filters'][column] = {value: bitmap - deleted for value, bitmap in bitmaps.items() if bitmap - deleted}
+
+    for ordinal in range(merged['start'], end):
+        if tombstones[ordinal] == DELETED:
+            tombstones[ordinal] = PURGED
+    return merged
+
+
+def extend_postings(target, word, postings, term_freqs, positions):
+    """
+    Append the postings of a word to the postings of a segment (or index) covering
+    the preceding ordinals.
+    """
+    if word not in target['index']:
+        target['index'][word] = array('I')
+        target['term_freqs'][word] = array('I')
+    target['index'][word].extend(postings)
+    target['term_freqs'][word].extend(term_freqs)
+    if positions is not None:
+        target['positions'].setdefault(word, []).extend(positions)
+
+
+def merge_segments(index_name, expunge_deletes=False):
+    """
+    Run one round of the merge policy (see `select_merges`) on the segments of an
+    index on disk. Merged segments are written to new files and swapped into the
+    manifest; the old files are removed once `SEGMENT_GRACE_SECONDS` have passed.
+    Callers must hold the write lock of the index.
+
+    :param index_name: The name of the index.
+    :param expunge_deletes: Whether to rewrite every segment with deleted documents.
+    :return: The number of merges done.
+    """
+    try:
+        manifest = read_pickle(manifest_file(index_name))
+    except FileNotFoundError:
+        return 0
+    if 'segments' not in manifest:
+        # index saved in the single file layout, it is split into segments on its next save
+        return 0
+
+    segments = manifest['segments']
+    tombstones = manifest['tombstones']
+    runs = select_merges(segments, tombstones, expunge_deletes)
+
+    now = time.time()
+    # merge right to left so that the positions of the remaining runs stay valid
+    for first, last in reversed(runs):
+        merged_entries = segments[first:last + 1]
+        merged = merge_segment_data(
+            [read_pickle(segment_file(index_name, entry['name'])) for entry in merged_entries],
+            tombstones
+        )
+        name = manifest['next_segment']
+        manifest['next_segment'] += 1
+        write_pickle(segment_file(index_name, name), merged)
+        segments[first:last + 1] = [{
+            'name': name,
+            'start': merged_entries[0]['start'],
+            'end': merged_entries[-1]['end'],
+        }]
+        manifest['obsolete'].extend((entry['name'], now) for entry in merged_entries)
+
+    expired = [name for name, obsoleted in manifest['obsolete'] if now - obsoleted >= SEGMENT_GRACE_SECONDS]
+    manifest['obsolete'] = [(name, obsoleted) for name, obsoleted in manifest['obsolete']
+                            if now - obsoleted < SEGMENT_GRACE_SECONDS]
+    if runs or expired:
+        write_pickle(manifest_file(index_name), manifest)
+    for name in expired:
+        try:
+            os.remove(segment_file(index_name, name))
+        except FileNotFoundError:
+            pass
+
+    if runs:
+        logging.info(f"Merged {sum(last - first + 1 for first, last in runs)} segments of index {index_name} into {len(runs)}")
+    return len(runs)
@@ -0,0 +1,463 @@
+import os
+import glob
+import heapq
+import zlib
+from itertools import chain, islice
+
+from services.text_search import TextSearch, PARALLEL_BUILD_MIN_DOCS
+from services.vector_search import VectorSearch, get_vector_search, embed_query
+from services.index_cache import get_text_search
+from services.segments import write_pickle, read_pickle, manifest_file
+from services.search_results import DEFAULT_FIELDS
+from services.workers import get_executor
+from services.generations import current_index_name
+
+
+def shard_map_file(index_id):
+    return f"data/{index_id}_shards.pkl"
+
+
+def shard_name(index_id, shard):
+    """
+    Get the name of the text and vector index files of a shard.
+    """
+    return f"{index_id}_shard{shard}"
+
+
+def shard_of(doc_id, shards):
+    """
+    Get the shard of a document. IDs are hashed as strings, so IDs read from a URL
+    and integer IDs read from the database land in the same shard.
+    """
+    return zlib.crc32(str(doc_id).encode()) % shards
+
+
+def shard_count(index_id):
+    """
+    Get the number of shards of an index, 1 for an index that is not sharded.
+    """
+    try:
+        return read_pickle(shard_map_file(index_id))['shards']
+    except FileNotFoundError:
+        return 1
+
+
+def shard_names(name):
+    """
+    Get the names of the text and vector indexes of the shards of an index.
+    """
+    shards = shard_count(name)
+    return [shard_name(name, shard) for shard in range(shards)] if shards > 1 else [name]
+
+
+def document_index_name(index_id, doc_id):
+    """
+    Get the name of the index holding a document in the current generation of a
+    search index: its shard for a sharded index.
+    """
+    name = current_index_name(index_id)
+    shards = shard_count(name)
+    if shards == 1:
+        return name
+    return shard_name(name, shard_of(doc_id, shards))
+
+
+def index_settings(name):
+    """
+    Get the settings an index was built with, see `build_index`.
+    """
+    manifest = read_pickle(manifest_file(shard_names(name)[0]))
+    return {**manifest.get('settings', {}), 'shards': shard_count(name)}
+
+
+def open_text_index(index_id, cached=False):
+    """
+    Open the text index of the current generation of a search index, sharded or not.
+
+    :param index_id: The ID of the search index.
+    :param cached: Whether to use an index kept in memory, see `index_cache.get_text_search`.
+    :return: A TextSearch or ShardedTextSearch instance.
+    """
+    name = current_index_name(index_id)
+    shards = shard_count(name)
+    if shards > 1:
+        return ShardedTextSearch(name, shards)
+    return get_text_search(name) if cached else TextSearch(index_file=name)
+
+
+def open_vector_index(index_id):
+    """
+    Open the vector index of the current generation of a search index, sharded or not.
+    """
+    name = current_index_name(index_id)
+    shards = shard_count(name)
+    if shards > 1:
+        return ShardedVectorSearch(name, shards)
+    return VectorSearch(file_id=name)
+
+
+def remove_index_files(index_id):
+    """
+    Remove every file of a search index: text and vector indexes of all its shards,
+    journals and caches.
+    """
+    for path in glob.glob(f"data/{glob.escape(index_id)}_*"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def build_index(index_id, settings, chunks, progress=None):
+    """
+    Build the text and vector indexes of a search index, sharded or not.
+    Documents are consumed one chunk at a time and fed to the text and vector
+    builders of their shard, so memory use does not depend on the size of the
+    source table. Rows are held back per shard until `PARALLEL_BUILD_MIN_DOCS` of
+    them are pending, so that the text analysis of every batch is split across the
+    worker processes (see `TextSearch.add_documents`) however the chunks divide
+    between shards. The texts are stored once per shard, in the
+    document store of the text index.
+
+    :param index_id: The name of the generation of the search index to build, see
+        `generations.generation_name`.
+    :param settings: The index settings, with the number of shards in 'shards'.
+    :param chunks: An iterable of lists of (doc_id, text) pairs, followed by the
+        values of the 'filter_columns' of the settings, e.g. from
+        `data_crud.stream_table_with_columns`.
+    :param progress: A function called with a stage ('rows_read', 'rows_indexed'
+        or 'rows_embedded') and a number of rows as chunks go through the build,
+        e.g. `Job.advance`; exceptions it raises stop the build.
+    :return: The number of documents indexed.
+    """
+    progress = progress or (lambda stage, count: None)
+    shards = settings['shards']
+    names = [shard_name(index_id, shard) for shard in range(shards)] if shards > 1 else [index_id]
+    text_indexes = [TextSearch(index_file=name, settings=settings) for name in names]
+    vector_indexes = [VectorSearch(file_id=name) for name in names]
+    # rows waiting to be indexed, by shard
+    pending = [[] for _ in names]
+
+    def index_shard(shard):
+        documents, pending[shard] = pending[shard], []
+        text_index = text_indexes[shard]
+        text_index.add_documents(documents)
+        progress('rows_indexed', len(documents))
+        # the vector index reads the texts from the document store of the text index
+        vector_indexes[shard].index_documents([(doc_id, text) for doc_id, text, *_ in documents],
+                                              [text_index.ordinals.get(doc_id) for doc_id, *_ in documents])
+        progress('rows_embedded', len(documents))
+
+    count = 0
+    for chunk in chunks:
+        progress('rows_read', len(chunk))
+        for row in chunk:
+            pending[shard_of(row[0], shards)].append(row)
+        for shard in range(len(names)):
+            if len(pending[shard]) >= PARALLEL_BUILD_MIN_DOCS:
+                index_shard(shard)
+        count += len(chunk)
+
+    for shard in range(len(names)):
+        if pending[shard]:
+            index_shard(shard)
+
+    for text_index, vector_index in zip(text_indexes, vector_indexes):
+        text_index.save_index()
+        if vector_index.index is not None:
+            vector_index.save_index(vector_index.vector_index_file, vector_index.doc_file, vector_index.embedding_file)
+
+    if shards > 1:
+        # written last, so that the index is only opened as sharded once every shard exists
+        write_pickle(shard_map_file(index_id), {'shards': shards})
+    return count
+
+
+def text_shard_stats(name, query, method):
+    return get_text_search(name).collection_stats(query, method)
+
+
+def search_text_shard(name, query, method, depth, fields, stats, filters=None, deadline=None):
+    text_search = get_text_search(name)
+    text_search.set_global_stats(stats)
+    try:
+        results = text_search.search(query, method, top_k=depth, fields=fields, filters=filters, deadline=deadline)
+        return results, deadline is not None and deadline.reached
+    finally:
+        text_search.set_global_stats(None)
+
+
+def iter_text_shard(name, query, method, fields, stats, filters=None):
+    """
+    Lazily produce every result of a query on a shard, in this process, see
+    `TextSearch.iter_search`. Matches are scored with the collection statistics
+    before this function returns; only the results are built as they are read.
+    """
+    text_search = get_text_search(name)
+    text_search.set_global_stats(stats)
+    try:
+        return text_search.iter_search(query, method, fields=fields, filters=filters)
+    finally:
+        text_search.set_global_stats(None)
+
+
+def autocomplete_text_shard(name, prefix, top_n):
+    return get_text_search(name).autocomplete(prefix, top_n=top_n)
+
+
+def facet_text_shard(name, query, method, columns, filters):
+    return get_text_search(name).facet_counts(query, method, columns, filters)
+
+
+def search_vector_shard(name, query, embedding, method, depth, fields, filters=None, deadline=None):
+    vector_search = get_vector_search(name)
+    if vector_search.index is None:
+        # no document hashed to this shard
+        return [], False
+    results = vector_search.search(query, method, top_k=depth, fields=fields, filters=filters, deadline=deadline,
+                                   embedding=embedding)
+    return results, deadline is not None and deadline.reached
+
+
+def iter_vector_shard(name, query, embedding, method, fields, filters=None):
+    """
+    Lazily produce every result of a query on a shard, in this process, see
+    `VectorSearch.iter_search`.
+    """
+    vector_search = get_vector_search(name)
+    if vector_search.index is None:
+        # no document hashed to this shard
+        return iter(())
+    return vector_search.iter_search(query, method, fields=fields, filters=filters, embedding=embedding)
+
+
+def merge_ranked(shard_results, top_k, offset, fields):
+    """
+    Merge the results of the shards, each sorted by descending score, into one page.
+    Shards are queried with `scored_fields`; the score is dropped again when it
+    was not requested.
+    """
+    depth = None if top_k is None else offset + top_k
+    return list(islice(iter_merge_ranked(shard_results, fields), offset, depth))
+
+
+def iter_merge_ranked(shard_results, fields):
+    """
+    Lazily merge the results of the shards, each sorted by descending score, see
+    `merge_ranked`. Only one result of each shard is held at a time.
+    """
+    merged = heapq.merge(*shard_results, key=lambda result: -result['score'])
+    if fields is None or 'score' in fields:
+        return merged
+    return ({field: value for field, value in result.items() if field != 'score'} for result in merged)
+
+
+def merge_unranked(shard_results, top_k, offset):
+    """
+    Merge the results of the shards of an unranked search into one page. Results
+    are ordered by shard and then in index order, so pages do not overlap.
+    """
+    depth = None if top_k is None else offset + top_k
+    return list(islice(chain(*shard_results), offset, depth))
+
+
+def merge_counts(shard_counts):
+    """
+    Sum the facet counts of the shards, see `TextSearch.count_values`.
+    """
+    totals = {}
+    for counts in shard_counts:
+        for column, values in counts.items():
+            column_totals = totals.setdefault(column, {})
+            for value, count in values.items():
+                column_totals[value] = column_totals.get(value, 0) + count
+    return {column: dict(sorted(values.items(), key=lambda item: (-item[1], item[0])))
+            for column, values in totals.items()}
+
+
+def scored_fields(fields):
+    """
+    Add the score to the requested result fields, to merge ranked results.
+    """
+    fields = fields or DEFAULT_FIELDS
+    return fields if 'score' in fields else fields + ('score',)
+
+
+class ShardedIndex:
+    """
+    An index split into shards by document ID hash, see `shard_of`.
+    Queries are scattered to the shards, which run in parallel in the worker
+    processes, and the per shard results gathered into one ranking; every shard
+    returns its first `offset + top_k` results so the merged page is exact.
+
+    :param index_id: The ID of the search index.
+    :param shards: The number of shards.
+    """
+
+    def __init__(self, index_id, shards):
+        self.index_id = index_id
+        self.shard_names = [shard_name(index_id, shard) for shard in range(shards)]
+
+    def scatter(self, function, *args):
+        """
+        Run a function on every shard in the worker processes.
+
+        :return: The result of each shard, in shard order.
+        """
+        executor = get_executor()
+        futures = [executor.submit(function, name, *args) for name in self.shard_names]
+        return [future.result() for future in futures]
+
+    def scatter_search(self, function, *args, deadline=None):
+        """
+        Run a search on every shard, see `scatter`. Each shard stops at the deadline
+        on its own and reports whether it did, in which case the deadline is
+        reached here too.
+
+        :return: The results of each shard, in shard order, see `label`.
+        """
+        outcomes = self.scatter(function, *args, deadline)
+        if any(reached for _, reached in outcomes):
+            deadline.reached = True
+        return self.label([results for results, _ in outcomes])
+
+    def label(self, shard_results):
+        """
+        Annotate the results of each shard before they are merged, lists or lazy
+        iterators; results are left as they are by default.
+        """
+        return shard_results
+
+    def search_batch(self, queries):
+        """
+        Evaluate many queries, see `search`. Each query stops at its own 'deadline'.
+        """
+        return [self.search(q['query'], method=q['method'], top_k=q.get('top_k'), offset=q.get('offset', 0),
+                            fields=q.get('fields'), filters=q.get('filter'), deadline=q.get('deadline'))
+                for q in queries]
+
+
+class ShardedTextSearch(ShardedIndex):
+    """
+    A sharded text index.
+    Ranked queries run in two rounds: the shards first report the document
+    frequencies of the query terms and their document counts and lengths, then
+    score their documents with the sums of these statistics, so IDF and average
+    document length are the same on every shard and scores are comparable.
+    """
+    SEARCH_METHODS = TextSearch.SEARCH_METHODS
+
+    def collection_stats(self, query, method):
+        """
+        Sum the statistics of the shards, see `TextSearch.collection_stats`.
+        """
+        stats = {'total_docs': 0, 'total_length': 0, 'doc_freqs': {}}
+        for shard_stats in self.scatter(text_shard_stats, query, method):
+            stats['total_docs'] += shard_stats['total_docs']
+            stats['total_length'] += shard_stats['total_length']
+            for word, doc_freq in shard_stats['doc_freqs'].items():
+                stats['doc_freqs'][word] = stats['doc_freqs'].get(word, 0) + doc_freq
+        return stats
+
+    def search(self, query, method='full_text', top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Run a query on every shard, see `TextSearch.search`. Filters only restrict
+        the documents scored: the collection statistics stay those of every document.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown text search method: {method}")
+
+        depth = None if top_k is None else offset + top_k
+        if method not in TextSearch.SCORE_METHODS:
+            shard_results = self.scatter_search(search_text_shard, query, method, depth, fields, None, filters,
+                                                deadline=deadline)
+            return merge_unranked(shard_results, top_k, offset)
+
+        stats = self.collection_stats(query, method)
+        shard_results = self.scatter_search(search_text_shard, query, method, depth, scored_fields(fields), stats,
+                                            filters, deadline=deadline)
+        return merge_ranked(shard_results, top_k, offset, fields)
+
+    def iter_search(self, query, method='full_text', fields=None, filters=None):
+        """
+        Lazily produce every result of a query, see `TextSearch.iter_search`. The
+        results of the shards are merged as they are read: by score for ranked
+        methods, shard after shard otherwise, as `search` orders them.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown text search method: {method}")
+
+        if method not in TextSearch.SCORE_METHODS:
+            return chain.from_iterable(self.label([iter_text_shard(name, query, method, fields, None, filters)
+                                                   for name in self.shard_names]))
+
+        stats = self.collection_stats(query, method)
+        return iter_merge_ranked(self.label([iter_text_shard(name, query, method, scored_fields(fields), stats, filters)
+                                             for name in self.shard_names]), fields)
+
+    def facet_counts(self, query, method='full_text', columns=(), filters=None):
+        """
+        Count the matches of a query by value of some filter columns, summed over
+        the shards, see `TextSearch.facet_counts`.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown text search method: {method}")
+        return merge_counts(self.scatter(facet_text_shard, query, method, columns, filters))
+
+    def autocomplete(self, prefix, top_n=10):
+        """
+        Suggest completions for a partially typed query, see `TextSearch.autocomplete`.
+        Each shard suggests its `top_n` most frequent completions, whose document
+        counts are summed across shards.
+        """
+        doc_counts = {}
+        for completions in self.scatter(autocomplete_text_shard, prefix, top_n):
+            for completion in completions:
+                doc_counts[completion['term']] = doc_counts.get(completion['term'], 0) + completion['doc_count']
+        top = heapq.nsmallest(top_n, doc_counts.items(), key=lambda item: (-item[1], item[0]))
+        return [{'term': term, 'doc_count': doc_count} for term, doc_count in top]
+
+
+class ShardedVectorSearch(ShardedIndex):
+    """
+    A sharded vector index. Similarity scores do not depend on other documents,
+    so the best results of the shards are merged as they are. Queries are embedded
+    once, here, and the shards are sent the embedding along with the query.
+    """
+    SEARCH_METHODS = VectorSearch.SEARCH_METHODS
+
+    def search(self, query, method='similarity', top_k=5, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Run a query on every shard, see `VectorSearch.search`.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown vector search method: {method}")
+
+        top_k = top_k or 5
+        shard_results = self.scatter_search(search_vector_shard, query, embed_query(query), method, offset + top_k,
+                                            scored_fields(fields), filters, deadline=deadline)
+        return merge_ranked(shard_results, top_k, offset, fields)
+
+    def iter_search(self, query, method='similarity', fields=None, filters=None):
+        """
+        Lazily produce every result of a query, best first, see
+        `VectorSearch.iter_search`. The results of the shards are merged by score as
+        they are read.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown vector search method: {method}")
+
+        embedding = embed_query(query)
+        return iter_merge_ranked(self.label([iter_vector_shard(name, query, embedding, method, scored_fields(fields),
+                                                               filters)
+                                             for name in self.shard_names]), fields)
+
+    def facet_counts(self, query, method='similarity', columns=(), filters=None):
+        """
+        Count the matches of a query by value of some filter columns, summed over
+        the shards, see `VectorSearch.facet_counts`. Only the text indexes of the
+        shards are read.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown vector search method: {method}")
+        return merge_counts(self.scatter(facet_text_shard, query, VectorSearch.MATCH_METHODS[method], columns, filters))
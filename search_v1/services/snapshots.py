@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import time
+import uuid
+import shutil
+import hashlib
+import tarfile
+
+from services.text_search import TextSearch
+from services.vector_search import VectorSearch, vector_journal_file
+from services.index_cache import index_locks
+from services.journal import journal_file
+from services.segments import manifest_file, segment_file, read_pickle
+from services.shards import shard_names, shard_map_file
+from services.sync import hashes_file
+from services.generations import current_index_name, generation_name, new_generation, swap_generation, remove_generation_files
+
+SNAPSHOT_FORMAT = 1
+
+# Size of the blocks files are copied in
+COPY_BLOCK_SIZE = 1 << 20
+
+# Files of the vector index of every shard, see `VectorSearch.__init__`
+VECTOR_FILES = ('_faiss.index', '_ids.pkl', '_text.txt', '_emb.npy')
+
+# Files of the document store of every shard, see `DocumentStore`
+STORE_FILES = ('_docs.bin', '_docs.idx')
+
+# Names of the index files in a snapshot: the file names without the index name
+FILE_NAME = re.compile(r"_[A-Za-z0-9_]+\.[a-z]+")
+INDEX_ID = re.compile(r"[A-Za-z0-9-]+")
+
+
+class SnapshotError(ValueError):
+    """
+    Raised when a snapshot archive is malformed or fails its checksums.
+    """
+
+
+def snapshot_files(index_name):
+    """
+    List the files of an index needed to serve it: shard map, text index manifests
+    and their live segments, document stores, vector indexes and sync hashes. Caches, journals and
+    merged segments are left out.
+    """
+    names = shard_names(index_name)
+    paths = [shard_map_file(index_name)] if len(names) > 1 else []
+    for name in names:
+        if os.path.exists(manifest_file(name)):
+            paths.append(manifest_file(name))
+            manifest = read_pickle(manifest_file(name))
+            paths.extend(segment_file(name, segment['name']) for segment in manifest.get('segments', []))
+        paths.extend(f"data/{name}{suffix}" for suffix in STORE_FILES + VECTOR_FILES
+                     if os.path.exists(f"data/{name}{suffix}"))
+    if os.path.exists(hashes_file(index_name)):
+        paths.append(hashes_file(index_name))
+    return paths
+
+
+def tar_header(name, size):
+    member = tarfile.TarInfo(name)
+    member.size = size
+    member.mtime = int(time.time())
+    return member.tobuf(tarfile.PAX_FORMAT)
+
+
+def tar_padding(size):
+    return b'\0' * (-size % tarfile.BLOCKSIZE)
+
+
+def tar_json(name, data):
+    payload = json.dumps(data, default=str).encode()
+    return tar_header(name, len(payload)) + payload + tar_padding(len(payload))
+
+
+def export_snapshot(index_id, metadata):
+    """
+    Stream a consistent snapshot of the current generation of a search index as a
+    tar archive, see `import_snapshot`.
+
+    The journals of the shards are checkpointed and every file of the index is
+    hard linked into a private directory while the index is locked, which only
+    takes a moment: index files are replaced rather than rewritten, so the links
+    keep the contents of the snapshot while writes go on. Document stores are the
+    exception, being appended to in place: their size is recorded with the link
+    and only that many bytes are exported. The archive holds
+    `snapshot.json` (format, search index metadata and file list), the index files,
+    and `checksums.json` with the SHA-256 of every file, computed as it is streamed.
+
+    :param index_id: The ID of the search index.
+    :param metadata: The search index fields, stored in the snapshot.
+    :return: A generator of the bytes of the archive.
+    """
+    index_name = current_index_name(index_id)
+    snapshot_dir = f"data/snapshot-{uuid.uuid4()}"
+    os.mkdir(snapshot_dir)
+    try:
+        members = []
+        with index_locks(shard_names(index_name)):
+            for name in shard_names(index_name):
+                if os.path.exists(journal_file(name)):
+                    TextSearch(index_file=name).save_index()
+                if os.path.exists(vector_journal_file(name)):
+                    vector_search = VectorSearch(file_id=name)
+                    vector_search.save_index(vector_search.vector_index_file, vector_search.doc_file,
+                                             vector_search.embedding_file)
+            for path in snapshot_files(index_name):
+                file_name = path[len(f"data/{index_name}"):]
+                link = os.path.join(snapshot_dir, file_name)
+                os.link(path, link)
+                members.append((file_name, link, os.path.getsize(link)))
+
+        yield tar_json('snapshot.json', {
+            'format': SNAPSHOT_FORMAT,
+            'index': metadata,
+            'files': [file_name for file_name, _, _ in members],
+        })
+
+        checksums = {}
+        for file_name, link, size in members:
+            digest = hashlib.sha256()
+            yield tar_header(file_name, size)
+            with open(link, 'rb') as f:
+                remaining = size
+                while remaining and (block := f.read(min(COPY_BLOCK_SIZE, remaining))):
+                    digest.update(block)
+                    remaining -= len(block)
+                    yield block
+            yield tar_padding(size)
+            checksums[file_name] = digest.hexdigest()
+
+        yield tar_json('checksums.json', {'sha256': checksums})
+        # end of archive marker
+        yield b'\0' * (2 * tarfile.BLOCKSIZE)
+    finally:
+        shutil.rmtree(snapshot_dir, ignore_errors=True)
+
+
+def import_snapshot(fileobj):
+    """
+    Import a snapshot written by `export_snapshot` as a new generation of its search
+    index. Files are written as they are read from the archive, so the index is
+    ready at the speed of a copy; the generation is only swapped in once every
+    file is written and synced and its checksum verified.
+
+    :param fileobj: A readable binary file object of the archive.
+    :return: The search index fields stored in the snapshot.
+    :raises SnapshotError: If the archive is malformed or a checksum does not match.
+    """
+    try:
+        tar = tarfile.open(fileobj=fileobj, mode='r|')
+    except tarfile.TarError as e:
+        raise SnapshotError(f"Not a snapshot archive: {e}") from e
+
+    with tar:
+        try:
+            return import_members(tar)
+        except tarfile.TarError as e:
+            raise SnapshotError(f"Malformed snapshot archive: {e}") from e
+
+
+def import_members(tar):
+    """
+    Import the members of a snapshot archive, see `import_snapshot`.
+    """
+    members = iter(tar)
+    first = next(members, None)
+    if first is None or first.name != 'snapshot.json':
+        raise SnapshotError("Not a snapshot archive: snapshot.json is missing")
+    header = json.load(tar.extractfile(first))
+    if header.get('format') != SNAPSHOT_FORMAT:
+        raise SnapshotError(f"Unsupported snapshot format: {header.get('format')}")
+    index_id = header['index'].get('global_id') or ''
+    if not INDEX_ID.fullmatch(index_id):
+        raise SnapshotError(f"Invalid search index ID: {index_id}")
+
+    generation = new_generation(index_id)
+    index_name = generation_name(index_id, generation)
+    try:
+        checksums = {}
+        expected = None
+        for member in members:
+            if member.name == 'checksums.json':
+                expected = json.load(tar.extractfile(member))['sha256']
+                break
+            if not member.isfile() or not FILE_NAME.fullmatch(member.name) or member.name not in header['files']:
+                raise SnapshotError(f"Unexpected file in snapshot: {member.name}")
+
+            digest = hashlib.sha256()
+            source = tar.extractfile(member)
+            with open(f"data/{index_name}{member.name}", 'wb') as f:
+                while block := source.read(COPY_BLOCK_SIZE):
+                    digest.update(block)
+                    f.write(block)
+                f.flush()
+                os.fsync(f.fileno())
+            checksums[member.name] = digest.hexdigest()
+
+        if expected is None:
+            raise SnapshotError("Incomplete snapshot: checksums.json is missing")
+        if set(checksums) != set(header['files']) or checksums != expected:
+            raise SnapshotError("Snapshot checksums do not match")
+    except BaseException:
+        remove_generation_files(index_id, generation)
+        raise
+
+    swap_generation(index_id, generation)
+    return header['index']
@@ -0,0 +1,124 @@
+import os
+import hashlib
+from itertools import chain
+
+from services.text_search import TextSearch
+from services.vector_search import VectorSearch
+from services.index_cache import index_locks
+from services.segments import write_pickle, read_pickle
+from services.shards import shard_count, shard_names, shard_of
+from services.generations import current_index_name
+
+
+def hashes_file(index_name):
+    return f"data/{index_name}_hashes.pkl"
+
+
+def content_hash(text, values=()):
+    """
+    Hash the text of a document and the values of its filter columns, to find the
+    rows whose contents changed when the source table has no update column.
+    """
+    contents = '\x1f'.join([text or ''] + ['' if value is None else str(value) for value in values])
+    return hashlib.blake2b(contents.encode(), digest_size=8).digest()
+
+
+def load_hashes(index_name, text_indexes):
+    """
+    Load the content hashes recorded by the previous sync of an index, or hash the
+    indexed documents before its first sync.
+    """
+    try:
+        return read_pickle(hashes_file(index_name))
+    except FileNotFoundError:
+        return {doc_id: content_hash(text_index.document_text(ordinal), text_index.document_attributes(ordinal))
+                for text_index in text_indexes for doc_id, ordinal in text_index.ordinals.items()}
+
+
+def sync_index(index_id, chunks, source_ids=None):
+    """
+    Apply the changes made to the source table of a search index since it was last
+    built or synced to the text and vector indexes of its current generation,
+    sharded or not. Changed rows
+    are upserted and the documents whose row is gone are deleted.
+
+    With `source_ids`, the chunks only hold the rows changed since the last sync
+    (see `data_crud.text_columns_query`) and are all upserted. Without, the chunks
+    hold every row of the table and only the rows whose content hash differs from
+    the one recorded by the previous sync are upserted.
+
+    The indexes are locked for the whole sync, so that no concurrent write is lost.
+
+    :param index_id: The ID of the search index.
+    :param chunks: An iterable of lists of (doc_id, text) pairs, followed by the
+        values of the filter columns of the index, see `shards.build_index`.
+    :param source_ids: An iterable of lists of the IDs of every row of the source
+        table, e.g. from `data_crud.stream_table_ids`, or None to compare contents.
+    :return: A dict with the number of documents 'upserted' and 'deleted', and the
+        names of the text indexes that need a segment merge in 'merge'.
+    """
+    index_name = current_index_name(index_id)
+    shards = shard_count(index_name)
+    names = shard_names(index_name)
+
+    with index_locks(names):
+        text_indexes = [TextSearch(index_file=name) for name in names]
+        vector_indexes = [VectorSearch(file_id=name) for name in names]
+
+        compare = source_ids is None
+        if compare:
+            hashes = load_hashes(index_name, text_indexes)
+            seen = set()
+
+        upserted = 0
+        for chunk in chunks:
+            if compare:
+                seen.update(row[0] for row in chunk)
+                digests = [content_hash(text, values) for _, text, *values in chunk]
+                changed = [i for i, (row, digest) in enumerate(zip(chunk, digests)) if hashes.get(row[0]) != digest]
+                hashes.update((chunk[i][0], digests[i]) for i in changed)
+                chunk = [chunk[i] for i in changed]
+
+            shard_documents = [[] for _ in names]
+            for row in chunk:
+                shard_documents[shard_of(row[0], shards)].append(row)
+            for text_index, vector_index, documents in zip(text_indexes, vector_indexes, shard_documents):
+                if documents:
+                    text_index.add_documents(documents)
+                    vector_index.upsert_documents([(doc_id, text) for doc_id, text, *_ in documents],
+                                                  [text_index.ordinals.get(doc_id) for doc_id, *_ in documents])
+            upserted += len(chunk)
+
+        if not compare:
+            seen = set(chain.from_iterable(source_ids))
+
+        deleted = 0
+        for text_index, vector_index in zip(text_indexes, vector_indexes):
+            gone = [doc_id for doc_id in text_index.ordinals if doc_id not in seen]
+            if not gone:
+                continue
+            deleted += text_index.delete_documents(gone)
+            vector_index.delete_documents(gone)
+            if compare:
+                for doc_id in gone:
+                    hashes.pop(doc_id, None)
+
+        for text_index, vector_index in zip(text_indexes, vector_indexes):
+            text_index.save_index()
+            if vector_index.index is not None:
+                vector_index.save_index(vector_index.vector_index_file, vector_index.doc_file, vector_index.embedding_file)
+
+        if compare:
+            write_pickle(hashes_file(index_name), hashes)
+        else:
+            # the hashes are only kept up to date by syncs comparing contents
+            try:
+                os.remove(hashes_file(index_name))
+            except FileNotFoundError:
+                pass
+
+        return {
+            'upserted': upserted,
+            'deleted': deleted,
+            'merge': [name for name, text_index in zip(names, text_indexes) if text_index.needs_merge()],
+        }
@@ -0,0 +1,195 @@
+import re
+import heapq
+from array import array
+from bisect import bisect_left
+import numpy as np
+
+from services.postings import iter_intersect
+
+# Sorts after every character, so prefix + PREFIX_END is an upper bound of all
+# terms starting with prefix
+PREFIX_END = chr(0x10FFFF)
+
+# Wildcard matching any number of characters in a term pattern, e.g. 'inv*2024'
+WILDCARD = '*'
+
+# Size of the character grams of the k-gram index, and the marker added around
+# terms so that grams also anchor the start and the end of a term
+KGRAM_SIZE = 3
+TERM_BOUNDARY = '$'
+
+
+def is_wildcard(word):
+    """
+    Check whether a query word is a wildcard pattern.
+    """
+    return WILDCARD in word
+
+
+def kgrams(text, k=KGRAM_SIZE):
+    """
+    Get the distinct k-character grams of a text.
+    """
+    return {text[i:i + k] for i in range(len(text) - k + 1)}
+
+
+def pattern_kgrams(pattern, k=KGRAM_SIZE):
+    """
+    Get the grams every term matching a wildcard pattern must contain, i.e. the
+    grams of the literal fragments of the pattern including the term boundaries.
+    """
+    fragments = f"{TERM_BOUNDARY}{pattern}{TERM_BOUNDARY}".split(WILDCARD)
+    return set().union(*(kgrams(fragment, k) for fragment in fragments))
+
+
+def compile_pattern(pattern):
+    """
+    Compile a wildcard pattern to a regular expression matching whole terms.
+    """
+    return re.compile('.*'.join(re.escape(fragment) for fragment in pattern.split(WILDCARD)), re.DOTALL)
+
+
+class KGramIndex:
+    """
+    Index of the character grams of a list of terms.
+    Each gram maps to the sorted positions of the terms containing it, so the
+    terms that may match a wildcard pattern are found by intersecting the
+    posting lists of the grams of the pattern.
+
+    :param terms: The terms, addressed by position.
+    :param k: The gram size.
+    """
+
+    def __init__(self, terms, k=KGRAM_SIZE):
+        self.k = k
+        self.grams = {}
+        for term_id, term in enumerate(terms):
+            for gram in kgrams(f"{TERM_BOUNDARY}{term}{TERM_BOUNDARY}", k):
+                postings = self.grams.get(gram)
+                if postings is None:
+                    postings = self.grams[gram] = array('I')
+                postings.append(term_id)
+
+    def candidates(self, pattern):
+        """
+        Find the terms that may match a wildcard pattern.
+
+        :return: A generator of sorted term positions, or None if the pattern has no
+            literal fragment long enough to select terms.
+        """
+        grams = pattern_kgrams(pattern, self.k)
+        if not grams:
+            return None
+        return iter_intersect([self.grams.get(gram, array('I')) for gram in grams])
+
+
+class TermDictionary:
+    """
+    Sorted term dictionary for prefix completion.
+
+    Terms are kept in a sorted list so that the terms sharing a prefix form one
+    contiguous range, found with two binary searches. A sparse table of the
+    positions of the highest document frequencies answers "most frequent term in
+    a range" in constant time, so the top N completions of a prefix are found in
+    O(N log N) regardless of how many terms share the prefix.
+
+    :param doc_freqs: A mapping of terms to the number of documents containing them.
+    """
+
+    def __init__(self, doc_freqs):
+        self.terms = sorted(doc_freqs)
+        self.doc_freqs = np.fromiter((doc_freqs[term] for term in self.terms),
+                                     dtype=np.int64, count=len(self.terms))
+
+        # level i holds, for each position, the position of the highest document
+        # frequency among the next 2**i terms
+        levels = [np.arange(len(self.terms), dtype=np.int32)]
+        width = 1
+        while 2 * width <= len(self.terms):
+            previous = levels[-1]
+            left, right = previous[:-width], previous[width:]
+            levels.append(np.where(self.doc_freqs[left] >= self.doc_freqs[right], left, right))
+            width *= 2
+        self.levels = levels
+        self._kgram_index = None
+
+    def __len__(self):
+        return len(self.terms)
+
+    def prefix_range(self, prefix):
+        """
+        Find the terms starting with a prefix.
+
+        :return: The (start, end) positions of the terms in `terms`.
+        """
+        start = bisect_left(self.terms, prefix)
+        end = bisect_left(self.terms, prefix + PREFIX_END, start)
+        return start, end
+
+    def most_frequent(self, start, end):
+        """
+        Find the position of the most frequent term in a non empty range of terms.
+        """
+        level = (end - start).bit_length() - 1
+        left = int(self.levels[level][start])
+        right = int(self.levels[level][end - (1 << level)])
+        return left if self.doc_freqs[left] >= self.doc_freqs[right] else right
+
+    def complete(self, prefix, top_n=10):
+        """
+        Find the most frequent terms starting with a prefix.
+        Ranges are split around their most frequent term and kept in a heap, so only
+        about 2 * top_n ranges are visited.
+
+        :param prefix: The prefix to complete.
+        :param top_n: The number of completions to return.
+        :return: A list of (term, document frequency) pairs, most frequent first and
+            alphabetically among equally frequent terms.
+        """
+        start, end = self.prefix_range(prefix)
+        heap = []
+
+        def push(start, end):
+            if start < end:
+                position = self.most_frequent(start, end)
+                heapq.heappush(heap, (-int(self.doc_freqs[position]), position, start, end))
+
+        push(start, end)
+        completions = []
+        while heap and len(completions) < top_n:
+            neg_freq, position, start, end = heapq.heappop(heap)
+            completions.append((self.terms[position], -neg_freq))
+            push(start, position)
+            push(position + 1, end)
+        return completions
+
+    def kgram_index(self):
+        """
+        Get the k-gram index of the terms, built on first use.
+        """
+        if self._kgram_index is None:
+            self._kgram_index = KGramIndex(self.terms)
+        return self._kgram_index
+
+    def expand(self, pattern, limit):
+        """
+        Find the terms matching a wildcard pattern, e.g. '*X42*' or 'inv*2024'.
+        A literal prefix restricts the search to the prefix range of the sorted terms,
+        other fragments to the terms containing all the grams of the pattern. The
+        candidates are then checked against the pattern.
+
+        :param pattern: The wildcard pattern.
+        :param limit: The maximum number of terms to return.
+        :return: The matching terms, most frequent first.
+        """
+        start, end = self.prefix_range(pattern.split(WILDCARD)[0])
+        candidates = self.kgram_index().candidates(pattern)
+        if candidates is None:
+            candidates = range(start, end)
+
+        regex = compile_pattern(pattern)
+        matches = [term_id for term_id in candidates
+                   if start <= term_id < end and regex.fullmatch(self.terms[term_id])]
+
+        top = heapq.nlargest(limit, matches, key=lambda term_id: (self.doc_freqs[term_id], -term_id))
+        return [self.terms[term_id] for term_id in top]
@@ -1,435 +1,1854 @@
-import os
-import pickle
-import numpy as np
-import logging
-from math import log
-from difflib import get_close_matches
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
-from fastapi import FastAPI, APIRouter, HTTPException, Depends
-from sqlalchemy.orm import Session
-from database.database import SessionLocal, engine, get_db
-from database import data_crud
-
-from dotenv import load_dotenv
-
-# Load environment variables from .env file
-load_dotenv()
-
-class TextSearch:
-    def __init__(self, index_file='data/index.pkl'):
-        self.index = {}
-        self.cache = {}
-        self.doc_lengths = {}
-        self.documents = {}
-        self.avg_doc_length = 0
-        self.cache_file = 'data/cache.pkl'
-        self.index_file = f"data/{index_file}_ivf.pkl"
-        self.load_cache()
-        self.load_index()
-        self.data = None
-
-    def add_document(self, doc_id, text):
-        self.documents[doc_id] = text
-        words = text.split()
-        self.doc_lengths[doc_id] = len(words)
-        for word in words:
-            if word not in self.index:
-                self.index[word] = set()
-            self.index[word].add(doc_id)
-        self.cache.clear() 
-        self.save_cache()
-        self.save_index()
-        self.update_avg_doc_length()
-
-
-
-    def add_data(self, table_name, text_columns, id_column, schema, db: Session = Depends(get_db)):
-        """
-        Adds data to the index by retrieving documents from the specified database table
-        and processing them.
-        Args:
-            table_name (str): The name of the database table to query.
-            text_columns (list): A list of column names containing text data to be indexed.
-            id_column (str): The name of the column containing unique identifiers for the documents.
-            schema (str): The schema name of the database table.
-            db (Session, optional): The database session dependency. Defaults to Depends(get_db).
-        Returns:
-            list: A list of documents retrieved from the database.
-        Raises:
-            HTTPException: If an error occurs while adding data to the index.
-        """
-        try:
-            # Retrieve data from the database
-            documents = data_crud.query_table_with_columns(
-                db=db,
-                table_name=table_name,
-                text_columns=text_columns,
-                id_column=id_column,
-                schema=schema
-            )
-
-            for doc in documents:
-                try:
-                    self.add_document(doc[0], doc[1])
-                except Exception as e:
-                    logging.info(f"Error processing document {doc}: {e}")
-
-            self.data = documents
-                
-            return documents
-        
-        except Exception as e:
-            logging.info(f"Error adding data to index: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
-
-    def boolean_search(self, query):
-        """
-        Perform a boolean search on the indexed documents.
-        This method takes a query string, splits it into individual words, and performs
-        an intersection search across the indexed documents to find matches for all words
-        in the query. If the query result is cached, it retrieves the result from the cache
-        to improve performance.
-        Args:
-            query (str): The search query containing one or more words.
-        Returns:
-            list[dict]: A list of dictionaries, where each dictionary contains:
-                - 'text' (str): The text of the matching document.
-                - 'id' (int): The ID of the matching document.
-        Notes:
-            - The method uses a cache to store results of previous queries for faster retrieval.
-            - If the query is empty, an empty list is returned.
-            - The cache is updated and saved after processing a new query.
-        """
-        
-        if query in self.cache:
-            return [self.documents[doc_id] for doc_id in self.cache[query]]
-
-        query_words = query.split()
-        if not query_words:
-            return []
-
-        result = self.index.get(query_words[0], set())
-        for word in query_words[1:]:
-            result = result.intersection(self.index.get(word, set()))
-
-        self.cache[query] = result
-        self.save_cache()
-
-        return [{'text': self.documents[doc_id], 'id': doc_id}  for doc_id in result]
-    
-
-    def compute_tf_idf(self, query):
-        query_words = query.split()
-        if not query_words:
-            return {}
-
-        tf = {}
-        for word in query_words:
-            tf[word] = tf.get(word, 0) + 1
-
-        idf = {}
-        total_docs = len(set(doc_id for docs in self.index.values() for doc_id in docs))
-        for word in query_words:
-            doc_count = len(self.index.get(word, set()))
-            idf[word] = log((total_docs + 1) / (doc_count + 1)) + 1
-
-        tf_idf = {word: tf[word] * idf[word] for word in query_words}
-
-        return tf_idf
-    
-
-    def ranked_search(self, query):
-        """
-        Perform a ranked search on the indexed documents based on the given query.
-        This method computes the TF-IDF scores for the query terms, calculates the
-        relevance scores for each document containing the query terms, and returns
-        the documents ranked by their scores in descending order.
-        Args:
-            query (str): The search query string.
-        Returns:
-            list[dict]: A list of dictionaries representing the ranked search results.
-                        Each dictionary contains:
-                            - 'text' (str): The content of the document.
-                            - 'score' (float): The relevance score of the document.
-                            - 'id' (int): The unique identifier of the document.
-        Notes:
-            - If the query is empty, an empty list is returned.
-            - The method assumes that `self.index` is a dictionary mapping words to
-              document IDs and `self.documents` is a dictionary mapping document IDs
-              to their content.
-            - The `compute_tf_idf` method is expected to return a dictionary mapping
-              query words to their TF-IDF scores.
-        """
-
-        tf_idf = self.compute_tf_idf(query)
-        
-        query_words = query.split()
-        if not query_words:
-            return []
-
-        doc_scores = {}
-        
-        for word in query_words:
-            if word in self.index:
-                for doc_id in self.index[word]:
-                    doc_scores[doc_id] = doc_scores.get(doc_id, 0) + tf_idf[word]
-
-        ranked_results = sorted(doc_scores.items(), key=lambda item: item[1], reverse=True)
-
-        return [{
-                'text': self.documents[doc_id],
-                'score': score,
-                'id': doc_id
-            } 
-            for doc_id, score in ranked_results]
-    
-
-    def boolean_ranked_search(self, query):
-        """
-        Perform a boolean and ranked search on the indexed documents.
-        This method first performs a boolean search to find documents that match 
-        all the words in the query. It then ranks the boolean-selected documents 
-        using a TF-IDF scoring mechanism.
-        Args:
-            query (str): The search query containing one or more words.
-        Returns:
-            list[dict]: A list of dictionaries representing the ranked search results. 
-                        Each dictionary contains:
-                            - 'text' (str): The content of the document.
-                            - 'score' (float): The TF-IDF score of the document.
-                            - 'id' (int): The document ID.
-        Notes:
-            - If the query is found in the cache, the cached results are returned directly.
-            - If the query is empty or no documents match, an empty list is returned.
-            - The ranking is performed only on documents that match the boolean search criteria.
-        """
-
-
-        # boolean search
-        if query in self.cache: # if query is in cache, return the documents
-            return [self.documents[doc_id] for doc_id in self.cache[query]]
-
-        query_words = query.split()
-        if not query_words:
-            return []
-
-        result = self.index.get(query_words[0], set())
-        for word in query_words[1:]:
-            result = result.intersection(self.index.get(word, set()))
-
-        # Perform ranked search on the boolean-selected documents
-        query_words_initial = query.split()
-        if not query_words_initial:
-            return []
-
-        # Filter query words to include only those present in the boolean-selected documents
-        filtered_query_words = [word for word in query_words if word in self.index and self.index[word] & result]
-        tf_idf = self.compute_tf_idf(" ".join(filtered_query_words))
-    
-
-        doc_scores = {}
-        
-        for word in filtered_query_words:
-            for doc_id in result:  # Use only boolean-selected documents
-                for word in filtered_query_words:
-                    if word in self.index:
-                        doc_scores[doc_id] = doc_scores.get(doc_id, 0) + tf_idf[word]
-        
-        ranked_results = sorted(doc_scores.items(), key=lambda item: item[1], reverse=True)
-
-        return [{
-                'text': self.documents[doc_id],
-                'score': score,
-                'id': doc_id
-            } 
-                for doc_id, score in ranked_results]
-    
-
-    def boolean_bm25_search(self, query, k1=1.5, b=0.75):
-        """
-        Perform a combined Boolean and BM25 search on the indexed documents.
-        This method first performs a Boolean search to narrow down the set of documents
-        that contain all the words in the query. Then, it applies the BM25 ranking algorithm
-        to score and rank the selected documents based on their relevance to the query.
-        Args:
-            query (str): The search query string containing one or more words.
-            k1 (float, optional): The BM25 term frequency saturation parameter. Default is 1.5.
-            b (float, optional): The BM25 length normalization parameter. Default is 0.75.
-        Returns:
-            list[dict]: A list of dictionaries representing the ranked search results. Each dictionary
-            contains the following keys:
-                - 'text' (str): The text of the document.
-                - 'score' (float): The BM25 relevance score of the document.
-                - 'id' (int): The document ID.
-        Notes:
-            - The method assumes that the `self.index` is a dictionary mapping words to sets of document IDs.
-            - The `self.documents` is a dictionary mapping document IDs to their text content.
-            - The `self.doc_lengths` is a dictionary mapping document IDs to their lengths.
-            - The `self.avg_doc_length` is the average length of all documents.
-            - The `self.cache` is used to store results of previous queries for faster retrieval.
-        """
-
-        # boolean search
-        if query in self.cache:
-            return [self.documents[doc_id] for doc_id in self.cache[query]]
-
-        query_words = query.split()
-        if not query_words:
-            return []
-
-        result = self.index.get(query_words[0], set())
-        for word in query_words[1:]:
-            result = result.intersection(self.index.get(word, set()))
-
-        # Perform BM25 scoring on the boolean-selected documents
-        total_docs = len(self.doc_lengths)
-        avg_doc_length = self.avg_doc_length
-
-        idf = {}
-        for word in query_words:
-            doc_count = len(self.index.get(word, set()))
-            idf[word] = log((total_docs - doc_count + 0.5) / (doc_count + 0.5) + 1)
-
-        doc_scores = {}
-        for word in query_words:
-            if word in self.index:
-                for doc_id in result:  # Use only boolean-selected documents
-                    tf = self.documents[doc_id].split().count(word)
-                    score = idf[word] * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * (self.doc_lengths[doc_id] / avg_doc_length)))
-                    doc_scores[doc_id] = doc_scores.get(doc_id, 0) + score
-
-        ranked_results = sorted(doc_scores.items(), key=lambda item: item[1], reverse=True)
-
-        return [{'text': self.documents[doc_id], 'score': score, 'id': doc_id} for doc_id, score in ranked_results]
-    
-
-    def bm25_search(self, query, k1=1.5, b=0.75):
-        """
-        Perform a BM25 search on the indexed documents using the given query.
-        BM25 is a ranking function used by search engines to estimate the relevance
-        of documents to a given search query. This implementation calculates the
-        BM25 score for each document based on term frequency, inverse document
-        frequency, and document length normalization.
-        Args:
-            query (str): The search query string.
-            k1 (float, optional): Term frequency saturation parameter. Default is 1.5.
-            b (float, optional): Length normalization parameter. Default is 0.75.
-        Returns:
-            list[dict]: A list of dictionaries containing the search results, where
-            each dictionary has the following keys:
-                - 'text' (str): The text of the document.
-                - 'score' (float): The BM25 score of the document.
-                - 'id' (int): The document ID.
-        Notes:
-            - The `self.index` is expected to be a dictionary where keys are words
-              and values are sets of document IDs containing those words.
-            - The `self.doc_lengths` is expected to be a dictionary mapping document
-              IDs to their respective lengths.
-            - The `self.avg_doc_length` is expected to be the average length of all
-              documents.
-            - The `self.documents` is expected to be a dictionary mapping document
-              IDs to their respective text content.
-        """
-
-        query_words = query.split()
-        if not query_words:
-            return []
-
-        total_docs = len(self.doc_lengths)
-        avg_doc_length = self.avg_doc_length
-
-        idf = {}
-        for word in query_words:
-            doc_count = len(self.index.get(word, set()))
-            idf[word] = log((total_docs - doc_count + 0.5) / (doc_count + 0.5) + 1)
-
-        doc_scores = {}
-        for word in query_words:
-            if word in self.index:
-                for doc_id in self.index[word]:
-                    tf = self.doc_lengths[doc_id]
-                    score = idf[word] * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * (self.doc_lengths[doc_id] / avg_doc_length)))
-                    doc_scores[doc_id] = doc_scores.get(doc_id, 0) + score
-
-        ranked_results = sorted(doc_scores.items(), key=lambda item: item[1], reverse=True)
-        
-        return [{'text': self.documents[doc_id], 'score': score, 'id': doc_id }  for doc_id, score in ranked_results]
-    
-
-    def fuzzy_search(self, query, max_distance=2):
-        """
-        Perform a fuzzy search on the indexed documents based on the given query.
-        This method splits the query into individual words and finds close matches
-        for each word in the index using a fuzzy matching algorithm. It then retrieves
-        the documents associated with the matched words.
-        Args:
-            query (str): The search query string to perform the fuzzy search on.
-            max_distance (int, optional): The maximum edit distance for fuzzy matching.
-                Defaults to 2. (Note: This parameter is not currently used in the implementation.)
-        Returns:
-            list: A list of dictionaries, where each dictionary contains:
-                - 'text' (str): The text of the matched document.
-                - 'id' (int): The ID of the matched document.
-        Note:
-            - The method uses `get_close_matches` from the `difflib` module to perform
-              fuzzy matching.
-            - If the query is empty, an empty list is returned.
-        """
-
-        query_words = query.split()
-        if not query_words:
-            return []
-
-        matched_docs = set()
-        for word in query_words:
-            close_matches = get_close_matches(word, self.index.keys(), n=5, cutoff=0.8)
-            for match in close_matches:
-                if match in self.index:
-                    matched_docs.update(self.index[match])
-
-        return [{'text': self.documents[doc_id], 'id': doc_id}  for doc_id in matched_docs]
-    
-
-    def update_avg_doc_length(self):
-        total_length = sum(self.doc_lengths.values())
-        self.avg_doc_length = total_length / len(self.doc_lengths) if self.doc_lengths else 0
-
-    def save_cache(self):
-        with open(self.cache_file, 'wb') as f:
-            pickle.dump(self.cache, f)
-
-    def load_cache(self):
-        try:
-            with open(self.cache_file, 'rb') as f:
-                self.cache = pickle.load(f)
-        except (FileNotFoundError, EOFError):
-            self.cache = {}
-
-    def save_index(self):
-        try:
-            with open(self.index_file, 'wb') as f:
-                pickle.dump({
-                    'index': self.index,
-                    'doc_lengths': self.doc_lengths,
-                    'documents': self.documents,
-                    'avg_doc_length': self.avg_doc_length
-                }, f)
-        except Exception as e:
-            logging.error(f"Error saving index to file {self.index_file}: {e}")
-
-    def load_index(self):
-        try:
-            with open(self.index_file, 'rb') as f:
-                data = pickle.load(f)
-                self.index = data.get('index', {})
-                self.doc_lengths = data.get('doc_lengths', {})
-                self.documents = data.get('documents', {})
-                self.avg_doc_length = data.get('avg_doc_length', 0)
-
-        except (FileNotFoundError, EOFError):
-            self.index = {}
-            self.doc_lengths = {}
-            self.documents = {}
-            self.avg_doc_length = 0
-
+import os
+import pickle
+import numpy as np
+import logging
+from array import array
+from bisect import bisect_left
+from math import log
+from difflib import get_close_matches
+from fastapi import FastAPI, APIRouter, HTTPException, Depends
+from sqlalchemy.orm import Session
+from database.database import SessionLocal, engine, get_db
+from database import data_crud
+
+from services.search_results import ranked_page, unranked_page, iter_ranked, make_result
+from services.query_parser import QueryPlanner, QueryParseError, parse_query, positive_words, analyze_query_tree
+from services.analyzer import Analyzer
+from services.postings import intersect, locate, union, difference
+from services.positions import encode_positions, decode_positions, min_span, match_positions
+from services.term_dictionary import TermDictionary, is_wildcard
+from services.segments import (
+    SEGMENT_BUFFER_SIZE, LIVE, DELETED, segment_file, write_pickle, read_pickle,
+    extend_postings, select_merges
+)
+from services.journal import Journal, journal_file
+from services.workers import WORKER_PROCESSES, get_executor
+from services.document_store import DocumentStore
+from services.bitmaps import Bitmap
+from services.filters import parse_filter, filter_columns, evaluate_filter
+from services.deadlines import bounded, expired
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+# Number of tokens in a result snippet
+SNIPPET_WINDOW = 24
+
+# Version of the layout of the pickled index, see `write_manifest`
+INDEX_FORMAT = 5
+
+# Weight of the BM25 proximity boost given to documents whose query words are
+# close together, see `proximity_boosts`
+PROXIMITY_WEIGHT = 1.0
+
+# Default maximum number of terms a wildcard query word expands to, see `wildcard_expansion`
+MAX_EXPANSIONS = 64
+
+EMPTY_POSTINGS = array('I')
+
+# Below this number of documents, documents are analyzed in process rather than
+# in the worker processes, see `add_documents`
+PARALLEL_BUILD_MIN_DOCS = 10000
+
+
+def document_store_path(index_name):
+    """
+    Get the path of the document store of an index, shared by its text and vector indexes.
+    """
+    return f"data/{index_name}_docs"
+
+
+def analyze_document(analyzer, text):
+    """
+    Analyze the text of a document for indexing.
+    Returns:
+        tuple: A mapping of each term to its token positions, and the start and end
+            character offsets of every token.
+    """
+    word_positions = {}
+    offsets = array('I')
+    for position, word, start, end in analyzer.tokens(text):
+        word_positions.setdefault(word, []).append(position)
+        offsets.append(start)
+        offsets.append(end)
+    return word_positions, offsets
+
+
+def group_ordinals(codes, start=0):
+    """
+    Group documents by the code of their value of a filter column.
+    Args:
+        codes (numpy.ndarray): The value code of each document, -1 for no value.
+        start (int): The ordinal of the first document.
+    Returns:
+        generator: (code, sorted ordinals) pairs, documents without a value left out.
+    """
+    order = np.argsort(codes, kind='stable')
+    codes, starts = np.unique(codes[order], return_index=True)
+    ends = np.append(starts[1:], len(order))
+    for code, first, end in zip(codes.tolist(), starts.tolist(), ends.tolist()):
+        if code >= 0:
+            yield code, order[first:end] + start
+
+
+def build_run(settings, documents, start):
+    """
+    Index a run of documents on its own, see `TextSearch.add_documents`.
+    Documents that cannot be analyzed are logged and skipped.
+    Args:
+        settings (dict): The index settings.
+        documents (list): (doc_id, text, *filter column values) tuples.
+        start (int): The ordinal of the first document.
+    Returns:
+        dict: The run, laid out like a segment (see `segments.merge_segment_data`).
+    """
+    analyzer = Analyzer.from_settings(settings.get('analyzer'))
+    store_offsets = settings.get('store_offsets')
+    store_positions = settings.get('store_positions')
+    run = {
+        'start': start,
+        'doc_ids': [],
+        'doc_lengths': array('I'),
+        'documents': [],
+        'attributes': [],
+        'token_offsets': {},
+        'index': {},
+        'term_freqs': {},
+        'positions': {},
+    }
+    index, term_freqs = run['index'], run['term_freqs']
+    for doc_id, text, *values in documents:
+        try:
+            word_positions, offsets = analyze_document(analyzer, text)
+        except Exception as e:
+            logging.info(f"Error processing document {doc_id}: {e}")
+            continue
+
+        ordinal = start + len(run['doc_ids'])
+        run['doc_ids'].append(doc_id)
+        run['documents'].append(text)
+        run['attributes'].append(values)
+        run['doc_lengths'].append(len(offsets) // 2)
+        if store_offsets:
+            run['token_offsets'][ordinal] = offsets
+        for word, positions in word_positions.items():
+            postings = index.get(word)
+            if postings is None:
+                postings = index[word] = array('I')
+                term_freqs[word] = array('I')
+                if store_positions:
+                    run['positions'][word] = []
+            postings.append(ordinal)
+            term_freqs[word].append(len(positions))
+            if store_positions:
+                run['positions'][word].append(encode_positions(positions))
+    return run
+
+
+def shift_run(run, start):
+    """
+    Renumber the ordinals of a run to start at another ordinal.
+    """
+    delta = start - run['start']
+    return dict(
+        run,
+        start=start,
+        token_offsets={ordinal + delta: offsets for ordinal, offsets in run['token_offsets'].items()},
+        index={word: array('I', (ordinal + delta for ordinal in postings)) for word, postings in run['index'].items()},
+    )
+
+
+class TextSearch:
+    # Maps the public search method names (as used by the search endpoints)
+    # to the TextSearch method implementing them.
+    SEARCH_METHODS = {
+        'ranked_naive': 'ranked_search',
+        'full_text': 'bm25_search',
+        'boolean_ranked': 'boolean_ranked_search',
+        'boolean_bm25': 'boolean_bm25_search',
+        'exact': 'boolean_search',
+        'fuzzy': 'fuzzy_search',
+    }
+
+    # Maps the ranked search methods to the TextSearch method scoring their matches.
+    SCORE_METHODS = {
+        'ranked_naive': 'ranked_scores',
+        'full_text': 'bm25_scores',
+        'boolean_ranked': 'boolean_ranked_scores',
+        'boolean_bm25': 'boolean_bm25_scores',
+    }
+
+    def __init__(self, index_file='data/index.pkl', settings=None):
+        self.index = {}
+        # per word, the term frequency and (optionally) the encoded token positions
+        # of each document of its posting list, in posting list order
+        self.term_freqs = {}
+        self.positions = {}
+        self.settings = dict(settings or {})
+        self.token_offsets = {}
+        self.cache = {}
+        self._idf_cache = {}
+        self._term_dictionary = None
+        self._expansion_cache = {}
+        # documents are numbered by ordinals in insertion order; postings, lengths
+        # and texts are all addressed by ordinal
+        self.doc_ids = []
+        self.ordinals = {}
+        self.doc_lengths = array('I')
+        # texts are kept in the document store of the index, shared with its vector
+        # index; texts not stored yet (buffered documents, and documents of indexes
+        # saved before the store existed) are held here by ordinal, see `document_text`
+        self.documents = {}
+        self.stored = 0
+        # the values of the filter columns (the 'filter_columns' setting) of every
+        # document, by ordinal: each distinct value of a column is given an integer
+        # code, -1 standing for no value. Filters are evaluated on the per value
+        # bitmaps built from the codes on first use, see `filter_bitmaps`
+        self.attribute_codes = {}
+        self.attribute_values = {}
+        self._attribute_lookup = {}
+        self._filter_bitmaps = None
+        self._filter_cache = {}
+        # deleted documents keep their ordinal: the tombstone of every ordinal is
+        # set once it is deleted, and the ordinals still present in the posting
+        # lists are filtered out of results until their segment is merged
+        self.tombstones = bytearray()
+        self.pending_deletes = array('I')
+        self._live_ordinals = None
+        self.total_length = 0
+        self.avg_doc_length = 0
+        # statistics of the whole collection when this index is one shard of it,
+        # see `set_global_stats`
+        self.global_stats = None
+        # the index is saved as immutable segment files listed in a manifest; documents
+        # from ordinal `flushed` on are only buffered in memory, see `flush`
+        self.segments = []
+        self.next_segment = 0
+        self.obsolete = []
+        self.flushed = 0
+        self._buffered_words = set()
+        self.index_name = index_file
+        # changes made since the manifest was written, see `load_index`
+        self.journal = Journal(journal_file(index_file))
+        self.cache_file = f"data/{index_file}_cache.pkl"
+        self.index_file = f"data/{index_file}_ivf.pkl"
+        self.load_index()
+        # the analyzer is part of the index settings, so it is known once the index is loaded
+        self.analyzer = Analyzer.from_settings(self.settings.get('analyzer'))
+        self.store = DocumentStore(path=document_store_path(index_file), compression=self.settings.get('doc_compression'))
+        if not self.replay_journal():
+            self.load_cache()
+
+    def add_document(self, doc_id, text, values=()):
+        """
+        Add a document to the index, replacing the document with the same ID if any.
+        The change is appended to the journal and the document is buffered in memory,
+        then flushed to disk as a new segment once `SEGMENT_BUFFER_SIZE` documents are
+        buffered; call `commit` or `save_index` to make the change durable.
+        `values` are the values of the filter columns of the document, in the order
+        of the 'filter_columns' setting.
+        """
+        self.journal.append(('add', doc_id, text, *values))
+        self.index_document(doc_id, text, values)
+        self.invalidate()
+        if len(self.doc_ids) - self.flushed >= SEGMENT_BUFFER_SIZE:
+            self.flush()
+
+    def update_document(self, doc_id, text, attributes=None):
+        """
+        Replace the text of a document and commit the change. The old version is
+        tombstoned and the new one is indexed under a new ordinal and appended to the
+        journal, so the work depends on the size of the document rather than the size
+        of the index.
+        Args:
+            attributes (dict, optional): The values of the filter columns of the
+                document, by column; columns left out have no value.
+        Returns:
+            bool: True if the document was in the index, False if it was added.
+        """
+        existed = doc_id in self.ordinals
+        attributes = attributes or {}
+        self.add_document(doc_id, text, tuple(attributes.get(column) for column in self.attribute_codes))
+        self.commit()
+        return existed
+
+    def delete_document(self, doc_id):
+        """
+        Delete a document from the index and commit the change.
+        The document is tombstoned and filtered out of search results; its postings
+        and text are dropped when its segment is merged, see `segments.select_merges`.
+        Returns:
+            bool: True if the document was deleted, False if it was not in the index.
+        """
+        if not self.tombstone(doc_id):
+            return False
+        self.journal.append(('delete', doc_id))
+        self.invalidate()
+        self.commit()
+        return True
+
+    def commit(self):
+        """
+        Make the changes appended to the journal durable, with a single fsync.
+        """
+        self.journal.commit()
+
+    def resolve_doc_id(self, doc_id):
+        """
+        Find the stored ID of a document given as a string, e.g. from a URL.
+        Documents indexed from integer ID columns are stored under integer IDs.
+        """
+        if doc_id not in self.ordinals and doc_id.lstrip('-').isdigit() and int(doc_id) in self.ordinals:
+            return int(doc_id)
+        return doc_id
+
+    def tombstone(self, doc_id):
+        """
+        Mark the current version of a document as deleted.
+        Its length is taken out of the total right away so that the average document
+        length and the document count used for scoring only cover live documents.
+        Returns:
+            bool: True if the document was in the index.
+        """
+        ordinal = self.ordinals.pop(doc_id, None)
+        if ordinal is None:
+            return False
+        self.tombstones[ordinal] = DELETED
+        self.pending_deletes.insert(bisect_left(self.pending_deletes, ordinal), ordinal)
+        self.total_length -= self.doc_lengths[ordinal]
+        return True
+
+    def index_document(self, doc_id, text, values=()):
+        """
+        Index a document in the in-memory buffer, see `add_document`.
+        """
+        self.tombstone(doc_id)
+        ordinal = len(self.doc_ids)
+        self.doc_ids.append(doc_id)
+        self.ordinals[doc_id] = ordinal
+        self.documents[ordinal] = text
+        self.tombstones.append(LIVE)
+        self.record_attributes(values)
+
+        word_positions, offsets = analyze_document(self.analyzer, text)
+        self.doc_lengths.append(len(offsets) // 2)
+        self.total_length += len(offsets) // 2
+        if self.settings.get('store_offsets'):
+            self.token_offsets[ordinal] = offsets
+
+        store_positions = self.settings.get('store_positions')
+        for word, positions in word_positions.items():
+            postings = self.index.get(word)
+            if postings is None:
+                postings = self.index[word] = array('I')
+                self.term_freqs[word] = array('I')
+                if store_positions:
+                    self.positions[word] = []
+            # ordinals only grow, so appending keeps the posting list sorted
+            postings.append(ordinal)
+            self.term_freqs[word].append(len(positions))
+            if store_positions:
+                self.positions[word].append(encode_positions(positions))
+            self._buffered_words.add(word)
+
+    def invalidate(self):
+        """
+        Drop everything derived from the index contents after a change.
+        """
+        self.cache.clear()
+        self._idf_cache.clear()
+        self._term_dictionary = None
+        self._expansion_cache.clear()
+        self._live_ordinals = None
+        self._filter_bitmaps = None
+        self._filter_cache.clear()
+        self.update_avg_doc_length()
+
+    def flush(self):
+        """
+        Write the buffered documents to disk as a new immutable segment and record it
+        in the manifest. The postings of the buffered documents are the tails of the
+        in-memory posting lists, since buffered documents have the highest ordinals.
+        Returns:
+            bool: True if a segment was written.
+        """
+        start = self.flushed
+        if start == len(self.doc_ids):
+            return False
+
+        self.store_documents()
+        segment = {
+            'start': start,
+            'doc_ids': self.doc_ids[start:],
+            'doc_lengths': self.doc_lengths[start:],
+            'token_offsets': {ordinal: offsets for ordinal, offsets in self.token_offsets.items() if ordinal >= start},
+            'filters': self.value_bitmaps(start),
+            'index': {},
+            'term_freqs': {},
+            'positions': {},
+        }
+        for word in self._buffered_words:
+            postings = self.index.get(word)
+            if postings is None:
+                continue
+            i = bisect_left(postings, start)
+            segment['index'][word] = postings[i:]
+            segment['term_freqs'][word] = self.term_freqs[word][i:]
+            if word in self.positions:
+                segment['positions'][word] = self.positions[word][i:]
+
+        name = self.next_segment
+        write_pickle(segment_file(self.index_name, name), segment)
+        self.segments.append({'name': name, 'start': start, 'end': len(self.doc_ids)})
+        self.next_segment += 1
+        self.flushed = len(self.doc_ids)
+        self._buffered_words = set()
+        self.write_manifest()
+        return True
+
+    def store_documents(self):
+        """
+        Append the texts held in memory to the document store, so that the store holds
+        the text of every ordinal written to a segment.
+        """
+        end = len(self.doc_ids)
+        if self.stored == end:
+            return
+        self.store.append_documents((self.documents.get(ordinal) for ordinal in range(self.stored, end)), self.stored)
+        for ordinal in range(self.stored, end):
+            self.documents.pop(ordinal, None)
+        self.stored = end
+
+    def document_text(self, ordinal):
+        """
+        Get the text of a document, read from the document store unless it is held
+        in memory.
+        """
+        if ordinal in self.documents:
+            return self.documents[ordinal]
+        return self.store.fetch(ordinal)
+
+    def init_attributes(self):
+        """
+        Set up the value codes of the filter columns of the index settings.
+        """
+        for column in self.settings.get('filter_columns') or []:
+            self.attribute_codes[column] = array('i')
+            self.attribute_values[column] = []
+            self._attribute_lookup[column] = {}
+
+    def attribute_code(self, column, value):
+        """
+        Get the code of a value of a filter column, giving the next code to a new
+        value. Values are compared as strings; None is no value.
+        """
+        if value is None:
+            return -1
+        value = str(value)
+        code = self._attribute_lookup[column].get(value)
+        if code is None:
+            code = self._attribute_lookup[column][value] = len(self.attribute_values[column])
+            self.attribute_values[column].append(value)
+        return code
+
+    def record_attributes(self, values):
+        """
+        Record the values of the filter columns of the next document, in the order
+        of the 'filter_columns' setting. Missing values are no value.
+        """
+        for i, (column, codes) in enumerate(self.attribute_codes.items()):
+            codes.append(self.attribute_code(column, values[i] if i < len(values) else None))
+
+    def document_attributes(self, ordinal):
+        """
+        Get the values of the filter columns of a document, in the order of the
+        'filter_columns' setting.
+        """
+        return tuple(self.attribute_values[column][codes[ordinal]] if codes[ordinal] >= 0 else None
+                     for column, codes in self.attribute_codes.items())
+
+    def value_bitmaps(self, start=0):
+        """
+        Build the bitmap of the documents with each value of each filter column,
+        from ordinal `start` on.
+        Returns:
+            dict: A dict of bitmaps by value, by column.
+        """
+        return {
+            column: {self.attribute_values[column][code]: Bitmap.from_sorted(ordinals)
+                     for code, ordinals in group_ordinals(np.frombuffer(codes, dtype=np.int32)[start:], start)}
+            for column, codes in self.attribute_codes.items()
+        }
+
+    def filter_bitmaps(self):
+        """
+        Get the bitmaps of the values of the filter columns, see `value_bitmaps`,
+        built on first use.
+        """
+        if self._filter_bitmaps is None:
+            self._filter_bitmaps = self.value_bitmaps()
+        return self._filter_bitmaps
+
+    def filter_ordinals(self, filters):
+        """
+        Find the documents matching a filter expression on the filter columns, e.g.
+        `status:open (category:books OR category:music)`, see `filters.FilterParser`.
+        Deleted documents are not removed: searches drop them as usual. Results
+        are cached per expression until the index changes.
+        Args:
+            filters (str): The filter expression, or None.
+        Returns:
+            Bitmap: The ordinals of the matching documents, or None without a filter.
+        Raises:
+            QueryParseError: If the expression is not well formed or refers to a
+                column that is not a filter column of the index.
+        """
+        if not filters:
+            return None
+        if filters in self._filter_cache:
+            return self._filter_cache[filters]
+
+        node = parse_filter(filters)
+        if node is None:
+            return None
+        self.check_filter_columns(filter_columns(node))
+
+        bitmaps = self.filter_bitmaps()
+        result = evaluate_filter(
+            node,
+            lambda column, value: bitmaps[column].get(value, Bitmap()),
+            lambda: Bitmap.from_sorted(np.arange(len(self.doc_ids)))
+        )
+        self._filter_cache[filters] = result
+        return result
+
+    def check_filter_columns(self, columns):
+        """
+        Check that columns are filter columns of the index.
+        Raises:
+            QueryParseError: If one of the columns is not a filter column of the index.
+        """
+        unknown = set(columns) - set(self.attribute_codes)
+        if unknown:
+            raise QueryParseError(f"Not a filter column of the index: {', '.join(sorted(unknown))}")
+
+    def match_ordinals(self, query, method='full_text', allowed=None):
+        """
+        Find every document a search method matches, without scoring it: the
+        documents matching the boolean query for the boolean methods, those
+        containing a query word for the other ranked methods, and the close matches
+        for fuzzy search.
+        Args:
+            query (str): The search query string.
+            method (str): The public name of the search method, e.g. 'full_text', or
+                None for every document.
+            allowed (Bitmap, optional): The documents of a filter, see `filter_ordinals`.
+        Returns:
+            numpy.ndarray: The ordinals of the matching live documents.
+        Raises:
+            ValueError: If the method is not a known text search method.
+        """
+        if method is None:
+            ordinals = np.frombuffer(self.all_ordinals(), dtype=np.uint32)
+        elif method in ('exact', 'boolean_ranked', 'boolean_bm25'):
+            ordinals = np.frombuffer(self.boolean_ordinals(query), dtype=np.uint32)
+        elif method == 'fuzzy':
+            return np.fromiter(self.fuzzy_match(query, allowed=allowed), dtype=np.uint32)
+        elif method in self.SEARCH_METHODS:
+            postings = [np.frombuffer(self.index[word], dtype=np.uint32)
+                        for word in self.expand_words(self.query_terms(query)) if word in self.index]
+            ordinals = np.unique(np.concatenate(postings)) if postings else np.zeros(0, dtype=np.uint32)
+            ordinals = ordinals[np.frombuffer(self.tombstones, dtype=np.uint8)[ordinals] == 0]
+        else:
+            raise ValueError(f"Unknown text search method: {method}")
+
+        if allowed is not None:
+            ordinals = ordinals[allowed.mask(ordinals)]
+        return ordinals
+
+    def count_values(self, ordinals, columns):
+        """
+        Count some documents by value of some filter columns. The value codes of the
+        documents are gathered from the code arrays of the columns and counted with
+        `numpy.bincount`, so the documents themselves are never read.
+        Args:
+            ordinals (numpy.ndarray): The ordinals of the documents.
+            columns (list): The filter columns to count the values of.
+        Returns:
+            dict: The number of documents with each value, most frequent first, by
+                column. Documents without a value are not counted.
+        Raises:
+            QueryParseError: If a column is not a filter column of the index.
+        """
+        self.check_filter_columns(columns)
+        counts = {}
+        for column in columns:
+            values = self.attribute_values[column]
+            codes = np.frombuffer(self.attribute_codes[column], dtype=np.int32)[ordinals]
+            # shifted by one so that documents without a value (-1) land in bin 0
+            totals = np.bincount(codes + 1, minlength=len(values) + 1)[1:]
+            counted = [(values[code], int(totals[code])) for code in np.flatnonzero(totals).tolist()]
+            counts[column] = dict(sorted(counted, key=lambda item: (-item[1], item[0])))
+        return counts
+
+    def facet_counts(self, query, method='full_text', columns=(), filters=None):
+        """
+        Count the documents matching a query by value of some filter columns, over
+        every match of the query rather than a page of results, see `match_ordinals`
+        and `count_values`.
+        Args:
+            query (str): The search query string.
+            method (str): The public name of the search method, e.g. 'full_text'.
+            columns (list): The filter columns to count the values of.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+        Returns:
+            dict: The number of matches with each value, by column.
+        """
+        self.check_filter_columns(columns)
+        ordinals = self.match_ordinals(query, method, allowed=self.filter_ordinals(filters))
+        return self.count_values(ordinals, columns)
+
+    def filtered_postings(self, word, allowed=None):
+        """
+        Get the posting list of a word and the term frequencies along it, restricted
+        to the documents of a filter (see `filter_ordinals`) when one is given, so
+        that filtered out documents are never scored.
+        Returns:
+            tuple: The ordinals and their term frequencies.
+        """
+        postings, term_freqs = self.index[word], self.term_freqs[word]
+        if allowed is None:
+            return postings, term_freqs
+        kept = np.flatnonzero(allowed.mask(np.frombuffer(postings, dtype=np.uint32)))
+        return (np.frombuffer(postings, dtype=np.uint32)[kept].tolist(),
+                np.frombuffer(term_freqs, dtype=np.uint32)[kept].tolist())
+
+    def needs_merge(self):
+        """
+        Check whether the merge policy has segments to merge, see `segments.select_merges`.
+        """
+        return bool(select_merges(self.segments, self.tombstones))
+
+    def drop_deleted(self, doc_scores):
+        """
+        Remove the deleted documents from a mapping of scores, in place.
+        """
+        if len(self.pending_deletes) < len(doc_scores):
+            for ordinal in self.pending_deletes:
+                doc_scores.pop(ordinal, None)
+        else:
+            for ordinal in [ordinal for ordinal in doc_scores if self.tombstones[ordinal]]:
+                del doc_scores[ordinal]
+        return doc_scores
+
+    def add_data(self, table_name, text_columns, id_column, schema, db: Session = Depends(get_db)):
+        """
+        Adds data to the index by streaming documents from the specified database table
+        and processing them one chunk at a time.
+        Args:
+            table_name (str): The name of the database table to query.
+            text_columns (list): A list of column names containing text data to be indexed.
+            id_column (str): The name of the column containing unique identifiers for the documents.
+            schema (str): The schema name of the database table.
+            db (Session, optional): The database session dependency. Defaults to Depends(get_db).
+        Returns:
+            int: The number of documents retrieved from the database.
+        Raises:
+            HTTPException: If an error occurs while adding data to the index.
+        """
+        try:
+            # Stream data from the database
+            chunks = data_crud.stream_table_with_columns(
+                db=db,
+                table_name=table_name,
+                text_columns=text_columns,
+                id_column=id_column,
+                schema=schema
+            )
+
+            count = 0
+            for chunk in chunks:
+                self.add_documents(chunk)
+                count += len(chunk)
+
+            self.save_index()
+
+            return count
+        
+        except Exception as e:
+            logging.info(f"Error adding data to index: {e}")
+            raise HTTPException(status_code=500, detail=str(e))
+
+    def add_documents(self, documents):
+        """
+        Index many documents at once, e.g. when an index is built.
+        The documents are split into consecutive runs analyzed in parallel by the
+        worker processes (see `workers.get_executor`), each producing the sorted postings, lengths and
+        term frequencies of its run (see `build_run`). Runs cover consecutive
+        ordinals, so merging them is a concatenation of their posting lists in run
+        order. The documents are buffered like with `add_document`, and flushed as
+        a new segment once `SEGMENT_BUFFER_SIZE` documents are buffered, so a build
+        fed chunk by chunk never holds more than a segment of texts in memory.
+        They are not journaled: call `save_index` to persist the last of them.
+        Args:
+            documents (iterable): (doc_id, text) pairs, followed by the values of the
+                filter columns in the order of the 'filter_columns' setting.
+        """
+        documents = list(documents)
+        start = len(self.doc_ids)
+        if WORKER_PROCESSES < 2 or len(documents) < PARALLEL_BUILD_MIN_DOCS:
+            self.add_run(build_run(self.settings, documents, start))
+            return
+
+        run_size = -(-len(documents) // WORKER_PROCESSES)
+        executor = get_executor()
+        builds = [executor.submit(build_run, self.settings, documents[i:i + run_size], start + i)
+                  for i in range(0, len(documents), run_size)]
+        # runs are merged in order, so the ordinals of each run follow the previous one
+        for build in builds:
+            self.add_run(build.result())
+
+    def delete_documents(self, doc_ids):
+        """
+        Delete many documents at once, e.g. when an index is synced with its source
+        table. Like with `add_documents` the deletes are not journaled: call
+        `save_index` to persist them.
+        Args:
+            doc_ids (iterable): The IDs of the documents to delete.
+        Returns:
+            int: The number of documents deleted.
+        """
+        deleted = sum(self.tombstone(doc_id) for doc_id in doc_ids)
+        if deleted:
+            self.invalidate()
+        return deleted
+
+    def add_run(self, run):
+        """
+        Append a run of documents indexed by `build_run` to the in-memory index.
+        Documents already in the index (or repeated in the run) are replaced.
+        """
+        start = len(self.doc_ids)
+        if run['start'] != start:
+            # documents of a previous run were skipped, see `build_run`
+            run = shift_run(run, start)
+
+        self.doc_ids.extend(run['doc_ids'])
+        self.documents.update(zip(range(start, start + len(run['documents'])), run['documents']))
+        for values in run['attributes']:
+            self.record_attributes(values)
+        self.doc_lengths.extend(run['doc_lengths'])
+        self.token_offsets.update(run['token_offsets'])
+        self.tombstones.extend(bytes(len(run['doc_ids'])))
+        self.total_length += sum(run['doc_lengths'])
+        for ordinal, doc_id in enumerate(run['doc_ids'], start):
+            self.tombstone(doc_id)
+            self.ordinals[doc_id] = ordinal
+
+        target = {'index': self.index, 'term_freqs': self.term_freqs, 'positions': self.positions}
+        for word, postings in run['index'].items():
+            extend_postings(target, word, postings, run['term_freqs'][word], run['positions'].get(word))
+        self._buffered_words.update(run['index'])
+        self.invalidate()
+        if len(self.doc_ids) - self.flushed >= SEGMENT_BUFFER_SIZE:
+            self.flush()
+
+    def postings(self, word):
+        """
+        Get the sorted ordinals of the documents containing a word, or any of the
+        expansions of a wildcard pattern.
+        """
+        if is_wildcard(word):
+            return self.wildcard_expansion(word)[1]
+        return self.index.get(word, EMPTY_POSTINGS)
+
+    def wildcard_expansion(self, pattern):
+        """
+        Expand a wildcard pattern to the indexed terms matching it, see
+        `TermDictionary.expand`. At most `settings['max_expansions']` terms are
+        kept, the most frequent ones. Expansions are memoized per instance.
+        Returns:
+            tuple: The matching terms and the merged postings of the terms.
+        """
+        if pattern not in self._expansion_cache:
+            limit = self.settings.get('max_expansions') or MAX_EXPANSIONS
+            terms = self.term_dictionary().expand(pattern, limit)
+            self._expansion_cache[pattern] = (terms, union([self.index[term] for term in terms]))
+        return self._expansion_cache[pattern]
+
+    def expand_words(self, words):
+        """
+        Replace the wildcard patterns in a list of query words by their expansions,
+        so that they are scored like the terms they match.
+        """
+        expanded = []
+        for word in words:
+            if is_wildcard(word):
+                expanded.extend(self.wildcard_expansion(word)[0])
+            else:
+                expanded.append(word)
+        return expanded
+
+    def all_ordinals(self):
+        """
+        Get the sorted ordinals of all live documents.
+        """
+        if self._live_ordinals is None:
+            self._live_ordinals = array('I', (ordinal for ordinal, dead in enumerate(self.tombstones) if not dead))
+        return self._live_ordinals
+
+    def iter_term_positions(self, word, ordinals):
+        """
+        Get the token positions of a word in some documents.
+        Positions are read from the positional postings when the index stores them,
+        otherwise the documents are tokenized again.
+        Args:
+            word (str): The word.
+            ordinals (array): Sorted ordinals of documents.
+        Returns:
+            iterator: (ordinal, positions) pairs for the documents containing the word.
+        """
+        if is_wildcard(word):
+            return self.iter_wildcard_positions(word, ordinals)
+        if word in self.positions:
+            encoded = self.positions[word]
+            return ((ordinal, decode_positions(encoded[i]))
+                    for ordinal, i in locate(self.postings(word), ordinals))
+        return ((ordinal, [position for position, term, _, _ in self.analyzer.tokens(self.document_text(ordinal))
+                           if term == word])
+                for ordinal, _ in locate(self.postings(word), ordinals))
+
+    def iter_wildcard_positions(self, pattern, ordinals):
+        """
+        Get the token positions of any expansion of a wildcard pattern in some
+        documents, see `iter_term_positions`.
+        """
+        doc_positions = {}
+        for term in self.wildcard_expansion(pattern)[0]:
+            for ordinal, positions in self.iter_term_positions(term, ordinals):
+                doc_positions.setdefault(ordinal, []).extend(positions)
+        return ((ordinal, sorted(doc_positions[ordinal])) for ordinal in sorted(doc_positions))
+
+    def match_phrase(self, phrase, candidates):
+        """
+        Keep the candidate documents containing the words of a phrase next to each other,
+        or for a proximity phrase ('"a b"~N'), within N other words of each other.
+        Positions are merged from the positional postings, so documents are not read
+        when the index stores positions.
+        Args:
+            phrase (Phrase): The phrase node of a parsed query.
+            candidates (array): Sorted ordinals of documents containing all the phrase words.
+        Returns:
+            array: The sorted ordinals of the documents containing the phrase.
+        """
+        words = list(dict.fromkeys(phrase.words)) if phrase.slop else phrase.words
+        doc_positions = {ordinal: [] for ordinal in candidates}
+        for word in words:
+            for ordinal, positions in self.iter_term_positions(word, candidates):
+                doc_positions[ordinal].append(positions)
+
+        return array('I', (ordinal for ordinal, position_lists in doc_positions.items()
+                           if len(position_lists) == len(words)
+                           and match_positions(position_lists, phrase.slop, phrase.offsets)))
+
+    def parse_query(self, query):
+        """
+        Parse a boolean query and run its words through the index analyzer.
+        Returns:
+            The root node of the query tree, or None if the query has no terms.
+        Raises:
+            QueryParseError: If the query is not well formed.
+        """
+        return analyze_query_tree(parse_query(query), self.analyzer.analyze_query)
+
+    def query_terms(self, query):
+        """
+        Get the analyzed terms of a plain (non boolean) query, in order.
+        """
+        return [term for _, term in self.analyzer.analyze_query(query)]
+
+    def query_planner(self):
+        """
+        Create a planner evaluating parsed boolean queries against this index.
+        """
+        return QueryPlanner(self.postings, self.all_ordinals, self.match_phrase)
+
+    def boolean_ordinals(self, query):
+        """
+        Find the ordinals of the documents matching a boolean query.
+        The query supports AND, OR and NOT (or a leading '-'), parentheses and quoted
+        phrases; words without an operator between them must all match. Results are
+        cached per query string.
+        Args:
+            query (str): The boolean query.
+        Returns:
+            array: The sorted ordinals of the matching documents.
+        Raises:
+            QueryParseError: If the query is not well formed.
+        """
+        if query in self.cache:
+            return self.cache[query]
+
+        result = difference(self.query_planner().execute(self.parse_query(query)), self.pending_deletes)
+
+        # kept in memory, the cache is only written by `save_index`
+        self.cache[query] = result
+
+        return result
+
+    def boolean_match(self, query):
+        """
+        Find the IDs of the documents matching a boolean query, see `boolean_ordinals`.
+        Args:
+            query (str): The boolean query.
+        Returns:
+            list: The IDs of the matching documents, in index order.
+        """
+        return [self.doc_ids[ordinal] for ordinal in self.boolean_ordinals(query)]
+
+    def iter_boolean_match(self, query):
+        """
+        Lazily yield the ordinals of the documents matching a boolean query.
+        Conjunctions of words are intersected as they are consumed, so no
+        intermediate result is built. The result is not cached.
+        Args:
+            query (str): The boolean query.
+        Returns:
+            iterator: The ordinals of the matching documents, in index order.
+        Raises:
+            QueryParseError: If the query is not well formed.
+        """
+        if query in self.cache:
+            return iter(self.cache[query])
+
+        node = self.parse_query(query)
+        if node is None:
+            return iter(())
+        matches = self.query_planner().iterate(node)
+        if self.pending_deletes:
+            return (ordinal for ordinal in matches if not self.tombstones[ordinal])
+        return matches
+
+    def boolean_search(self, query, top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Perform a boolean search on the indexed documents.
+        This method parses the boolean query (see `boolean_ordinals`) and evaluates it
+        against the inverted index, intersecting the shortest posting lists first. If the
+        query result is cached, it retrieves the result from the cache to improve performance.
+        Args:
+            query (str): The boolean query, e.g. 'invoice AND (2023 OR 2024) NOT draft'.
+            top_k (int, optional): The page size. All matches are returned when None.
+            offset (int, optional): The number of matches to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+            deadline (Deadline, optional): Not checked: matches are not scored, and posting
+                lists are intersected in one go.
+        Returns:
+            list[dict]: A list of dictionaries, where each dictionary contains:
+                - 'text' (str): The text of the matching document.
+                - 'id' (int): The ID of the matching document.
+        Notes:
+            - The method uses a cache to store results of previous queries for faster retrieval.
+            - If the query is empty, an empty list is returned.
+            - The cache is updated and saved after processing a new query.
+            - Matches are returned in index order.
+        """
+        
+        result = self.boolean_ordinals(query)
+        allowed = self.filter_ordinals(filters)
+        if allowed is not None:
+            result = allowed.select(result)
+
+        return [self.format_result(ordinal, None, fields, query)
+                for ordinal in unranked_page(result, top_k, offset)]
+    
+
+    def compute_tf_idf(self, query):
+        query_words = query.split()
+        if not query_words:
+            return {}
+
+        tf = {}
+        for word in query_words:
+            tf[word] = tf.get(word, 0) + 1
+
+        tf_idf = {word: tf[word] * self.tf_idf_idf(word) for word in query_words}
+
+        return tf_idf
+    
+
+    def ranked_search(self, query, top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Perform a ranked search on the indexed documents based on the given query.
+        This method computes the TF-IDF scores for the query terms, calculates the
+        relevance scores for each document containing the query terms, and returns
+        the documents ranked by their scores in descending order.
+        Args:
+            query (str): The search query string.
+            top_k (int, optional): The page size. All matches are returned when None.
+            offset (int, optional): The number of matches to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+        Returns:
+            list[dict]: A list of dictionaries representing the ranked search results.
+                        Each dictionary contains:
+                            - 'text' (str): The content of the document.
+                            - 'score' (float): The relevance score of the document.
+                            - 'id' (int): The unique identifier of the document.
+        Notes:
+            - If the query is empty, an empty list is returned.
+            - The method assumes that `self.index` is a dictionary mapping words to
+              document IDs and the texts of the documents are read with
+              `document_text`.
+            - The `compute_tf_idf` method is expected to return a dictionary mapping
+              query words to their TF-IDF scores.
+        """
+
+        doc_scores = self.ranked_scores(query, allowed=self.filter_ordinals(filters), deadline=deadline)
+
+        ranked_results = ranked_page(doc_scores.items(), top_k, offset)
+
+        return [self.format_result(ordinal, score, fields, query)
+                for ordinal, score in ranked_results]
+
+    def ranked_scores(self, query, allowed=None, deadline=None):
+        """
+        Compute the TF-IDF score of every document containing a query word, among
+        the documents of a filter when `allowed` is given (see `filter_ordinals`).
+        Scoring stops once `deadline` passes, keeping the scores so far.
+        Returns:
+            dict: A mapping of document ordinals to their scores.
+        """
+        query_words = self.expand_words(self.query_terms(query))
+        if not query_words:
+            return {}
+
+        tf_idf = self.compute_tf_idf(" ".join(query_words))
+
+        doc_scores = {}
+        
+        for word in query_words:
+            if word in self.index:
+                for ordinal in bounded(self.filtered_postings(word, allowed)[0], deadline):
+                    doc_scores[ordinal] = doc_scores.get(ordinal, 0) + tf_idf[word]
+
+        return self.drop_deleted(doc_scores)
+    
+
+    def boolean_ranked_search(self, query, top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Perform a boolean and ranked search on the indexed documents.
+        This method first performs a boolean search to find documents that match 
+        the boolean query. It then ranks the boolean-selected documents 
+        using a TF-IDF scoring mechanism over the words they contain.
+        Args:
+            query (str): The boolean query, see `boolean_ordinals`.
+            top_k (int, optional): The page size. All matches are returned when None.
+            offset (int, optional): The number of matches to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+        Returns:
+            list[dict]: A list of dictionaries representing the ranked search results. 
+                        Each dictionary contains:
+                            - 'text' (str): The content of the document.
+                            - 'score' (float): The TF-IDF score of the document.
+                            - 'id' (int): The document ID.
+        Notes:
+            - If the query is found in the cache, the cached boolean matches are ranked.
+            - If the query is empty or no documents match, an empty list is returned.
+            - The ranking is performed only on documents that match the boolean search criteria.
+        """
+
+        doc_scores = self.boolean_ranked_scores(query, allowed=self.filter_ordinals(filters), deadline=deadline)
+
+        ranked_results = ranked_page(doc_scores.items(), top_k, offset)
+
+        return [self.format_result(ordinal, score, fields, query)
+                for ordinal, score in ranked_results]
+
+    def boolean_ranked_scores(self, query, allowed=None, deadline=None):
+        """
+        Compute the TF-IDF score of every document matching a boolean query, among
+        the documents of a filter when `allowed` is given (see `filter_ordinals`).
+        Documents are scored on the non-negated query words they contain.
+        Scoring stops once `deadline` passes, keeping the scores so far.
+        Returns:
+            dict: A mapping of document ordinals to their scores.
+        """
+
+        # boolean search
+        result = self.boolean_ordinals(query)
+        if allowed is not None:
+            result = allowed.select(result)
+        if not result:
+            return {}
+
+        # Perform ranked search on the boolean-selected documents
+        query_words = [word for word in self.expand_words(positive_words(self.parse_query(query))) if word in self.index]
+        tf_idf = self.compute_tf_idf(" ".join(query_words))
+
+        doc_scores = {}
+        
+        for word in set(query_words):
+            for ordinal in bounded(intersect(result, self.index[word]), deadline):  # Use only boolean-selected documents
+                doc_scores[ordinal] = doc_scores.get(ordinal, 0) + tf_idf[word]
+        
+        return doc_scores
+    
+
+    def boolean_bm25_search(self, query, k1=1.5, b=0.75, top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Perform a combined Boolean and BM25 search on the indexed documents.
+        This method first performs a Boolean search to narrow down the set of documents
+        that match the boolean query. Then, it applies the BM25 ranking algorithm
+        to score and rank the selected documents based on their relevance to the query.
+        Args:
+            query (str): The boolean query, see `boolean_ordinals`.
+            k1 (float, optional): The BM25 term frequency saturation parameter. Default is 1.5.
+            b (float, optional): The BM25 length normalization parameter. Default is 0.75.
+            top_k (int, optional): The page size. All matches are returned when None.
+            offset (int, optional): The number of matches to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+        Returns:
+            list[dict]: A list of dictionaries representing the ranked search results. Each dictionary
+            contains the following keys:
+                - 'text' (str): The text of the document.
+                - 'score' (float): The BM25 relevance score of the document.
+                - 'id' (int): The document ID.
+        Notes:
+            - The method assumes that the `self.index` is a dictionary mapping words to sorted document ordinals.
+            - The document texts are read by ordinal with `document_text`.
+            - The `self.doc_lengths` is an array of the document lengths, by ordinal.
+            - The `self.avg_doc_length` is the average length of all documents.
+            - The `self.cache` is used to store results of previous queries for faster retrieval.
+        """
+
+        doc_scores = self.boolean_bm25_scores(query, k1, b, allowed=self.filter_ordinals(filters), deadline=deadline)
+
+        ranked_results = ranked_page(doc_scores.items(), top_k, offset)
+
+        return [self.format_result(ordinal, score, fields, query) for ordinal, score in ranked_results]
+
+    def boolean_bm25_scores(self, query, k1=1.5, b=0.75, allowed=None, deadline=None):
+        """
+        Compute the BM25 score of every document matching a boolean query, among
+        the documents of a filter when `allowed` is given (see `filter_ordinals`).
+        Documents are scored on the non-negated query words they contain.
+        Scoring stops once `deadline` passes, keeping the scores so far.
+        Returns:
+            dict: A mapping of document ordinals to their scores.
+        """
+
+        # boolean search
+        result = self.boolean_ordinals(query)
+        if allowed is not None:
+            result = allowed.select(result)
+        if not result:
+            return {}
+
+        query_words = self.expand_words(positive_words(self.parse_query(query)))
+
+        # Perform BM25 scoring on the boolean-selected documents
+        avg_doc_length = self.avg_doc_length
+        if not avg_doc_length:
+            # every document is deleted, only their postings are left until a merge
+            return {}
+
+        idf = {word: self.bm25_idf(word) for word in query_words}
+
+        doc_scores = {}
+        for word in query_words:
+            if word in self.index:
+                term_freqs = self.term_freqs[word]
+                for ordinal, i in bounded(locate(self.index[word], result), deadline):  # Use only boolean-selected documents
+                    tf = term_freqs[i]
+                    score = idf[word] * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * (self.doc_lengths[ordinal] / avg_doc_length)))
+                    doc_scores[ordinal] = doc_scores.get(ordinal, 0) + score
+
+        self.add_proximity_boosts(doc_scores, query_words, deadline)
+        return doc_scores
+    
+
+    def bm25_search(self, query, k1=1.5, b=0.75, top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Perform a BM25 search on the indexed documents using the given query.
+        BM25 is a ranking function used by search engines to estimate the relevance
+        of documents to a given search query. This implementation calculates the
+        BM25 score for each document based on term frequency, inverse document
+        frequency, and document length normalization.
+        Args:
+            query (str): The search query string.
+            k1 (float, optional): Term frequency saturation parameter. Default is 1.5.
+            b (float, optional): Length normalization parameter. Default is 0.75.
+            top_k (int, optional): The page size. All matches are returned when None.
+            offset (int, optional): The number of matches to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+        Returns:
+            list[dict]: A list of dictionaries containing the search results, where
+            each dictionary has the following keys:
+                - 'text' (str): The text of the document.
+                - 'score' (float): The BM25 score of the document.
+                - 'id' (int): The document ID.
+        Notes:
+            - The `self.index` is expected to be a dictionary where keys are words
+              and values are the sorted ordinals of the documents containing them.
+            - The `self.doc_lengths` is expected to be an array of the document
+              lengths, by ordinal.
+            - The `self.avg_doc_length` is expected to be the average length of all
+              documents.
+            - The document texts are read by ordinal with `document_text`.
+            - Term frequencies are read from `self.term_freqs`. When the index stores
+              positions, documents whose query words are close together are boosted,
+              see `proximity_boosts`.
+        """
+
+        doc_scores = self.bm25_scores(query, k1, b, allowed=self.filter_ordinals(filters), deadline=deadline)
+
+        ranked_results = ranked_page(doc_scores.items(), top_k, offset)
+        
+        return [self.format_result(ordinal, score, fields, query) for ordinal, score in ranked_results]
+
+    def bm25_scores(self, query, k1=1.5, b=0.75, allowed=None, deadline=None):
+        """
+        Compute the BM25 score of every document containing a query word, among the
+        documents of a filter when `allowed` is given (see `filter_ordinals`).
+        Scoring stops once `deadline` passes, keeping the scores so far.
+        Returns:
+            dict: A mapping of document ordinals to their scores.
+        """
+
+        query_words = self.expand_words(self.query_terms(query))
+        avg_doc_length = self.avg_doc_length
+        if not query_words or not avg_doc_length:
+            # without an average length, every document is deleted, only their
+            # postings are left until a merge
+            return {}
+
+        idf = {word: self.bm25_idf(word) for word in query_words}
+
+        doc_scores = {}
+        for word in query_words:
+            if word in self.index:
+                for ordinal, tf in bounded(zip(*self.filtered_postings(word, allowed)), deadline):
+                    score = idf[word] * (tf * (k1 + 1)) / (tf + k1 * (1 - b + b * (self.doc_lengths[ordinal] / avg_doc_length)))
+                    doc_scores[ordinal] = doc_scores.get(ordinal, 0) + score
+
+        self.drop_deleted(doc_scores)
+        self.add_proximity_boosts(doc_scores, query_words, deadline)
+        return doc_scores
+
+    def add_proximity_boosts(self, doc_scores, query_words, deadline=None):
+        """
+        Boost the BM25 scores of documents in which the query words are close together,
+        see `proximity_boosts`. Only applied when the index stores positions, and
+        skipped once the deadline of the query has passed.
+        """
+        words = [word for word in dict.fromkeys(query_words) if word in self.positions]
+        if len(words) < 2 or expired(deadline):
+            return
+
+        # only documents containing several of the words can get a boost
+        word_counts = {}
+        for word in words:
+            for ordinal in self.index[word]:
+                if ordinal in doc_scores:
+                    word_counts[ordinal] = word_counts.get(ordinal, 0) + 1
+        candidates = sorted(ordinal for ordinal, count in word_counts.items() if count > 1)
+
+        for ordinal, boost in self.proximity_boosts(words, candidates).items():
+            doc_scores[ordinal] += boost
+
+    def proximity_boosts(self, words, ordinals):
+        """
+        Compute a proximity score for documents containing at least two of the given words.
+        The score grows with the number of words found and shrinks with the number of
+        other tokens in the smallest window holding them, so documents containing the
+        words as a phrase get the full `PROXIMITY_WEIGHT` per additional word.
+        Args:
+            words (list): The distinct query words.
+            ordinals (list): Sorted ordinals of the documents to score.
+        Returns:
+            dict: A mapping of document ordinals to their proximity scores.
+        """
+        doc_positions = {}
+        for word in words:
+            for ordinal, positions in self.iter_term_positions(word, ordinals):
+                doc_positions.setdefault(ordinal, []).append(positions)
+
+        boosts = {}
+        for ordinal, position_lists in doc_positions.items():
+            if len(position_lists) > 1:
+                gap = min_span(position_lists) - len(position_lists)
+                boosts[ordinal] = PROXIMITY_WEIGHT * (len(position_lists) - 1) / (1 + gap)
+        return boosts
+    
+
+    def fuzzy_search(self, query, max_distance=2, top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Perform a fuzzy search on the indexed documents based on the given query.
+        This method splits the query into individual words and finds close matches
+        for each word in the index using a fuzzy matching algorithm. It then retrieves
+        the documents associated with the matched words.
+        Args:
+            query (str): The search query string to perform the fuzzy search on.
+            max_distance (int, optional): The maximum edit distance for fuzzy matching.
+                Defaults to 2. (Note: This parameter is not currently used in the implementation.)
+            top_k (int, optional): The page size. All matches are returned when None.
+            offset (int, optional): The number of matches to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+        Returns:
+            list: A list of dictionaries, where each dictionary contains:
+                - 'text' (str): The text of the matched document.
+                - 'id' (int): The ID of the matched document.
+        Note:
+            - The method uses `get_close_matches` from the `difflib` module to perform
+              fuzzy matching.
+            - If the query is empty, an empty list is returned.
+        """
+
+        matched_docs = self.fuzzy_match(query, allowed=self.filter_ordinals(filters), deadline=deadline)
+
+        return [self.format_result(ordinal, None, fields, query)
+                for ordinal in unranked_page(matched_docs, top_k, offset)]
+
+    def fuzzy_match(self, query, allowed=None, deadline=None):
+        """
+        Find the documents containing a close match of any query word, among the
+        documents of a filter when `allowed` is given (see `filter_ordinals`).
+        Query words are no longer matched once `deadline` passes.
+        Returns:
+            set: The ordinals of the matching documents.
+        """
+
+        query_words = self.query_terms(query)
+        if not query_words:
+            return set()
+
+        matched_docs = set()
+        for word in bounded(query_words, deadline, interval=1):
+            close_matches = get_close_matches(word, self.index.keys(), n=5, cutoff=0.8)
+            for match in close_matches:
+                if match in self.index:
+                    matched_docs.update(self.index[match])
+
+        matched_docs.difference_update(self.pending_deletes)
+        if allowed is not None:
+            matched_docs = set(allowed.select(array('I', sorted(matched_docs))))
+        return matched_docs
+    
+
+    def term_dictionary(self):
+        """
+        Get the sorted dictionary of the indexed terms, built on first use.
+        """
+        if self._term_dictionary is None:
+            self._term_dictionary = TermDictionary(
+                {word: len(postings) for word, postings in self.index.items()}
+            )
+        return self._term_dictionary
+
+    def autocomplete(self, prefix, top_n=10):
+        """
+        Suggest completions for a partially typed query.
+        The last word of the input is completed with the indexed terms starting with
+        it, most frequent first, see `TermDictionary.complete`. The word is lower
+        cased and folded like the indexed terms, but not stemmed since it is incomplete.
+        Args:
+            prefix (str): The text typed so far.
+            top_n (int, optional): The number of completions to return.
+        Returns:
+            list[dict]: The completions, each with the keys:
+                - 'term' (str): The completed word.
+                - 'doc_count' (int): The number of documents containing the word.
+        """
+        words = self.analyzer.token_pattern.findall(prefix)
+        if not words or not prefix.endswith(words[-1]):
+            return []
+
+        word = self.analyzer.normalize(words[-1])
+        return [{'term': term, 'doc_count': doc_count}
+                for term, doc_count in self.term_dictionary().complete(word, top_n)]
+
+    def tokenize_offsets(self, text):
+        """
+        Compute the character offsets of the analyzed tokens of a text, stopwords
+        excluded.
+        Returns:
+            array: The flattened (start, end) offsets of each token.
+        """
+        offsets = array('I')
+        for _, _, start, end in self.analyzer.tokens(text):
+            offsets.append(start)
+            offsets.append(end)
+        return offsets
+
+    def snippets(self, ordinal, query, window=SNIPPET_WINDOW):
+        """
+        Build a highlighted snippet of a document for a query.
+        The snippet is the window of `window` tokens whose query word matches have the
+        highest combined BM25 IDF, so windows covering rare and distinct query words win.
+        Token offsets stored at index time are used when available, otherwise the
+        document is tokenized on the fly.
+        Args:
+            ordinal (int): The ordinal of the document.
+            query (str): The search query string.
+            window (int, optional): The number of tokens in the snippet.
+        Returns:
+            list[dict]: The snippets of the document, each with the keys:
+                - 'text' (str): The snippet text.
+                - 'start' (int): The character offset of the snippet in the document.
+                - 'end' (int): The character offset of the end of the snippet.
+                - 'highlights' (list): The (start, end) offsets of the matched words
+                  within the snippet text.
+        """
+        text = self.document_text(ordinal)
+        offsets = self.token_offsets.get(ordinal)
+        if offsets is None:
+            offsets = self.tokenize_offsets(text)
+
+        token_count = len(offsets) // 2
+        if not token_count:
+            return []
+
+        try:
+            query_words = set(self.expand_words(positive_words(self.parse_query(query))))
+        except QueryParseError:
+            query_words = set(self.expand_words(self.query_terms(query)))
+
+        # (token, term) of the tokens matching a query word
+        matches = []
+        for position in range(token_count):
+            term = self.analyzer.analyze_token(text[offsets[2 * position]:offsets[2 * position + 1]])
+            if term in query_words:
+                matches.append((position, term))
+
+        # slide over the matches and keep the best scoring window
+        best_score, best_first, best_last = 0, 0, 0
+        word_counts = {}
+        low = 0
+        for high, (position, word) in enumerate(matches):
+            word_counts[word] = word_counts.get(word, 0) + 1
+            while position - matches[low][0] >= window:
+                dropped = matches[low][1]
+                word_counts[dropped] -= 1
+                if not word_counts[dropped]:
+                    del word_counts[dropped]
+                low += 1
+
+            score = sum(self.bm25_idf(w) for w in word_counts) + 0.1 * (high - low + 1)
+            if score > best_score:
+                best_score, best_first, best_last = score, matches[low][0], position
+
+        # center the matched span in the window
+        padding = (window - (best_last - best_first + 1)) // 2
+        start = max(0, best_first - padding)
+        end = min(token_count, start + window)
+        start = max(0, end - window)
+
+        char_start, char_end = offsets[2 * start], offsets[2 * (end - 1) + 1]
+        highlights = [
+            [offsets[2 * position] - char_start, offsets[2 * position + 1] - char_start]
+            for position, _ in matches if start <= position < end
+        ]
+
+        return [{
+            'text': text[char_start:char_end],
+            'start': char_start,
+            'end': char_end,
+            'highlights': highlights
+        }]
+
+    def format_result(self, ordinal, score, fields, query):
+        """
+        Build a search result for a document, see `search_results.make_result`.
+        Snippets are only computed when the 'snippets' field is requested.
+        """
+        return make_result(self.doc_ids[ordinal], lambda: self.document_text(ordinal), score, fields,
+                           get_snippets=lambda: self.snippets(ordinal, query))
+
+    def tf_idf_idf(self, word):
+        """
+        Smoothed TF-IDF inverse document frequency of a word. Values are memoized
+        per instance so that repeated terms across a batch of queries are only
+        looked up once.
+        """
+        key = ('tf_idf', word)
+        if key not in self._idf_cache:
+            total_docs = self.total_docs()
+            doc_count = self.doc_freq(word)
+            self._idf_cache[key] = log((total_docs + 1) / (doc_count + 1)) + 1
+        return self._idf_cache[key]
+
+    def bm25_idf(self, word):
+        """
+        BM25 inverse document frequency of a word, memoized like `tf_idf_idf`.
+        """
+        key = ('bm25', word)
+        if key not in self._idf_cache:
+            total_docs = self.total_docs()
+            doc_count = self.doc_freq(word)
+            self._idf_cache[key] = log((total_docs - doc_count + 0.5) / (doc_count + 0.5) + 1)
+        return self._idf_cache[key]
+
+    def total_docs(self):
+        """
+        Number of documents used for IDF, those of the whole collection for a shard.
+        """
+        if self.global_stats is not None:
+            return self.global_stats['total_docs']
+        return len(self.ordinals)
+
+    def doc_freq(self, word):
+        """
+        Number of documents containing a word, used for IDF. Deleted documents still
+        in the posting lists are counted until their segment is merged.
+        """
+        if self.global_stats is not None and word in self.global_stats['doc_freqs']:
+            return self.global_stats['doc_freqs'][word]
+        return len(self.index.get(word, ()))
+
+    def collection_stats(self, query, method='full_text'):
+        """
+        Get the statistics this index contributes to the scoring of a query run over
+        several shards: its live document count, its total document length and the
+        document frequency of every word the query is scored on.
+        Args:
+            query (str): The search query string.
+            method (str): The public name of a ranked search method, e.g. 'full_text'.
+        Returns:
+            dict: The keys 'total_docs', 'total_length' and 'doc_freqs'.
+        """
+        if method in ('boolean_ranked', 'boolean_bm25'):
+            words = positive_words(self.parse_query(query))
+        else:
+            words = self.query_terms(query)
+        return {
+            'total_docs': len(self.ordinals),
+            'total_length': self.total_length,
+            'doc_freqs': {word: len(self.index.get(word, ())) for word in self.expand_words(words)},
+        }
+
+    def set_global_stats(self, stats):
+        """
+        Score documents with the statistics of the whole collection, as summed from
+        the `collection_stats` of every shard, so that scores from different shards
+        are comparable. None goes back to the statistics of this index.
+        """
+        self.global_stats = stats
+        self._idf_cache.clear()
+        self.update_avg_doc_length()
+
+    def search(self, query, method='full_text', top_k=None, offset=0, fields=None, filters=None, deadline=None):
+        """
+        Run a query with one of the search methods listed in `SEARCH_METHODS`.
+        Args:
+            query (str): The search query string.
+            method (str): The public name of the search method, e.g. 'full_text'.
+            top_k (int, optional): Maximum number of results to return. All results
+                are returned when None.
+            offset (int, optional): The number of results to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+        Returns:
+            list[dict]: The results of the selected search method.
+        Raises:
+            ValueError: If the method is not a known text search method.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown text search method: {method}")
+
+        return getattr(self, self.SEARCH_METHODS[method])(query, top_k=top_k, offset=offset, fields=fields,
+                                                          filters=filters, deadline=deadline)
+
+    def iter_search(self, query, method='full_text', fields=None, filters=None):
+        """
+        Lazily produce every result of a query, for streaming responses.
+        Boolean matches are produced straight from the posting lists as they are
+        intersected. Ranked methods score their matches first and then pop them
+        off a heap one at a time, so results are never sorted or built up front.
+        The query is parsed and planned before this method returns, so malformed
+        queries fail early rather than in the middle of a stream.
+        Args:
+            query (str): The search query string.
+            method (str): The public name of the search method, e.g. 'full_text'.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ordinals`.
+        Returns:
+            iterator[dict]: The results of the selected search method, best first for
+                ranked methods.
+        Raises:
+            ValueError: If the method is not a known text search method.
+            QueryParseError: If a boolean query is not well formed.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown text search method: {method}")
+
+        allowed = self.filter_ordinals(filters)
+        if method == 'exact' and allowed is not None:
+            hits = ((ordinal, None) for ordinal in allowed.select(self.boolean_ordinals(query)))
+        elif method == 'exact':
+            hits = ((ordinal, None) for ordinal in self.iter_boolean_match(query))
+        elif method == 'fuzzy':
+            hits = ((ordinal, None) for ordinal in self.fuzzy_match(query, allowed=allowed))
+        else:
+            hits = iter_ranked(getattr(self, self.SCORE_METHODS[method])(query, allowed=allowed).items())
+
+        return (self.format_result(ordinal, score, fields, query) for ordinal, score in hits)
+
+    def search_batch(self, queries):
+        """
+        Evaluate many queries against the index in one pass.
+        The index is loaded once for the whole batch, and IDF values and boolean
+        matches are shared between queries that use the same terms.
+        Args:
+            queries (list[dict]): Queries with the keys 'query', 'method', 'top_k',
+                'offset', 'fields', 'filter' and 'deadline' (see `search`).
+        Returns:
+            list[list[dict]]: The results of each query, in request order.
+        """
+        return [
+            self.search(
+                q['query'],
+                method=q.get('method', 'full_text'),
+                top_k=q.get('top_k'),
+                offset=q.get('offset', 0),
+                fields=q.get('fields'),
+                filters=q.get('filter'),
+                deadline=q.get('deadline')
+            )
+            for q in queries
+        ]
+
+    def update_avg_doc_length(self):
+        if self.global_stats is not None:
+            stats = self.global_stats
+            self.avg_doc_length = stats['total_length'] / stats['total_docs'] if stats['total_docs'] else 0
+            return
+        # only live documents are counted, see `tombstone`
+        self.avg_doc_length = self.total_length / len(self.ordinals) if self.ordinals else 0
+
+    def save_cache(self):
+        """
+        Save the query cache along with the generation of the manifest it is valid for.
+        """
+        # the cache can be rebuilt, so it is not worth a sync
+        write_pickle(self.cache_file, {'journal': self.journal.generation, 'queries': self.cache}, sync=False)
+
+    def load_cache(self):
+        """
+        Load the query cache saved with the manifest the index was loaded from. The
+        cache is dropped when it was saved with another manifest, e.g. when saving
+        the index was interrupted.
+        """
+        try:
+            with open(self.cache_file, 'rb') as f:
+                cache = pickle.load(f)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return
+        if cache.get('journal') == self.journal.generation and 'queries' in cache:
+            self.cache = cache['queries']
+
+    def save_index(self):
+        """
+        Save the index: the buffered documents are flushed as a new segment and the
+        manifest is rewritten, which starts a new journal. Segments already on disk
+        are never rewritten here, they are only combined by background merges (see
+        `segments.merge_segments`).
+        Raises:
+            OSError: If a file of the index cannot be written. The index on disk is
+                then the one of the last successful save, plus its journal.
+        """
+        if not self.flush():
+            self.write_manifest()
+        self.save_cache()
+
+    def write_manifest(self):
+        """
+        Write the manifest of the index: its settings, segments and tombstones.
+        The manifest holds every change made so far, so the journal is reset.
+        """
+        generation = self.journal.generation + 1
+        write_pickle(self.index_file, {
+            'format': INDEX_FORMAT,
+            'settings': self.settings,
+            'segments': self.segments,
+            'next_segment': self.next_segment,
+            'obsolete': self.obsolete,
+            # buffered documents are not in any segment yet
+            'tombstones': self.tombstones[:self.flushed],
+            # number of documents whose text is in the document store
+            'stored': self.stored,
+            'journal': generation,
+        })
+        self.journal.reset(generation)
+
+    def load_index(self):
+        try:
+            data = read_pickle(self.index_file)
+        except FileNotFoundError:
+            data = {}
+        except (EOFError, pickle.UnpicklingError) as e:
+            # manifests are replaced atomically, so a truncated manifest is damage
+            # rather than an index being written: never load it as an empty index
+            logging.error(f"Error loading index from file {self.index_file}: {e}")
+            raise
+
+        self.settings = data.get('settings', self.settings)
+        self.init_attributes()
+        if 'segments' in data:
+            self.load_segments(data)
+        else:
+            self.load_single_file(data)
+
+        self.journal.generation = data.get('journal', 0)
+
+        self.ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(self.doc_ids)
+                         if not self.tombstones[ordinal]}
+        self.total_length = sum(length for length, dead in zip(self.doc_lengths, self.tombstones) if not dead)
+        self.update_avg_doc_length()
+
+    def replay_journal(self):
+        """
+        Apply the changes made since the manifest was written, see `Journal`.
+        Returns:
+            int: The number of changes applied.
+        """
+        changes = 0
+        for record in self.journal.replay():
+            if record[0] == 'add':
+                self.index_document(record[1], record[2], record[3:])
+            elif record[0] == 'delete':
+                self.tombstone(record[1])
+            changes += 1
+        self.update_avg_doc_length()
+        return changes
+
+    def load_segments(self, manifest):
+        """
+        Load the segments listed in a manifest. Segments cover consecutive ranges of
+        ordinals, so the posting lists of each word across segments are merged by
+        concatenating them in segment order.
+        """
+        self.segments = manifest['segments']
+        self.next_segment = manifest['next_segment']
+        self.obsolete = manifest['obsolete']
+        self.tombstones = manifest['tombstones']
+        self.stored = manifest.get('stored', 0)
+
+        target = {'index': self.index, 'term_freqs': self.term_freqs, 'positions': self.positions}
+        value_bitmaps = []
+        for entry in self.segments:
+            segment = read_pickle(segment_file(self.index_name, entry['name']))
+            value_bitmaps.append(segment.get('filters', {}))
+            if 'documents' in segment:
+                # segment written before the document store, whose texts may not be stored yet
+                self.documents.update((ordinal, text) for ordinal, text in enumerate(segment['documents'], entry['start'])
+                                      if ordinal >= self.stored)
+            self.doc_ids.extend(segment['doc_ids'])
+            self.doc_lengths.extend(segment['doc_lengths'])
+            self.token_offsets.update(segment['token_offsets'])
+            for word, postings in segment['index'].items():
+                extend_postings(target, word, postings, segment['term_freqs'][word], segment['positions'].get(word))
+
+        self.flushed = len(self.doc_ids)
+        self.load_attributes(value_bitmaps)
+        # deleted documents are still in the posting lists until their segment is merged
+        self.pending_deletes = array('I', (ordinal for ordinal, tombstone in enumerate(self.tombstones)
+                                           if tombstone == DELETED))
+
+    def load_attributes(self, segment_bitmaps):
+        """
+        Rebuild the value codes of the filter columns from the value bitmaps saved
+        with each segment, see `value_bitmaps`.
+        """
+        for column in self.attribute_codes:
+            codes = np.full(len(self.doc_ids), -1, dtype=np.int32)
+            for bitmaps in segment_bitmaps:
+                for value, bitmap in bitmaps.get(column, {}).items():
+                    codes[bitmap.to_numpy()] = self.attribute_code(column, value)
+            self.attribute_codes[column] = array('i', codes.tobytes())
+
+    def load_single_file(self, data):
+        """
+        Load an index saved as a single file, before indexes were split into
+        segments. All its documents are treated as buffered, so the index is written
+        as segments on its next save.
+        """
+        if data and data.get('format', 1) < 2:
+            data = self.upgrade_index_data(data)
+        if data and data['format'] < 3:
+            data = self.upgrade_term_freqs(data)
+        self.token_offsets = data.get('token_offsets', {})
+        self.index = data.get('index', {})
+        self.term_freqs = data.get('term_freqs', {})
+        self.positions = data.get('positions', {})
+        self.doc_ids = data.get('doc_ids', [])
+        self.doc_lengths = data.get('doc_lengths', array('I'))
+        self.documents = dict(enumerate(data.get('documents', [])))
+        self.tombstones = data.get('tombstones', bytearray(len(self.doc_ids)))
+        self.pending_deletes = data.get('pending_deletes', array('I'))
+        self._buffered_words = set(self.index)
+        # indexes saved as a single file have no filter columns
+        self.load_attributes([])
+
+    def upgrade_index_data(self, data):
+        """
+        Convert an index saved in the original layout, where postings were sets of
+        document IDs and documents were keyed by ID, to ordinal based postings.
+        """
+        documents = data.get('documents', {})
+        doc_ids = list(documents)
+        ordinals = {doc_id: ordinal for ordinal, doc_id in enumerate(doc_ids)}
+        doc_lengths = data.get('doc_lengths', {})
+        token_offsets = data.get('token_offsets', {})
+
+        return {
+            'format': 2,
+            'settings': data.get('settings', self.settings),
+            'token_offsets': {ordinals[doc_id]: offsets for doc_id, offsets in token_offsets.items()},
+            'index': {
+                word: array('I', sorted(ordinals[doc_id] for doc_id in doc_set))
+                for word, doc_set in data.get('index', {}).items()
+            },
+            'doc_ids': doc_ids,
+            'doc_lengths': array('I', (doc_lengths.get(doc_id, 0) for doc_id in doc_ids)),
+            'documents': list(documents.values()),
+            'avg_doc_length': data.get('avg_doc_length', 0)
+        }
+
+    def upgrade_term_freqs(self, data):
+        """
+        Add the term frequencies of each posting to an index saved without them,
+        counting the words of the stored documents. Positions are not rebuilt, so
+        phrases are matched on the document text for such indexes.
+        """
+        doc_counts = []
+        for text in data['documents']:
+            counts = {}
+            for word in (text or '').split():
+                counts[word] = counts.get(word, 0) + 1
+            doc_counts.append(counts)
+
+        term_freqs = {
+            word: array('I', (doc_counts[ordinal].get(word, 1) for ordinal in postings))
+            for word, postings in data['index'].items()
+        }
+
+        return dict(data, format=3, term_freqs=term_freqs, positions={})
+
@@ -1,173 +1,708 @@
-import logging
-import os
-import numpy as np
-import faiss
-import torch
-import pickle
-import csv
-from sentence_transformers import SentenceTransformer
-from sentence_transformers.util import cos_sim
-from services.text_search import TextSearch
-
-from dotenv import load_dotenv
-
-# Load environment variables from a .env file
-load_dotenv()
-
-class VectorSearch:
-    def __init__(self, file_id:str =None):
-        self.torch_device = 'cuda' if torch.cuda.is_available() else 'cpu'
-        self.embedding_model = SentenceTransformer(os.getenv('BASE_EMBEDDING_MODEL'), 
-                                                   device=self.torch_device)
-        self.index = None
-        self.documents = {}
-        self.doc_embeddings = None
-        self.embedding_file = f"data/{file_id}_emb.npy" 
-        self.doc_file = f"data/{file_id}_text.txt"
-        self.vector_index_file = f"data/{file_id}_faiss.index"
-        self.file_id = file_id
-        
-        self.load_index(self.vector_index_file, self.doc_file, self.embedding_file)
-    
-    def get_embeddings(self, texts):
-        return self.embedding_model.encode(texts, convert_to_tensor=True)
-
-    def create_index(self, data, text_column, id_column):
-        self.documents = {row[id_column]: row[text_column] for row in data}
-        self.doc_embeddings = self.get_embeddings([row[text_column] for row in data])
-        doc_ids = [row[id_column] for row in data]
-
-        # create vector embeddings and their IDs
-        text_vectors = np.array(self.doc_embeddings).astype('float32')
-        text_ids = np.array([hash(str(doc_id)) for doc_id in doc_ids]).astype('int')
-
-        faiss.normalize_L2(text_vectors)
-        self.index = faiss.IndexIDMap(faiss.IndexFlatIP(text_vectors.shape[1]))
-        self.index.add_with_ids(text_vectors, text_ids)
-
-        # save the index to a file
-        self.save_index(self.vector_index_file, self.doc_file, self.embedding_file)
-
-
-    def save_index(self, vector_index_path, data_path, embedding_path=None):
-        # Check if the index is created before saving
-        if self.index is None:
-            raise ValueError("Index has not been created. Call create_index first.")
-        
-        # save the vector index
-        faiss.write_index(self.index, vector_index_path)
-
-        with open(data_path, 'w') as f:
-            for doc_id, text in self.documents.items():
-                doc_id = "NO_ID" if not doc_id else doc_id.replace('\r', '').replace('\n', '')
-                text = "NO DESCRIPTION" if not text else text.replace('\r', '').replace('\n', '')
-                f.write(f"{doc_id}, {text}\n")
-
-        if embedding_path:
-            np.save(embedding_path, self.doc_embeddings)
-
-
-    def load_index(self, vector_index_path, data_path, embedding_path=None):
-        if os.path.exists(vector_index_path):
-            self.index = faiss.read_index(vector_index_path)
-            
-            with open(data_path, 'r') as f:
-                for line in f:
-                    doc_id, text = line.strip().split(',', 1)
-                    self.documents[doc_id] = text
-        
-        if os.path.exists(embedding_path):
-            self.doc_embeddings = np.load(embedding_path, allow_pickle=True)
-        
-
-    def add_documents(self, new_data, text_column, id_column):
-        if self.index is None:
-            raise ValueError("Index has not been created. Call create_index first.")
-
-        new_doc_embeddings = self.get_embeddings([row[text_column] for row in new_data])
-        new_doc_ids = [row[id_column] for row in new_data]
-
-        new_text_vectors = np.array(new_doc_embeddings).astype('float32')
-        new_text_ids = np.array(new_doc_ids).astype('int')
-
-        faiss.normalize_L2(new_text_vectors)
-        self.index.add_with_ids(new_text_vectors, new_text_ids)
-
-        # Append new data to the existing data
-        for row in new_data:
-            self.documents[row[id_column]] = row[text_column]
-    
-
-    def similarity_search_lite(self, query, top_k=5):
-        if self.index is None:
-            raise ValueError("Index has not been created. Call create_index first.")
-        
-        query_embedding = self.get_embeddings([query])
-        doc_embeddings = self.doc_embeddings
-
-        doc_scores = {doc_id: cos_sim(query_embedding, doc_embedding).flatten().tolist()
-                      for doc_id, doc_embedding in zip(self.documents.keys(), doc_embeddings)}
-        
-        sorted_doc_scores = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-        top_results = sorted_doc_scores[:top_k]
-
-        return [{'text': self.documents[doc_id], 'score': score, 'id': doc_id} for doc_id, score in top_results]
-        
-
-    def boolean_semantic_search(self, query):
-        """
-        Perform a boolean semantic search on the provided query.
-        This method first performs a boolean search using the index and then
-        refines the results by calculating the cosine similarity between the
-        query embedding and the embeddings of the boolean search results.
-        Args:
-            query (str): The search query string.
-        Returns:
-            list: A list of dictionaries containing the top search results. Each
-                  dictionary includes the following keys:
-                  - 'text': The text of the document.
-                  - 'score': The cosine similarity score of the document.
-                  - 'id': The ID of the document.
-        Raises:
-            ValueError: If the index has not been created or if the query is empty.
-        """
-
-        if self.index is None:
-            raise ValueError("Index has not been created.")
-        
-        query_words = query.split()
-        if not query_words:
-            return []
-        
-        try:
-            # Perform a boolean search using the index
-            text_search = TextSearch(
-                index_file=self.file_id
-            )
-            boolean_results = text_search.boolean_search(query)
-
-            # Get the embeddings of the boolean search results
-            boolean_doc_ids = [doc['id'] for doc in boolean_results]
-
-            boolean_doc_texts = [self.documents[doc_id] for doc_id in boolean_doc_ids]
-
-            boolean_doc_embeddings = self.get_embeddings(boolean_doc_texts)
-            boolean_doc_embeddings = np.array(boolean_doc_embeddings).astype('float32')
-
-            query_embedding = self.get_embeddings([query])
-
-            doc_scores = {doc_id: cos_sim(query_embedding, doc_embedding).flatten().tolist()
-                          for doc_id, doc_embedding in zip(boolean_doc_ids, boolean_doc_embeddings)}
-            
-           
-            sorted_doc_scores = sorted(doc_scores.items(), key=lambda x: x[1], reverse=True)
-            top_results = sorted_doc_scores[:5]  # Adjust the number of results as needed
-
-            return [{'text': self.documents[doc_id], 'score': score, 'id': doc_id} for doc_id, score in top_results]
-        
-        except KeyError as e:
-            logging.error(f"KeyError encountered: {e}")
-            raise ValueError(f"Document ID not found in the documents dictionary: {e}")
-        except Exception as e:
-            logging.error(f"An error occurred during boolean semantic search: {e}")
-            raise RuntimeError(f"An unexpected error occurred: {e}")
\ No newline at end of file
+import logging
+import os
+import numpy as np
+import faiss
+import torch
+import pickle
+import csv
+from array import array
+from collections import OrderedDict
+from sentence_transformers import SentenceTransformer
+from sentence_transformers.util import cos_sim
+from services.text_search import document_store_path
+from services.document_store import DocumentStore
+from services.index_cache import get_text_search, file_version, MAX_CACHED_INDEXES
+from services.segments import write_pickle, read_pickle, replacing
+from services.journal import Journal
+from services.query_parser import QueryParseError
+from services.search_results import ranked_page, iter_ranked, make_result
+from services.deadlines import bounded, expired
+
+from dotenv import load_dotenv
+
+# Load environment variables from a .env file
+load_dotenv()
+
+# Number of boolean matches embedded at a time by `boolean_semantic_scores`;
+# the deadline of the query is checked between batches
+EMBEDDING_BATCH_SIZE = 256
+
+_embedding_models = {}
+
+_vector_indexes = OrderedDict()
+
+
+def vector_journal_file(index_name):
+    return f"data/{index_name}_vector_journal.log"
+
+
+def get_embedding_model(device):
+    """
+    Get the embedding model of the vector indexes (`BASE_EMBEDDING_MODEL`), loaded
+    once per process: loading a model reads all its weights, which takes far
+    longer than embedding a query.
+
+    :param device: The torch device to run the model on.
+    :return: A SentenceTransformer instance.
+    """
+    name = os.getenv('BASE_EMBEDDING_MODEL')
+    model = _embedding_models.get((name, device))
+    if model is None:
+        model = SentenceTransformer(name, device=device)
+        _embedding_models[(name, device)] = model
+    return model
+
+
+def embed_query(query):
+    """
+    Embed a search query, e.g. once for all the shards it is sent to.
+
+    :param query: The search query string.
+    :return: The embedding, as a float32 array of shape (1, dimension).
+    """
+    device = 'cuda' if torch.cuda.is_available() else 'cpu'
+    return np.asarray(get_embedding_model(device).encode([query]), dtype='float32')
+
+
+class VectorSearch:
+    # Maps the public search method names (as used by the search endpoints)
+    # to the VectorSearch method implementing them.
+    SEARCH_METHODS = {
+        'similarity': 'similarity_search_lite',
+        'exact_similarity': 'boolean_semantic_search',
+    }
+
+    # Maps the vector search methods to the text search method matching the same
+    # documents, see `facet_counts`; every document matches a similarity search
+    MATCH_METHODS = {
+        'similarity': None,
+        'exact_similarity': 'exact',
+    }
+
+    def __init__(self, file_id:str =None):
+        self.torch_device = 'cuda' if torch.cuda.is_available() else 'cpu'
+        self.embedding_model = get_embedding_model(self.torch_device)
+        self.index = None
+        self.doc_ids = []
+        # position in `doc_ids` (and FAISS ID) of each document, by ID as a string
+        self.positions = {}
+        # texts are read from the document store shared with the text index, by the
+        # ordinal of the document in the text index (-1 when it has none); texts of
+        # documents without one are kept here by ID, see `document_text`
+        self.store_ordinals = array('q')
+        self.documents = {}
+        self.store = DocumentStore(path=document_store_path(file_id))
+        self.doc_embeddings = None
+        # embeddings indexed since the index was loaded or saved, see `index_documents`
+        self.embedding_chunks = []
+        self.embedding_file = f"data/{file_id}_emb.npy" 
+        self.doc_file = f"data/{file_id}_ids.pkl"
+        # id map and texts of indexes saved before the document store existed
+        self.legacy_doc_file = f"data/{file_id}_text.txt"
+        self.vector_index_file = f"data/{file_id}_faiss.index"
+        self.file_id = file_id
+        # single document changes made since the index was saved, see `update_document`
+        self.journal = Journal(vector_journal_file(file_id))
+        
+        self.load_index(self.vector_index_file, self.doc_file, self.embedding_file)
+        self.replay_journal()
+    
+    def get_embeddings(self, texts):
+        return self.embedding_model.encode(texts, convert_to_tensor=True)
+
+    def create_index(self, data, text_column, id_column):
+        self.index = None
+        self.documents = {}
+        self.doc_ids = []
+        self.positions = {}
+        self.store_ordinals = array('q')
+        self.doc_embeddings = None
+        self.embedding_chunks = []
+        self.index_documents([(row[id_column], row[text_column]) for row in data])
+
+        # save the index to a file
+        self.save_index(self.vector_index_file, self.doc_file, self.embedding_file)
+
+    def index_documents(self, documents, ordinals=None, embeddings=None):
+        """
+        Embed and index a chunk of documents, creating the index with the first chunk.
+        Chunks are embedded as they arrive, so an index can be built from a stream
+        of rows; call `save_index` once every chunk is indexed.
+        Args:
+            documents (list): (doc_id, text) pairs.
+            ordinals (list, optional): The ordinal of each document in the text index
+                of the same name, whose document store holds the texts. Texts of
+                documents without one (None) are kept by the vector index.
+            embeddings (numpy.ndarray, optional): The embeddings of the documents, when
+                they are already embedded.
+        """
+        if embeddings is None:
+            embeddings = np.array(self.get_embeddings([text for _, text in documents])).astype('float32')
+
+        # the FAISS ID of a document is its position in `doc_ids` so search hits
+        # can be mapped back to documents
+        text_vectors = embeddings.copy()
+        text_ids = np.arange(len(self.doc_ids), len(self.doc_ids) + len(documents)).astype('int64')
+
+        faiss.normalize_L2(text_vectors)
+        if self.index is None:
+            self.index = faiss.IndexIDMap(faiss.IndexFlatIP(text_vectors.shape[1]))
+        self.index.add_with_ids(text_vectors, text_ids)
+
+        self.positions.update((str(doc_id), int(position)) for (doc_id, _), position in zip(documents, text_ids))
+        self.doc_ids.extend(doc_id for doc_id, _ in documents)
+        ordinals = ordinals or [None] * len(documents)
+        self.store_ordinals.extend(-1 if ordinal is None else ordinal for ordinal in ordinals)
+        self.documents.update((doc_id, text) for (doc_id, text), ordinal in zip(documents, ordinals) if ordinal is None)
+        # joined on first use, see `document_embeddings`
+        self.embedding_chunks.append(embeddings)
+
+    def delete_documents(self, doc_ids):
+        """
+        Delete documents from the index. The slots of deleted documents in `doc_ids`
+        (and their embeddings) are kept empty, so the FAISS IDs of the other
+        documents do not change; call `save_index` to persist the change.
+        Args:
+            doc_ids (iterable): The IDs of the documents to delete.
+        Returns:
+            int: The number of documents deleted.
+        """
+        removed = [self.positions.pop(str(doc_id)) for doc_id in doc_ids if str(doc_id) in self.positions]
+        if not removed:
+            return 0
+
+        self.index.remove_ids(np.array(removed, dtype='int64'))
+        for position in removed:
+            self.documents.pop(self.doc_ids[position], None)
+            self.doc_ids[position] = None
+            self.store_ordinals[position] = -1
+        return len(removed)
+
+    def upsert_documents(self, documents, ordinals=None, embeddings=None):
+        """
+        Index a chunk of documents, replacing the documents with the same IDs, see
+        `index_documents`.
+        Args:
+            documents (list): (doc_id, text) pairs.
+            ordinals (list, optional): The ordinal of each document in the text index.
+            embeddings (numpy.ndarray, optional): The embeddings of the documents.
+        """
+        if self.index is not None:
+            self.delete_documents(doc_id for doc_id, _ in documents)
+        self.index_documents(documents, ordinals, embeddings)
+
+    def update_document(self, doc_id, text, ordinal=None):
+        """
+        Add or replace a single document, e.g. one changed through the API, and commit
+        the change. Only the change and its embedding are appended to the journal, so
+        the work depends on the size of the document rather than the size of the
+        index; the index files are rewritten by the next `save_index`.
+        The text is kept by the vector index even with an `ordinal`, since it only
+        reaches the document store once the text index is next flushed.
+        Args:
+            doc_id: The ID of the document.
+            text (str): The text of the document.
+            ordinal (int, optional): The ordinal of the document in the text index,
+                which filters are evaluated on, see `filter_ids`.
+        """
+        embedding = np.array(self.get_embeddings([text])).astype('float32')
+        self.journal.append(('update', doc_id, text, ordinal, embedding))
+        self.journal.commit()
+        self.apply_update(doc_id, text, ordinal, embedding)
+
+    def apply_update(self, doc_id, text, ordinal, embedding):
+        """
+        Apply a change made by `update_document`, also when the journal is replayed.
+        """
+        self.upsert_documents([(doc_id, text)], [ordinal], embedding)
+        self.documents[doc_id] = text
+
+    def delete_document(self, doc_id):
+        """
+        Delete a single document and commit the change to the journal, see
+        `update_document`.
+        Returns:
+            bool: True if the document was deleted, False if it was not in the index.
+        """
+        if str(doc_id) not in self.positions:
+            return False
+        self.journal.append(('delete', doc_id))
+        self.journal.commit()
+        self.delete_documents([doc_id])
+        return True
+
+    def replay_journal(self):
+        """
+        Apply the changes made since the index was saved, see `update_document`.
+        """
+        for record in self.journal.replay():
+            if record[0] == 'update':
+                self.apply_update(*record[1:])
+            elif record[0] == 'delete':
+                self.delete_documents([record[1]])
+
+    def document_text(self, doc_id):
+        """
+        Get the text of a document, read from the document store unless the vector
+        index holds it.
+        """
+        position = self.positions[str(doc_id)]
+        ordinal = self.store_ordinals[position]
+        text = self.documents.get(self.doc_ids[position])
+        if text is not None or ordinal < 0:
+            return text
+        return self.store.fetch(ordinal)
+
+
+    def save_index(self, vector_index_path, data_path, embedding_path=None):
+        # Check if the index is created before saving
+        if self.index is None:
+            raise ValueError("Index has not been created. Call create_index first.")
+        
+        # every file is written to a temporary file which then replaces it, so readers
+        # and snapshots (see `snapshots.export_snapshot`) never see a partial file
+        with replacing(vector_index_path) as temp_path:
+            faiss.write_index(self.index, temp_path)
+
+        if embedding_path:
+            with replacing(embedding_path) as temp_path, open(temp_path, 'wb') as f:
+                np.save(f, self.document_embeddings())
+
+        # the id map: the ID of the document at each FAISS ID (None for a deleted
+        # document, see `delete_documents`) and where its text is. It is written last
+        # and names the next generation of the journal, whose changes it now holds
+        generation = self.journal.generation + 1
+        write_pickle(data_path, {
+            'doc_ids': self.doc_ids,
+            'store_ordinals': self.store_ordinals,
+            'documents': self.documents,
+            'journal': generation,
+        }, sync=False)
+        self.journal.reset(generation)
+
+    def document_embeddings(self):
+        """
+        Get the embeddings of the documents, by position in `doc_ids`, including the
+        chunks indexed since the index was loaded or saved.
+        """
+        if self.embedding_chunks:
+            previous = [np.asarray(self.doc_embeddings)] if self.doc_embeddings is not None else []
+            # joined once, concatenating each chunk would copy the embeddings over and over
+            self.doc_embeddings = np.concatenate(previous + self.embedding_chunks)
+            self.embedding_chunks = []
+        return self.doc_embeddings
+
+
+    def load_index(self, vector_index_path, data_path, embedding_path=None):
+        if os.path.exists(vector_index_path):
+            self.index = faiss.read_index(vector_index_path)
+
+            if os.path.exists(data_path):
+                id_map = read_pickle(data_path)
+                self.doc_ids = id_map['doc_ids']
+                self.store_ordinals = id_map['store_ordinals']
+                self.documents = id_map['documents']
+                self.journal.generation = id_map.get('journal', 0)
+            else:
+                self.load_legacy_documents(self.legacy_doc_file)
+                self.renumber_legacy_index()
+            self.positions = {str(doc_id): position for position, doc_id in enumerate(self.doc_ids)
+                              if doc_id is not None}
+        
+        if os.path.exists(embedding_path):
+            self.doc_embeddings = np.load(embedding_path, allow_pickle=True)
+        
+
+    def load_legacy_documents(self, data_path):
+        """
+        Load the id map and texts of an index saved as a text file of "id, text"
+        lines. They are saved as an id map on the next `save_index`.
+        """
+        with open(data_path, 'r') as f:
+            for line in f:
+                doc_id, text = line.strip().split(',', 1)
+                self.documents[doc_id] = text
+                self.doc_ids.append(doc_id)
+        self.store_ordinals = array('q', [-1]) * len(self.doc_ids)
+
+    def renumber_legacy_index(self):
+        """
+        Renumber the vectors of an index saved before the FAISS ID of a document was
+        its position in `doc_ids`. Their IDs were hashes of the document IDs, which
+        cannot be mapped back to documents, so each vector gets the position of its
+        document, in the order both were added, like the embeddings.
+        """
+        vectors = self.index.index.reconstruct_n(0, self.index.ntotal)
+        index = faiss.IndexIDMap(faiss.IndexFlatIP(self.index.d))
+        index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+        self.index = index
+
+    def add_documents(self, new_data, text_column, id_column):
+        if self.index is None:
+            raise ValueError("Index has not been created. Call create_index first.")
+
+        new_doc_embeddings = self.get_embeddings([row[text_column] for row in new_data])
+        new_doc_ids = [row[id_column] for row in new_data]
+
+        new_text_vectors = np.array(new_doc_embeddings).astype('float32')
+        new_text_ids = np.arange(len(self.doc_ids), len(self.doc_ids) + len(new_doc_ids)).astype('int64')
+        self.positions.update((str(doc_id), int(position)) for doc_id, position in zip(new_doc_ids, new_text_ids))
+        self.doc_ids.extend(new_doc_ids)
+        self.store_ordinals.extend([-1] * len(new_doc_ids))
+
+        faiss.normalize_L2(new_text_vectors)
+        self.index.add_with_ids(new_text_vectors, new_text_ids)
+
+        # Append new data to the existing data
+        for row in new_data:
+            self.documents[row[id_column]] = row[text_column]
+    
+
+    def similarity_search_lite(self, query, top_k=5, offset=0, fields=None, filters=None, deadline=None,
+                               embedding=None):
+        if top_k is not None:
+            # a page of results is looked up in the FAISS index, among the documents of
+            # the filter if any, instead of scoring every document
+            return self.similarity_search_batch([{'query': query, 'top_k': top_k, 'offset': offset, 'fields': fields,
+                                                  'filter': filters, 'deadline': deadline, 'embedding': embedding}])[0]
+
+        doc_scores = self.similarity_scores(query, self.filter_ids(filters), deadline, embedding)
+        
+        top_results = ranked_page(doc_scores.items(), top_k, offset)
+
+        return [make_result(doc_id, lambda: self.document_text(doc_id), score, fields) for doc_id, score in top_results]
+
+
+    def filter_ids(self, filters):
+        """
+        Find the FAISS IDs of the documents matching a filter expression. Filters are
+        evaluated on the bitmaps of the text index of the same name (see
+        `TextSearch.filter_ordinals`), whose ordinals are mapped to FAISS IDs through
+        `store_ordinals`; documents without a text index ordinal never match.
+        Args:
+            filters (str): The filter expression, or None.
+        Returns:
+            numpy.ndarray: The sorted FAISS IDs, or None without a filter.
+        """
+        allowed = get_text_search(self.file_id).filter_ordinals(filters)
+        if allowed is None:
+            return None
+        return np.flatnonzero(allowed.mask(np.frombuffer(self.store_ordinals, dtype=np.int64)))
+
+
+    def similarity_scores(self, query, ids=None, deadline=None, embedding=None):
+        """
+        Compute the cosine similarity between the query and every document, or the
+        documents of the given FAISS IDs (see `filter_ids`), until `deadline` passes.
+        The query is embedded unless its `embedding` is given (see `embed_query`).
+        Returns:
+            dict: A mapping of document IDs to their scores.
+        """
+        if self.index is None:
+            raise ValueError("Index has not been created. Call create_index first.")
+        
+        query_embedding = self.get_embeddings([query]) if embedding is None else embedding
+        doc_ids = self.doc_ids if ids is None else [self.doc_ids[position] for position in ids]
+        doc_embeddings = self.document_embeddings() if ids is None else self.document_embeddings()[ids]
+
+        return {doc_id: cos_sim(query_embedding, doc_embedding).item()
+                for doc_id, doc_embedding in bounded(zip(doc_ids, doc_embeddings), deadline) if doc_id is not None}
+
+
+    def similarity_search_batch(self, queries):
+        """
+        Perform a similarity search for many queries at once.
+        All queries are embedded with a single call to the embedding model and
+        looked up with a single FAISS search, which is much cheaper than running
+        `similarity_search_lite` once per query. Queries with a 'filter' are looked
+        up one by one, with a FAISS ID selector restricting the search to the
+        documents of the filter (see `filter_ids`). Queries whose 'deadline' has
+        passed once the queries are embedded are not looked up and have no results.
+        Args:
+            queries (list[dict]): Queries with the keys 'query', 'top_k', 'offset',
+                'fields', 'filter' and 'deadline', and optionally the 'embedding' of the
+                query (see `embed_query`). A missing or None 'top_k' returns up to 5 results.
+        Returns:
+            list[list[dict]]: The results of each query, in the order of `queries`.
+                Each result contains the keys 'text', 'score' and 'id'.
+        Raises:
+            ValueError: If the index has not been created.
+        """
+        if self.index is None:
+            raise ValueError("Index has not been created. Call create_index first.")
+
+        if not queries:
+            return []
+
+        # each query needs its page and everything before it
+        depths = [(q.get('top_k') or 5) + q.get('offset', 0) for q in queries]
+
+        query_vectors = self.query_embeddings(queries)
+        faiss.normalize_L2(query_vectors)
+        selected = [self.filter_ids(q.get('filter')) for q in queries]
+        scores = np.full((len(queries), max(depths)), -np.inf, dtype='float32')
+        ids = np.full((len(queries), max(depths)), -1, dtype='int64')
+
+        unfiltered = [i for i, filter_ids in enumerate(selected)
+                      if filter_ids is None and not expired(queries[i].get('deadline'))]
+        if unfiltered:
+            scores[unfiltered], ids[unfiltered] = self.index.search(query_vectors[unfiltered], max(depths))
+        for i, filter_ids in enumerate(selected):
+            if filter_ids is None or expired(queries[i].get('deadline')):
+                continue
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(filter_ids.astype('int64')))
+            row_scores, row_ids = self.index.search(query_vectors[i:i + 1], depths[i], params=params)
+            scores[i, :depths[i]], ids[i, :depths[i]] = row_scores[0], row_ids[0]
+
+        results = []
+        for q, depth, row_scores, row_ids in zip(queries, depths, scores, ids):
+            hits = []
+            for score, doc_ord in zip(row_scores[q.get('offset', 0):depth], row_ids[q.get('offset', 0):depth]):
+                # FAISS pads missing neighbours with -1
+                if doc_ord < 0 or doc_ord >= len(self.doc_ids):
+                    continue
+                doc_id = self.doc_ids[doc_ord]
+                hits.append(make_result(doc_id, lambda: self.document_text(doc_id), float(score), q.get('fields')))
+            results.append(hits)
+
+        return results
+
+
+    def query_embeddings(self, queries):
+        """
+        Embed the queries of a batch with a single call to the embedding model,
+        except those which already carry their 'embedding'.
+        Returns:
+            numpy.ndarray: The float32 embedding of each query, one row per query.
+        """
+        missing = [q['query'] for q in queries if q.get('embedding') is None]
+        embedded = iter(np.array(self.get_embeddings(missing)).astype('float32') if missing else ())
+        return np.array([next(embedded) if q.get('embedding') is None else np.asarray(q['embedding'])[0]
+                         for q in queries], dtype='float32')
+
+
+    def search(self, query, method='similarity', top_k=5, offset=0, fields=None, filters=None, deadline=None,
+               embedding=None):
+        """
+        Run a query with one of the search methods listed in `SEARCH_METHODS`.
+        Args:
+            query (str): The search query string.
+            method (str): The public name of the search method, e.g. 'similarity'.
+            top_k (int, optional): The page size. Defaults to 5.
+            offset (int, optional): The number of results to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ids`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+            embedding (numpy.ndarray, optional): The embedding of the query, when it is
+                already embedded, see `embed_query`.
+        Returns:
+            list[dict]: The results of the selected search method.
+        Raises:
+            ValueError: If the method is not a known vector search method.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown vector search method: {method}")
+
+        return getattr(self, self.SEARCH_METHODS[method])(query, top_k=top_k, offset=offset, fields=fields,
+                                                          filters=filters, deadline=deadline, embedding=embedding)
+
+
+    def search_batch(self, queries):
+        """
+        Evaluate many vector search queries against the index in one pass.
+        Similarity queries are batched through `similarity_search_batch`, other
+        methods run one by one on the already loaded model and index.
+        Args:
+            queries (list[dict]): Queries with the keys 'query', 'method', 'top_k',
+                'offset', 'fields', 'filter' and 'deadline' (see `search`).
+        Returns:
+            list[list[dict]]: The results of each query, in request order.
+        Raises:
+            ValueError: If a method is not a known vector search method.
+        """
+        results = [None] * len(queries)
+
+        similarity_positions = [i for i, q in enumerate(queries) if q.get('method') == 'similarity']
+        for i, result in zip(similarity_positions,
+                             self.similarity_search_batch([queries[i] for i in similarity_positions])):
+            results[i] = result
+
+        for i, q in enumerate(queries):
+            if q.get('method') == 'similarity':
+                continue
+            if q.get('method') not in self.SEARCH_METHODS:
+                raise ValueError(f"Unknown vector search method: {q.get('method')}")
+            results[i] = getattr(self, self.SEARCH_METHODS[q['method']])(
+                q['query'],
+                top_k=q.get('top_k') or 5,
+                offset=q.get('offset', 0),
+                fields=q.get('fields'),
+                filters=q.get('filter'),
+                deadline=q.get('deadline')
+            )
+
+        return results
+        
+
+    def boolean_semantic_search(self, query, top_k=5, offset=0, fields=None, filters=None, deadline=None,
+                                embedding=None):
+        """
+        Perform a boolean semantic search on the provided query.
+        This method first performs a boolean search using the index and then
+        refines the results by calculating the cosine similarity between the
+        query embedding and the embeddings of the boolean search results.
+        Args:
+            query (str): The search query string.
+            top_k (int, optional): The page size. Defaults to 5.
+            offset (int, optional): The number of results to skip.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ids`.
+            deadline (Deadline, optional): The time to stop scoring by and return the best
+                results found so far, see `deadlines.Deadline`.
+            embedding (numpy.ndarray, optional): The embedding of the query, see `embed_query`.
+        Returns:
+            list: A list of dictionaries containing the top search results. Each
+                  dictionary includes the following keys:
+                  - 'text': The text of the document.
+                  - 'score': The cosine similarity score of the document.
+                  - 'id': The ID of the document.
+        Raises:
+            ValueError: If the index has not been created or if the query is empty.
+        """
+
+        doc_scores = self.boolean_semantic_scores(query, filters, deadline, embedding)
+
+        top_results = ranked_page(doc_scores.items(), top_k, offset)
+
+        return [make_result(doc_id, lambda: self.document_text(doc_id), score, fields) for doc_id, score in top_results]
+
+
+    def boolean_semantic_scores(self, query, filters=None, deadline=None, embedding=None):
+        """
+        Compute the cosine similarity between the query and every document containing
+        all the query words, among the documents matching a filter expression when
+        one is given. Matches are embedded in batches of `EMBEDDING_BATCH_SIZE` until
+        `deadline` passes.
+        Returns:
+            dict: A mapping of document IDs to their scores.
+        """
+
+        if self.index is None:
+            raise ValueError("Index has not been created.")
+        
+        query_words = query.split()
+        if not query_words:
+            return {}
+        
+        try:
+            # Perform a boolean search using the index
+            text_search = get_text_search(self.file_id)
+            ordinals = text_search.boolean_ordinals(query)
+            allowed = text_search.filter_ordinals(filters)
+            if allowed is not None:
+                ordinals = allowed.select(ordinals)
+            boolean_doc_ids = [text_search.doc_ids[ordinal] for ordinal in ordinals]
+
+            query_embedding = self.get_embeddings([query]) if embedding is None else embedding
+
+            # Get the embeddings of the boolean search results, a batch at a time
+            doc_scores = {}
+            for start in bounded(range(0, len(boolean_doc_ids), EMBEDDING_BATCH_SIZE), deadline, interval=1):
+                batch_doc_ids = boolean_doc_ids[start:start + EMBEDDING_BATCH_SIZE]
+                batch_doc_texts = [text_search.document_text(text_search.ordinals[doc_id]) for doc_id in batch_doc_ids]
+
+                batch_doc_embeddings = self.get_embeddings(batch_doc_texts)
+                batch_doc_embeddings = np.array(batch_doc_embeddings).astype('float32')
+
+                doc_scores.update({doc_id: cos_sim(query_embedding, doc_embedding).item()
+                                   for doc_id, doc_embedding in zip(batch_doc_ids, batch_doc_embeddings)})
+
+            return doc_scores
+        
+        except QueryParseError:
+            raise
+        except KeyError as e:
+            logging.error(f"KeyError encountered: {e}")
+            raise ValueError(f"Document ID not found in the documents dictionary: {e}")
+        except Exception as e:
+            logging.error(f"An error occurred during boolean semantic search: {e}")
+            raise RuntimeError(f"An unexpected error occurred: {e}")
+
+
+    def facet_counts(self, query, method='similarity', columns=(), filters=None):
+        """
+        Count the documents matching a query by value of some filter columns, see
+        `TextSearch.facet_counts`. The matches are those of the text index of the
+        same name (see `MATCH_METHODS`), so nothing is embedded.
+        Raises:
+            ValueError: If the method is not a known vector search method.
+        """
+        if method not in self.SEARCH_METHODS:
+            raise ValueError(f"Unknown vector search method: {method}")
+        return get_text_search(self.file_id).facet_counts(query, self.MATCH_METHODS[method], columns, filters)
+
+
+    def iter_search(self, query, method='similarity', fields=None, filters=None, embedding=None):
+        """
+        Lazily produce every result of a query, best first, for streaming responses.
+        The documents are scored before this method returns.
+        Args:
+            query (str): The search query string.
+            method (str): The public name of the search method, e.g. 'similarity'.
+            fields (tuple, optional): The result fields to return, see `search_results.parse_fields`.
+            filters (str, optional): A filter expression on the filter columns, see `filter_ids`.
+            embedding (numpy.ndarray, optional): The embedding of the query, see `embed_query`.
+        Returns:
+            iterator[dict]: The results of the selected search method.
+        Raises:
+            ValueError: If the method is not a known vector search method.
+        """
+        if method == 'similarity':
+            doc_scores = self.similarity_scores(query, self.filter_ids(filters), embedding=embedding)
+        elif method == 'exact_similarity':
+            doc_scores = self.boolean_semantic_scores(query, filters, embedding=embedding)
+        else:
+            raise ValueError(f"Unknown vector search method: {method}")
+
+        return (make_result(doc_id, lambda: self.document_text(doc_id), score, fields)
+                for doc_id, score in iter_ranked(doc_scores.items()))
+
+
+def get_vector_search(index_id):
+    """
+    Get a loaded vector index, keeping recently used indexes in memory, as
+    `index_cache.get_text_search` does for text indexes. Cached indexes are
+    reloaded when their files change on disk.
+
+    :param index_id: The ID of the search index.
+    :return: A VectorSearch instance.
+    """
+    version = vector_index_version(index_id)
+
+    cached = _vector_indexes.get(index_id)
+    if cached is not None and cached[0] == version:
+        _vector_indexes.move_to_end(index_id)
+        return cached[1]
+
+    vector_search = VectorSearch(file_id=index_id)
+    _vector_indexes[index_id] = (version, vector_search)
+    _vector_indexes.move_to_end(index_id)
+    while len(_vector_indexes) > MAX_CACHED_INDEXES:
+        _vector_indexes.popitem(last=False)
+    return vector_search
+
+
+def vector_index_version(index_id):
+    return (file_version(f"data/{index_id}_faiss.index"), file_version(f"data/{index_id}_ids.pkl"),
+            file_version(f"data/{index_id}_emb.npy"), file_version(vector_journal_file(index_id)))
+
+
+def refresh_vector_search(index_id):
+    """
+    Record the files of a cached vector index as current once it was changed in
+    place, see `index_cache.refresh_text_search`.
+    """
+    cached = _vector_indexes.get(index_id)
+    if cached is not None:
+        _vector_indexes[index_id] = (vector_index_version(index_id), cached[1])
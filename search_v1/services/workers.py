@@ -0,0 +1,22 @@
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+# Number of worker processes used to build indexes and to query shards
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", os.cpu_count() or 1))
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """
+    Get the process pool shared by index builds and shard queries, started on
+    first use. Worker processes keep recently used shards loaded, see
+    `index_cache.get_text_search` and `vector_search.get_vector_search`.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(max_workers=WORKER_PROCESSES)
+        return _executor
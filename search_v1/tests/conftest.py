@@ -0,0 +1,145 @@
+import os
+import sys
+import uuid
+import time
+import zlib
+import shutil
+import tempfile
+
+import numpy as np
+import pytest
+
+# the services import each other from the root of the application, and resolve
+# index files under `data/` of the working directory
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+WORK_DIR = tempfile.mkdtemp(prefix="search-tests-")
+os.makedirs(os.path.join(WORK_DIR, "data"))
+os.environ["INDEX_DB_URL"] = f"sqlite:///{WORK_DIR}/main.db"
+os.environ.setdefault("BASE_EMBEDDING_MODEL", "test-model")
+os.environ.setdefault("WORKER_PROCESSES", "2")
+os.chdir(WORK_DIR)
+
+
+def pytest_sessionfinish(session, exitstatus):
+    shutil.rmtree(WORK_DIR, ignore_errors=True)
+
+
+def unique_name(prefix="index"):
+    return f"{prefix}-{uuid.uuid4()}"
+
+
+@pytest.fixture
+def index_name():
+    """
+    A fresh index name. Every test shares the working directory (the worker
+    processes of sharded searches keep the one they were started in), so tests
+    never reuse a name.
+    """
+    return unique_name()
+
+
+class HashingModel:
+    """
+    A stand-in for the embedding model: every word adds one to a dimension picked
+    by its hash, so documents sharing words are similar and results are stable.
+    """
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def encode(self, texts, **kwargs):
+        embeddings = np.zeros((len(texts), 32), dtype='float32')
+        for i, text in enumerate(texts):
+            for word in str(text).lower().split():
+                embeddings[i, zlib.crc32(word.encode()) % 32] += 1
+        return embeddings
+
+
+@pytest.fixture
+def hashing_model(monkeypatch):
+    """
+    Replace the embedding model of the vector indexes by a `HashingModel`.
+    """
+    pytest.importorskip("sentence_transformers")
+    import services.vector_search as vector_search
+    monkeypatch.setattr(vector_search, "SentenceTransformer", HashingModel)
+    monkeypatch.setattr(vector_search, "_embedding_models", {})
+
+
+@pytest.fixture(scope="session")
+def api():
+    """
+    A test client of the application with a hashing embedding model, and helpers
+    to create source tables and search indexes.
+    """
+    pytest.importorskip("sentence_transformers")
+    from sqlalchemy import event, text
+    from fastapi.testclient import TestClient
+    import database.database as database
+    import services.vector_search as vector_search
+
+    @event.listens_for(database.engine, "connect")
+    def attach(connection, record):
+        connection.create_function("concat", -1, lambda *values: "".join(str(v) for v in values if v is not None))
+        connection.execute(f"ATTACH DATABASE '{WORK_DIR}/ai.db' AS ai")
+
+    vector_search.SentenceTransformer = HashingModel
+    vector_search._embedding_models.clear()
+
+    import main
+    return Api(TestClient(main.app), database.engine, text)
+
+
+class Api:
+    def __init__(self, client, engine, text):
+        self.client = client
+        self.engine = engine
+        self.text = text
+
+    def make_table(self, rows):
+        """
+        Create a source table of (id, body, category, status, updated_at) rows.
+
+        :return: The name of the table.
+        """
+        table = f"items_{uuid.uuid4().hex}"
+        with self.engine.begin() as connection:
+            connection.execute(self.text(
+                f"create table {table} (id text primary key, body text, category text, status text, updated_at text)"))
+            for row in rows:
+                connection.execute(self.text(
+                    f"insert into {table} values (:id, :body, :category, :status, :updated_at)"),
+                    {"category": None, "status": None, "updated_at": "2024-01-01", **row})
+        return table
+
+    def create_index(self, rows, updated_col="updated_at", **settings):
+        """
+        Build a search index of a new source table and wait for its build job.
+
+        :return: The ID of the search index.
+        """
+        response = self.client.post("/api/v1/index/create", json={
+            "title": unique_name("title"), "table_name": self.make_table(rows), "text_columns": "body",
+            "id_col": "id", "org_id": "org", "updated_col": updated_col, "settings": settings,
+        }).json()
+        job = self.wait_job(response["job_id"])
+        assert job["status"] == "completed", job
+        return response["id"]
+
+    def wait_job(self, job_id):
+        for _ in range(1200):
+            job = self.client.get(f"/api/v1/index/jobs/{job_id}").json()
+            if job["status"] not in ("queued", "running"):
+                return job
+            time.sleep(0.05)
+        return job
+
+    def search(self, index_id, method, query, **params):
+        response = self.client.get(f"/api/v1/search/{index_id}/{method}", params={"query": query, **params})
+        assert response.status_code == 200, response.text
+        return response.json()
+
+    def ids(self, index_id, method, query, **params):
+        return [result["id"] for result in self.search(index_id, method, query, top_k=1000, **params)["results"]]
@@ -0,0 +1,48 @@
+import pytest
+
+from services.analyzer import Analyzer
+from services.text_search import TextSearch
+
+
+def test_default_analyzer_lowercases_and_folds():
+    analyzer = Analyzer()
+    assert analyzer.terms("Café, CRÈME brûlée!") == ['cafe', 'creme', 'brulee']
+    assert [(start, end) for _, _, start, end in analyzer.tokens("Café, CRÈME")] == [(0, 4), (6, 11)]
+
+
+def test_indexes_without_analyzer_settings_split_on_whitespace():
+    analyzer = Analyzer.from_settings(None)
+    assert analyzer.terms("Café, CRÈME") == ['Café,', 'CRÈME']
+
+
+def test_stopwords_leave_position_gaps():
+    analyzer = Analyzer(stopwords='english')
+    assert [(position, term) for position, term, _, _ in analyzer.tokens("state of the art")] == [(0, 'state'), (3, 'art')]
+
+
+def test_stemming():
+    pytest.importorskip("nltk")
+    analyzer = Analyzer(stemmer='english')
+    assert analyzer.terms("running runs") == ['run', 'run']
+    # wildcard query words are normalized but neither split nor stemmed
+    assert analyzer.analyze_query("Runn* runs") == ((0, 'runn*'), (1, 'run'))
+
+
+@pytest.mark.parametrize("settings", [{'token_pattern': '('}, {'stopwords': 'klingon'}, {'stemmer': 'klingon'}])
+def test_invalid_settings(settings):
+    with pytest.raises(ValueError):
+        Analyzer(**settings)
+
+
+def test_queries_use_the_analyzer_of_the_index(index_name):
+    pytest.importorskip("nltk")
+    settings = {'analyzer': {'stopwords': 'english', 'stemmer': 'english'}, 'store_positions': True}
+    index = TextSearch(index_file=index_name, settings=settings)
+    index.add_documents([('1', "The runners were running"), ('2', "State of the Art"), ('3', "a café run")])
+    index.save_index()
+    index = TextSearch(index_file=index_name)
+
+    assert {result['id'] for result in index.search("RUNS", 'full_text')} == {'1', '3'}
+    assert set(index.boolean_match("cafe")) == {'3'}
+    assert set(index.boolean_match('"state of the art"')) == {'2'}
+    assert set(index.boolean_match('"state art"')) == set()
@@ -0,0 +1,64 @@
+import random
+from array import array
+
+import numpy as np
+import pytest
+
+from services.bitmaps import Bitmap, ARRAY_MAX, CONTAINER_SIZE
+
+
+def sample(seed, dense):
+    """
+    Sorted ordinals over three containers: the middle one a bitset when `dense`.
+    """
+    rng = random.Random(seed)
+    values = set(rng.sample(range(CONTAINER_SIZE), 50))
+    values |= {CONTAINER_SIZE + v for v in rng.sample(range(CONTAINER_SIZE), ARRAY_MAX * 3 if dense else 300)}
+    values |= {5 * CONTAINER_SIZE + v for v in rng.sample(range(CONTAINER_SIZE), 20)}
+    return sorted(values)
+
+
+SAMPLES = [(sample(1, False), sample(2, False)), (sample(3, True), sample(4, False)), (sample(5, True), sample(6, True))]
+
+
+@pytest.mark.parametrize("a, b", SAMPLES)
+def test_set_operations_match_python_sets(a, b):
+    x, y = Bitmap.from_sorted(a), Bitmap.from_sorted(b)
+    assert list(x.to_array()) == a
+    assert len(x) == len(a)
+    assert list((x & y).to_numpy()) == sorted(set(a) & set(b))
+    assert list((x | y).to_numpy()) == sorted(set(a) | set(b))
+    assert list((x - y).to_numpy()) == sorted(set(a) - set(b))
+    assert list((y - x).to_numpy()) == sorted(set(b) - set(a))
+
+
+def test_dense_containers_are_bitsets():
+    values = sample(3, True)
+    containers = Bitmap.from_sorted(values).containers
+    assert containers[0].dtype == np.uint16
+    assert containers[1].dtype == np.uint8
+    # emptied containers are dropped, and those sparse again go back to arrays
+    rest = Bitmap.from_sorted(values) - Bitmap.from_sorted([v for v in values if v >= CONTAINER_SIZE][:ARRAY_MAX * 2])
+    assert rest.containers[1].dtype == np.uint16
+
+
+def test_membership_mask_and_select():
+    values = sample(7, True)
+    bitmap = Bitmap.from_sorted(values)
+    probes = [-1, 0, values[0], values[1] + 1, values[-1], 7 * CONTAINER_SIZE] + values[100:110]
+    assert list(bitmap.mask(probes)) == [probe in set(values) for probe in probes]
+    assert all(value in bitmap for value in values[::97])
+    assert 3 * CONTAINER_SIZE not in bitmap
+
+    postings = array('I', range(0, 6 * CONTAINER_SIZE, 7))
+    assert list(bitmap.select(postings)) == sorted(set(postings) & set(values))
+
+
+def test_empty_bitmaps():
+    empty = Bitmap.from_sorted([])
+    values = Bitmap.from_sorted([1, 2, CONTAINER_SIZE + 3])
+    assert not empty and len(empty) == 0
+    assert (values & empty) == empty
+    assert (values | empty) == values
+    assert not (values - values)
+    assert list(empty.select(array('I', [1, 2]))) == []
@@ -0,0 +1,133 @@
+import pytest
+
+ROWS = [{"id": str(i), "body": f"alpha text {i}"} for i in range(10)]
+
+
+@pytest.fixture
+def session(api):
+    from database.database import SessionLocal
+    db = SessionLocal()
+    yield db
+    db.close()
+
+
+@pytest.mark.parametrize("columns", [
+    {"text_columns": ["missing"]},
+    {"text_columns": ["body", "missing"]},
+    {"id_column": "missing"},
+    {"extra_columns": ["missing"]},
+])
+def test_missing_column_is_a_value_error(api, session, columns):
+    from database import data_crud
+    arguments = {"text_columns": ["body"], "id_column": "id", **columns}
+    table = api.make_table(ROWS)
+    with pytest.raises(ValueError, match="Column not found: missing"):
+        list(data_crud.stream_table_with_columns(session, table, **arguments))
+    if "extra_columns" not in columns:
+        with pytest.raises(ValueError, match="Column not found: missing"):
+            data_crud.query_table_with_columns(session, table, arguments["text_columns"], arguments["id_column"])
+    with pytest.raises(ValueError, match="Column not found: missing"):
+        list(data_crud.stream_table_partitioned(session, table, partitions=2, chunk_size=2, **arguments))
+
+
+def test_sync_of_a_missing_column_is_a_bad_request(api, session):
+    from database import search_crud
+    index_id = api.create_index(ROWS)
+    table = search_crud.get_search_index(db=session, search_index_id=index_id).table_name
+    with api.engine.begin() as connection:
+        connection.execute(api.text(f"alter table {table} rename column body to content"))
+
+    response = api.client.post(f"/api/v1/index/{index_id}/sync")
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Column not found: body"
+
+
+@pytest.mark.parametrize("updated_col", ["updated_at", None], ids=["watermark", "content-hash"])
+def test_sync_applies_the_changes_of_the_source_table(api, session, updated_col):
+    from database import search_crud
+    rows = [{**row, "updated_at": f"2023-12-{10 + i}"} for i, row in enumerate(ROWS)]
+    index_id = api.create_index(rows, updated_col=updated_col)
+    table = search_crud.get_search_index(db=session, search_index_id=index_id).table_name
+    with api.engine.begin() as connection:
+        connection.execute(api.text(f"update {table} set body = 'zebra', updated_at = '2024-02-01' where id = '3'"))
+        connection.execute(api.text(f"insert into {table} (id, body, updated_at) values ('new', 'quokka', '2024-02-01')"))
+        connection.execute(api.text(f"delete from {table} where id = '5'"))
+
+    response = api.client.post(f"/api/v1/index/{index_id}/sync")
+    assert response.status_code == 200, response.text
+    # the last row of the build is read again, having the update time of the watermark
+    assert (response.json()["upserted"], response.json()["deleted"]) == (3 if updated_col else 2, 1)
+    assert api.ids(index_id, "full_text", "zebra") == ["3"]
+    assert api.ids(index_id, "full_text", "quokka") == ["new"]
+    assert sorted(api.ids(index_id, "full_text", "text")) == sorted(str(i) for i in range(10) if i not in (3, 5))
+    assert "5" not in api.ids(index_id, "similarity", "alpha text 5")
+
+    session.expire_all()
+    watermark = search_crud.get_search_index(db=session, search_index_id=index_id).sync_watermark
+    assert watermark == ("2024-02-01" if updated_col else None)
+    # the rows updated at the watermark are read again, in case more rows got the same update time
+    resync = api.client.post(f"/api/v1/index/{index_id}/sync").json()
+    assert (resync["upserted"], resync["deleted"]) == (2 if updated_col else 0, 0)
+    assert api.ids(index_id, "full_text", "zebra") == ["3"]
+
+
+@pytest.mark.parametrize("column_type, values, since, expected", [
+    ("timestamp", [f"2024-01-0{day} 00:00:00" for day in range(1, 6)], "2024-01-03 12:00:00", ["3", "4"]),
+    ("integer", [1, 2, 10, 20, 100], "10", ["2", "3", "4"]),
+    ("text", ["a", "b", "c", "d", "e"], "c", ["2", "3", "4"]),
+])
+def test_updated_range_compares_values_of_the_column_type(api, session, column_type, values, since, expected):
+    from database import data_crud
+    table = f"typed_{column_type}"
+    with api.engine.begin() as connection:
+        connection.execute(api.text(f"create table {table} (id text primary key, body text, updated_at {column_type})"))
+        for i, value in enumerate(values):
+            connection.execute(api.text(f"insert into {table} values (:id, 'text', :updated_at)"),
+                               {"id": str(i), "updated_at": value})
+
+    query = data_crud.text_columns_query(session, table, ["body"], "id", updated_range=("updated_at", since, None))
+    assert sorted(row[0] for row in query.all()) == expected
+
+
+def test_failed_sync_keeps_the_watermark(api, session, monkeypatch):
+    from database import search_crud
+    import services.text_search as text_search_module
+    rows = [{**row, "updated_at": f"2023-12-{10 + i}"} for i, row in enumerate(ROWS)]
+    index_id = api.create_index(rows)
+    table = search_crud.get_search_index(db=session, search_index_id=index_id).table_name
+    with api.engine.begin() as connection:
+        connection.execute(api.text(f"insert into {table} (id, body, updated_at) values ('new', 'quokka', '2024-02-01')"))
+
+    def fail(path, *args, **kwargs):
+        raise OSError(f"No space left on device: {path}")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(text_search_module, "write_pickle", fail)
+        with pytest.raises(OSError):
+            api.client.post(f"/api/v1/index/{index_id}/sync")
+    session.expire_all()
+    assert search_crud.get_search_index(db=session, search_index_id=index_id).sync_watermark == "2023-12-19"
+
+    # the next sync applies the change again
+    assert api.client.post(f"/api/v1/index/{index_id}/sync").json()["upserted"] == 2
+    assert api.ids(index_id, "full_text", "quokka") == ["new"]
+
+
+def test_text_ids_are_split_into_ranges_of_the_same_size(api, session):
+    from sqlalchemy import event
+    from database import data_crud
+    rows = [{"id": f"doc-{i:03d}", "body": f"alpha text {i}"} for i in range(100)]
+    table = api.make_table(rows)
+
+    statements = []
+    record = lambda conn, cursor, statement, *args: statements.append(statement)
+    event.listen(api.engine, "before_cursor_execute", record)
+    try:
+        ranges = data_crud.id_partitions(session, table, "id", partitions=4, min_rows=10)
+    finally:
+        event.remove(api.engine, "before_cursor_execute", record)
+    # the bounds are read in one pass, not skipped to with an OFFSET each
+    assert not any("OFFSET" in statement.upper() for statement in statements)
+    assert ranges == [(None, "doc-025"), ("doc-025", "doc-050"), ("doc-050", "doc-075"), ("doc-075", None)]
+    chunks = data_crud.stream_table_partitioned(session, table, ["body"], "id", partitions=4, chunk_size=10)
+    assert sorted(row[0] for chunk in chunks for row in chunk) == [row["id"] for row in rows]
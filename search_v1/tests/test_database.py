@@ -0,0 +1,26 @@
+import pytest
+from sqlalchemy import create_engine, event, inspect, text
+
+
+def test_missing_columns_are_added_to_existing_tables(tmp_path):
+    from database import models
+
+    engine = create_engine(f"sqlite:///{tmp_path}/main.db")
+
+    @event.listens_for(engine, "connect")
+    def attach(connection, record):
+        connection.execute(f"ATTACH DATABASE '{tmp_path}/ai.db' AS ai")
+
+    # a search index table created before the sync columns were added
+    with engine.begin() as connection:
+        connection.execute(text("create table ai.search_index (id integer primary key, global_id varchar, title varchar)"))
+        connection.execute(text("insert into ai.search_index (global_id, title) values ('old', 'Old index')"))
+    models.Base.metadata.create_all(bind=engine)
+    models.add_missing_columns(engine)
+    models.add_missing_columns(engine)
+
+    columns = {column['name'] for column in inspect(engine).get_columns('search_index', schema='ai')}
+    assert {column.name for column in models.SearchIndex.__table__.columns} <= columns
+    with engine.connect() as connection:
+        assert connection.execute(text("select title, updated_col, sync_watermark from ai.search_index")).all() == [
+            ('Old index', None, None)]
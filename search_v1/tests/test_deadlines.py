@@ -0,0 +1,57 @@
+import time
+
+import pytest
+
+import services.deadlines as deadlines
+from services.deadlines import Deadline, request_deadline, bounded, expired
+from services.text_search import TextSearch
+
+
+def test_deadline_is_sticky():
+    deadline = Deadline(0)
+    assert deadline.expired() and deadline.reached
+    # a later deadline sharing its expiry is reached on its own
+    shared = Deadline(60000)
+    assert not shared.share().expired()
+    late = Deadline(0).share()
+    assert not late.reached
+    assert late.expired()
+
+
+def test_request_deadline(monkeypatch):
+    monkeypatch.setattr(deadlines, 'SEARCH_TIMEOUT_MS', 5000)
+    deadline = request_deadline()
+    assert 4 < deadline.expires_at - time.monotonic() <= 5
+    assert request_deadline(100).expires_at < deadline.expires_at
+    monkeypatch.setattr(deadlines, 'SEARCH_TIMEOUT_MS', 0)
+    assert request_deadline() is None
+    assert not expired(None)
+
+
+def test_bounded():
+    items = list(range(10))
+    assert bounded(items, None) is items
+    assert list(bounded(items, Deadline(60000), interval=3)) == items
+    assert list(bounded(items, Deadline(0), interval=3)) == []
+
+
+@pytest.fixture
+def index(index_name):
+    index = TextSearch(index_file=index_name)
+    index.add_documents([(str(i), f"alpha w{i % 7} text {i}") for i in range(3000)])
+    index.save_index()
+    return index
+
+
+# unranked methods read a page of matches in index order, they are not bounded
+@pytest.mark.parametrize("method", ['full_text', 'ranked_naive', 'boolean_ranked', 'fuzzy'])
+def test_search_stops_at_the_deadline(index, method):
+    complete = index.search('alpha w3', method, top_k=10)
+    deadline = Deadline(60000)
+    assert index.search('alpha w3', method, top_k=10, deadline=deadline) == complete
+    assert not deadline.reached
+
+    deadline = Deadline(0)
+    partial = index.search('alpha w3', method, top_k=10, deadline=deadline)
+    assert deadline.reached
+    assert len(partial) < len(complete)
@@ -0,0 +1,45 @@
+import pytest
+
+from services.document_store import DocumentStore
+
+TEXTS = ["alpha", None, "", "café " * 200, "short"]
+
+
+@pytest.fixture(params=[None, 'zlib'])
+def store(tmp_path, request):
+    store = DocumentStore(path=str(tmp_path / "store"), compression=request.param)
+    yield store
+    store.close()
+
+
+def test_records_are_read_back_by_ordinal(store):
+    store.append_documents(TEXTS[:2], 0)
+    store.append_documents(TEXTS[2:], 2)
+    assert [store.fetch(ordinal) for ordinal in range(len(TEXTS))] == TEXTS
+
+
+def test_compressed_records_are_smaller(tmp_path):
+    sizes = {}
+    for compression in (None, 'zlib'):
+        store = DocumentStore(path=str(tmp_path / str(compression)), compression=compression)
+        store.append_documents(TEXTS, 0)
+        sizes[compression] = (tmp_path / f"{compression}.bin").stat().st_size
+    assert sizes['zlib'] < sizes[None]
+
+
+def test_interrupted_append_is_overwritten(store):
+    store.append_documents(TEXTS, 0)
+    # appending from ordinal 2 again drops the records from there on
+    store.append_documents(["replaced", "added"], 2)
+    assert [store.fetch(ordinal) for ordinal in range(4)] == ["alpha", None, "replaced", "added"]
+
+
+def test_unknown_compression(tmp_path):
+    with pytest.raises(ValueError, match="Unknown document compression"):
+        DocumentStore(path=str(tmp_path / "store"), compression='lzma').append_documents(["alpha"], 0)
+
+
+def test_records_are_read_without_pread(store, monkeypatch):
+    store.append_documents(TEXTS, 0)
+    monkeypatch.delattr("os.pread")
+    assert [store.fetch(ordinal) for ordinal in reversed(range(len(TEXTS)))] == TEXTS[::-1]
@@ -0,0 +1,96 @@
+import pytest
+
+ROWS = [{"id": str(i), "body": f"alpha w{i % 7} text {i}"} for i in range(30)]
+
+METHODS = ["ranked_naive", "full_text", "boolean_ranked", "exact", "fuzzy", "similarity", "exact_similarity"]
+
+
+@pytest.fixture(scope="module", params=[1, 3], ids=["single", "sharded"])
+def index_id(api, request):
+    return api.create_index(ROWS, shards=request.param)
+
+
+@pytest.mark.parametrize("method", METHODS)
+def test_deleted_document_leaves_every_search_method(api, index_id, method):
+    response = api.client.delete(f"/api/v1/index/{index_id}/documents/7")
+    assert response.status_code in (200, 404)
+    assert "14" in api.ids(index_id, method, "w0")
+    assert "7" not in api.ids(index_id, method, "w0")
+
+
+def test_deleted_document_leaves_batch_search(api, index_id):
+    api.client.delete(f"/api/v1/index/{index_id}/documents/7")
+    response = api.client.post(f"/api/v1/search/{index_id}/batch", json={"queries": [
+        {"query": "w0", "method": method, "top_k": 1000} for method in ("full_text", "similarity")
+    ]}).json()
+    for result in response["results"]:
+        assert "7" not in [r["id"] for r in result["results"]]
+
+
+def test_deleting_a_missing_document_is_not_found(api, index_id):
+    assert api.client.delete(f"/api/v1/index/{index_id}/documents/missing").status_code == 404
+
+
+def test_updated_document_is_embedded_again(api, index_id):
+    response = api.client.put(f"/api/v1/index/{index_id}/documents/3", json={"text": "zebra quokka"})
+    assert response.status_code == 200
+
+    for method in ("similarity", "exact_similarity"):
+        top = api.search(index_id, method, "zebra quokka", top_k=1)["results"][0]
+        assert top["id"] == "3"
+        assert top["text"] == "zebra quokka"
+        assert top["score"] == pytest.approx(1, abs=1e-4)
+    assert api.ids(index_id, "full_text", "quokka") == ["3"]
+    assert "3" not in api.ids(index_id, "similarity", "w3")[:1]
+
+
+def test_added_document_is_searchable(api, index_id):
+    api.client.put(f"/api/v1/index/{index_id}/documents/new", json={"text": "okapi narwhal"})
+    assert api.search(index_id, "similarity", "okapi narwhal", top_k=1)["results"][0]["id"] == "new"
+    assert api.ids(index_id, "full_text", "okapi") == ["new"]
+
+
+@pytest.mark.parametrize("shards", [1, 3])
+def test_updated_document_matches_filters(api, shards):
+    rows = [{**row, "category": "odd" if int(row["id"]) % 2 else "even"} for row in ROWS]
+    index_id = api.create_index(rows, shards=shards, filter_columns=["category"])
+    response = api.client.put(f"/api/v1/index/{index_id}/documents/4",
+                              json={"text": "zebra quokka", "attributes": {"category": "odd"}})
+    assert response.status_code == 200
+
+    for method in ("full_text", "similarity", "exact_similarity"):
+        assert "4" in api.ids(index_id, method, "zebra quokka", filter="category:odd")
+        assert "4" not in api.ids(index_id, method, "zebra quokka", filter="category:even")
+    top = api.search(index_id, "similarity", "zebra quokka", top_k=1, filter="category:odd")["results"][0]
+    assert (top["id"], top["text"]) == ("4", "zebra quokka")
+
+
+def test_changes_are_journaled_in_the_cached_indexes(api, monkeypatch):
+    from routers import index_router
+    from services.generations import current_index_name
+    from services.index_cache import get_text_search
+    from services.text_search import TextSearch
+    from services.vector_search import VectorSearch, get_vector_search
+
+    index_id = api.create_index(ROWS, shards=1)
+    name = current_index_name(index_id)
+    text_search, vector_search = get_text_search(name), get_vector_search(name)
+
+    # neither index is written out in full for a single document; merges, which
+    # checkpoint the journals, are left to their background task
+    monkeypatch.setattr(index_router, 'merge_text_index', lambda index_name: None)
+    monkeypatch.setattr(TextSearch, 'save_index', lambda *args, **kwargs: pytest.fail("saved the text index"))
+    monkeypatch.setattr(VectorSearch, 'save_index', lambda *args, **kwargs: pytest.fail("saved the vector index"))
+    assert api.client.put(f"/api/v1/index/{index_id}/documents/3", json={"text": "zebra quokka"}).status_code == 200
+    assert api.client.delete(f"/api/v1/index/{index_id}/documents/5").status_code == 200
+
+    assert get_text_search(name) is text_search
+    assert get_vector_search(name) is vector_search
+    assert api.search(index_id, "similarity", "zebra quokka", top_k=1)["results"][0]["id"] == "3"
+    assert "5" not in api.ids(index_id, "similarity", "w5")
+
+    # replayed from the journals when the indexes are loaded again
+    reloaded = VectorSearch(file_id=name)
+    assert reloaded.search("zebra quokka", "similarity", top_k=1)[0]["id"] == "3"
+    assert "5" not in [r["id"] for r in reloaded.search("w5", "similarity", top_k=100)]
+    assert TextSearch(index_file=name).search("quokka", "full_text")[0]["id"] == "3"
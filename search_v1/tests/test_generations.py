@@ -0,0 +1,79 @@
+import os
+
+import pytest
+
+from services import generations
+from services.generations import (collect_all_generations, current_index_name, generation_file, generation_name,
+                                  new_generation, read_generations, swap_generation)
+from services.segments import write_pickle
+
+
+def build(index_id, generation):
+    """
+    Write the files of a generation, as if built.
+    """
+    name = generation_name(index_id, generation)
+    for suffix in ("ivf.pkl", "faiss.index"):
+        with open(f"data/{name}_{suffix}", "wb") as f:
+            f.write(b"index")
+    return name
+
+
+def exists(name):
+    return os.path.exists(f"data/{name}_ivf.pkl")
+
+
+def age(index_id, seconds):
+    """
+    Move back the time the replaced generations of an index were replaced at.
+    """
+    state = read_generations(index_id)
+    state['obsolete'] = [(generation, replaced - seconds) for generation, replaced in state['obsolete']]
+    write_pickle(generation_file(index_id), state)
+
+
+@pytest.fixture
+def swapped(index_name):
+    """
+    An index whose first generation was replaced by a second one.
+    """
+    first = build(index_name, 0)
+    generation = new_generation(index_name)
+    second = build(index_name, generation)
+    swap_generation(index_name, generation)
+    return index_name, first, second
+
+
+def test_replaced_generation_is_kept_for_the_grace_period(swapped):
+    index_id, first, second = swapped
+    assert current_index_name(index_id) == second
+    collect_all_generations()
+    assert exists(first)
+
+
+def test_next_swap_collects_stale_generations(swapped):
+    index_id, first, second = swapped
+    age(index_id, generations.GENERATION_GRACE_SECONDS)
+
+    generation = new_generation(index_id)
+    third = build(index_id, generation)
+    swap_generation(index_id, generation)
+
+    assert not exists(first)
+    # replaced by this swap, it is still within its grace period
+    assert exists(second)
+    assert current_index_name(index_id) == third
+    assert os.path.exists(generation_file(index_id))
+    assert [generation for generation, _ in read_generations(index_id)['obsolete']] == [1]
+
+
+def test_startup_collects_stale_generations(api, swapped):
+    index_id, first, second = swapped
+    age(index_id, generations.GENERATION_GRACE_SECONDS)
+
+    with type(api.client)(api.client.app):
+        pass
+
+    assert not exists(first)
+    assert exists(second)
+    assert read_generations(index_id)['obsolete'] == []
@@ -0,0 +1,90 @@
+import threading
+
+import pytest
+
+from services.jobs import Job, JobRunner, JobCancelled, COMPLETED, FAILED, CANCELLED
+
+
+def wait(job):
+    for _ in range(200):
+        if job.finished_at is not None:
+            return
+        threading.Event().wait(0.01)
+
+
+@pytest.fixture
+def runner():
+    runner = JobRunner(max_workers=1)
+    yield runner
+    runner.executor.shutdown(wait=True)
+
+
+def blocker(runner):
+    """
+    Occupy the only worker of a runner until the returned event is set.
+    """
+    release = threading.Event()
+    runner.submit(Job('block', 'index'), lambda job: release.wait(5))
+    return release
+
+
+def test_job_progress_and_outcome(runner):
+    def build(job, rows):
+        for _ in range(rows):
+            job.advance('rows_read', 1)
+
+    done = runner.submit(Job('build', 'index'), build, 3)
+    failed = runner.submit(Job('build', 'index'), lambda job: 1 / 0)
+    wait(done), wait(failed)
+    assert done.status == COMPLETED and done.progress['rows_read'] == 3
+    assert failed.status == FAILED and 'division' in failed.error
+    assert not done.cancel()
+    assert runner.get(done.id) is done
+
+
+def test_running_job_stops_at_its_next_progress_report(runner):
+    started, stopped = threading.Event(), []
+
+    def build(job):
+        started.set()
+        try:
+            while True:
+                job.advance('rows_read', 1)
+        except JobCancelled:
+            stopped.append(True)
+            raise
+
+    job = runner.submit(Job('build', 'index'), build)
+    started.wait(5)
+    assert job.cancel()
+    wait(job)
+    assert job.status == CANCELLED and stopped
+
+
+def test_queued_job_is_cleaned_up_when_cancelled(runner):
+    release = blocker(runner)
+    calls = []
+    job = runner.submit(Job('build', 'index', on_cancel=lambda: calls.append('cancel')), lambda job: calls.append('run'))
+    assert job.cancel()
+    release.set()
+    wait(job)
+    assert job.status == CANCELLED
+    assert calls == ['cancel']
+
+
+def test_cancelled_queued_build_removes_its_search_index(api, monkeypatch):
+    import routers.index_router as index_router
+
+    runner = JobRunner(max_workers=1)
+    monkeypatch.setattr(index_router, "get_job_runner", lambda: runner)
+    release = blocker(runner)
+    response = api.client.post("/api/v1/index/create", json={
+        "title": "queued", "table_name": api.make_table([{"id": "1", "body": "alpha"}]), "text_columns": "body",
+        "id_col": "id", "org_id": "org"}).json()
+    assert api.client.post(f"/api/v1/index/jobs/{response['job_id']}/cancel").status_code == 200
+    release.set()
+    wait(runner.get(response["job_id"]))
+    runner.executor.shutdown(wait=True)
+
+    assert runner.get(response["job_id"]).status == CANCELLED
+    assert api.client.post(f"/api/v1/index/{response['id']}/sync").status_code == 404
@@ -0,0 +1,32 @@
+import pytest
+
+from services.positions import encode_positions, decode_positions, match_positions, min_span
+
+
+def test_positions_round_trip():
+    positions = [0, 1, 5, 127, 128, 300, 70000, 70001]
+    assert decode_positions(encode_positions(positions)) == positions
+    assert decode_positions(encode_positions([])) == []
+    # small gaps take a byte each
+    assert len(encode_positions(range(0, 100, 3))) == 34
+
+
+@pytest.mark.parametrize("positions, slop, offsets, expected", [
+    ([[0, 7], [1]], 0, None, True),
+    ([[1], [0]], 0, None, False),
+    ([[0], [2]], 0, None, False),
+    ([[0], [2]], 1, None, True),
+    ([[2], [0]], 1, None, True),
+    ([[0], [3]], 1, None, False),
+    # the middle word of "state of the art" is a stopword
+    ([[4], [6]], 0, [0, 2], True),
+    ([[4], [5]], 0, [0, 2], False),
+    ([[0], []], 3, None, False),
+])
+def test_match_positions(positions, slop, offsets, expected):
+    assert match_positions(positions, slop, offsets) is expected
+
+
+def test_min_span():
+    assert min_span([[0, 10], [5, 12], [11]]) == 3
+    assert min_span([[1], []]) is None
@@ -0,0 +1,69 @@
+import random
+from array import array
+
+import pytest
+
+from services.query_parser import QueryParseError, QueryPlanner, Term, Phrase, And, Or, Not, parse_query
+
+
+@pytest.mark.parametrize("query, tree", [
+    ("a", "Term('a')"),
+    ("a b", "And([Term('a'), Term('b')])"),
+    ("a AND b OR c", "Or([And([Term('a'), Term('b')]), Term('c')])"),
+    ("a (b OR c)", "And([Term('a'), Or([Term('b'), Term('c')])])"),
+    ("-a b", "And([Not(Term('a')), Term('b')])"),
+    ("NOT NOT a", "Not(Not(Term('a')))"),
+    ('"a b"~2 c', "And([Phrase(['a', 'b'], slop=2), Term('c')])"),
+    ('"a"', "Term('a')"),
+    ("", "None"),
+])
+def test_parse(query, tree):
+    assert repr(parse_query(query)) == tree
+
+
+@pytest.mark.parametrize("query", ['"a b', "(a b", "a )", "OR", "a AND", '""', "()"])
+def test_malformed_queries(query):
+    with pytest.raises(QueryParseError):
+        parse_query(query)
+
+
+VOCABULARY = ["a", "b", "c", "d", "e"]
+DOCUMENTS = [[random.Random(i).choice(VOCABULARY) for _ in range(random.Random(-i).randint(1, 8))] for i in range(200)]
+
+
+def naive(node, document):
+    """
+    Match a query tree against a tokenized document, the slow way.
+    """
+    if isinstance(node, Term):
+        return node.word in document
+    if isinstance(node, Phrase):
+        size = len(node.words)
+        return any(document[i:i + size] == node.words for i in range(len(document)))
+    if isinstance(node, And):
+        return all(naive(child, document) for child in node.children)
+    if isinstance(node, Or):
+        return any(naive(child, document) for child in node.children)
+    return not naive(node.child, document)
+
+
+@pytest.fixture(scope="module")
+def planner():
+    postings = {word: array('I', [i for i, document in enumerate(DOCUMENTS) if word in document]) for word in VOCABULARY}
+
+    def match_phrase(node, candidates):
+        return array('I', [i for i in candidates if naive(node, DOCUMENTS[i])])
+
+    return QueryPlanner(lambda word: postings.get(word, array('I')), lambda: array('I', range(len(DOCUMENTS))),
+                        match_phrase)
+
+
+@pytest.mark.parametrize("query", [
+    "a", "a b", "a -b", "-a -b", "a OR b", "(a OR b) -c", "a (b OR -c)", '"a b"', '"a b" c', 'c "a b" -d',
+    "(a b) OR (c -d) OR e", "NOT (a OR b)", "z", "a z", "a OR z", "-z",
+])
+def test_planner_matches_naive_evaluation(planner, query):
+    node = parse_query(query)
+    expected = [i for i, document in enumerate(DOCUMENTS) if naive(node, document)]
+    assert list(planner.execute(node)) == expected
+    assert list(planner.iterate(node)) == expected
@@ -0,0 +1,110 @@
+import pytest
+
+ROWS = [{"id": str(i), "body": f"alpha w{i % 7} text {i}"} for i in range(40)]
+
+
+@pytest.fixture(scope="module")
+def index_id(api):
+    return api.create_index(ROWS)
+
+
+@pytest.mark.parametrize("query", [
+    {"offset": -3},
+    {"top_k": None},
+    {"top_k": 0},
+    {"top_k": 0, "method": "similarity"},
+    {"top_k": 1001},
+])
+def test_batch_and_federated_queries_are_bounded(api, index_id, query):
+    batch = api.client.post(f"/api/v1/search/{index_id}/batch", json={"queries": [{"query": "alpha", **query}]})
+    federated = api.client.post("/api/v1/search/federated", json={"index_ids": [index_id], "query": "alpha", **query})
+    assert batch.status_code == 422
+    assert federated.status_code == 422
+
+
+def test_batch_pages_match_single_queries(api, index_id):
+    response = api.client.post(f"/api/v1/search/{index_id}/batch", json={"queries": [
+        {"query": "w3", "method": "full_text", "top_k": 3, "offset": 1},
+        {"query": "w3", "method": "similarity", "top_k": 2},
+    ]}).json()
+    assert response["results"][0]["results"] == api.search(index_id, "full_text", "w3", top_k=3, offset=1)["results"]
+    single = api.search(index_id, "similarity", "w3", top_k=2)["results"]
+    assert [r["score"] for r in response["results"][1]["results"]] == pytest.approx([r["score"] for r in single])
+
+
+BATCH_METHODS = ["full_text", "ranked_naive", "boolean_ranked", "exact_similarity", "similarity"]
+
+
+def test_batch_queries_are_complete_in_time(api, index_id):
+    response = api.client.post(f"/api/v1/search/{index_id}/batch", json={
+        "queries": [{"query": "w3", "method": method} for method in BATCH_METHODS], "timeout_ms": 60000}).json()
+    assert [result["partial"] for result in response["results"]] == [False] * len(BATCH_METHODS)
+    assert all(result["results"] for result in response["results"])
+
+
+def test_batch_queries_stop_at_the_request_deadline(api, index_id, monkeypatch):
+    import routers.search_router as search_router
+    from services.deadlines import Deadline
+
+    # a deadline which has already passed when the first query runs
+    monkeypatch.setattr(search_router, "request_deadline", lambda timeout_ms: Deadline(0))
+    response = api.client.post(f"/api/v1/search/{index_id}/batch", json={
+        "queries": [{"query": "w3", "method": method} for method in BATCH_METHODS]}).json()
+    assert [result["partial"] for result in response["results"]] == [True] * len(BATCH_METHODS)
+    assert [result["results"] for result in response["results"]] == [[]] * len(BATCH_METHODS)
+
+
+@pytest.mark.parametrize("method", ["full_text", "ranked_naive", "exact", "similarity"])
+def test_streamed_results_match_a_full_page(api, index_id, method):
+    import orjson
+
+    response = api.client.get(f"/api/v1/search/{index_id}/{method}",
+                              params={"query": "w3", "stream": True, "fields": "id,score"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    streamed = [orjson.loads(line) for line in response.text.splitlines()]
+    page = api.search(index_id, method, "w3", top_k=1000, fields="id,score")["results"]
+    # equally scored documents may come in another order
+    assert {result["id"]: result.get("score") for result in streamed} == pytest.approx(
+        {result["id"]: result.get("score") for result in page})
+    if method != "exact":
+        assert [result["score"] for result in streamed] == sorted((result["score"] for result in streamed), reverse=True)
+
+
+
+class CountdownDeadline:
+    """
+    A deadline reached once it was checked a number of times.
+    """
+
+    def __init__(self, checks):
+        self.checks = checks
+        self.reached = False
+
+    def expired(self):
+        self.checks -= 1
+        self.reached = self.reached or self.checks < 0
+        return self.reached
+
+
+@pytest.mark.parametrize("method", ["full_text", "exact", "similarity"])
+def test_streamed_results_stop_at_the_request_deadline(api, index_id, monkeypatch, method):
+    import orjson
+    import routers.search_router as search_router
+
+    monkeypatch.setattr(search_router, "request_deadline", lambda timeout_ms: CountdownDeadline(3))
+    response = api.client.get(f"/api/v1/search/{index_id}/{method}",
+                              params={"query": "w3", "stream": True, "fields": "id"})
+    lines = [orjson.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 4
+    assert all("id" in line for line in lines[:3])
+    assert lines[-1] == {"partial": True}
+
+def test_search_endpoints_run_in_the_threadpool():
+    import inspect
+    from routers import search_router
+
+    # searches block on the indexes and the worker processes, so they must not
+    # run on the event loop
+    for route in search_router.router.routes:
+        assert not inspect.iscoroutinefunction(route.endpoint), route.path
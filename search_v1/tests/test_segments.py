@@ -0,0 +1,42 @@
+import glob
+import threading
+
+import pytest
+
+from services.segments import write_pickle, read_pickle
+
+
+def temp_files(path):
+    return glob.glob(f"{glob.escape(path)}.*")
+
+
+def test_concurrent_writers_never_share_a_temporary_file(index_name):
+    path = f"data/{index_name}.pkl"
+    payloads = [list(range(writer, 200000, 4)) for writer in range(4)]
+    errors = []
+
+    def write(payload):
+        try:
+            for _ in range(5):
+                write_pickle(path, payload, sync=False)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=write, args=(payload,)) for payload in payloads]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert read_pickle(path) in payloads
+    assert temp_files(path) == []
+
+
+def test_failed_write_keeps_the_file(index_name):
+    path = f"data/{index_name}.pkl"
+    write_pickle(path, {'version': 1})
+    with pytest.raises(Exception):
+        write_pickle(path, {'version': 2, 'unpicklable': lambda: None})
+    assert read_pickle(path) == {'version': 1}
+    assert temp_files(path) == []
@@ -0,0 +1,113 @@
+import pytest
+
+import services.shards as shards_module
+import services.text_search as text_search_module
+from services.shards import build_index, open_text_index, open_vector_index, shard_names, shard_of
+from services.text_search import TextSearch
+from services.deadlines import Deadline
+
+ROWS = [(str(i), f"alpha w{i % 7} text {i}") for i in range(400)]
+
+
+def chunked(rows, size):
+    return [rows[i:i + size] for i in range(0, len(rows), size)]
+
+
+def scores(index, query, method='full_text'):
+    return {result['id']: result['score'] for result in index.search(query, method, fields=('id', 'score'))}
+
+
+@pytest.fixture
+def built(index_name, hashing_model, monkeypatch):
+    """
+    Build the same rows as a 3 shard index and as a single index, recording the
+    number of documents of each `TextSearch.add_documents` call.
+    """
+    batches = []
+    add_documents = TextSearch.add_documents
+
+    def record(self, documents):
+        batches.append((self.index_name, len(documents)))
+        return add_documents(self, documents)
+
+    monkeypatch.setattr(TextSearch, 'add_documents', record)
+    monkeypatch.setattr(shards_module, 'PARALLEL_BUILD_MIN_DOCS', 50)
+    monkeypatch.setattr(text_search_module, 'PARALLEL_BUILD_MIN_DOCS', 50)
+
+    single = f"{index_name}-single"
+    build_index(single, {'shards': 1}, chunked(ROWS, 40))
+    batches.clear()
+    build_index(index_name, {'shards': 3}, chunked(ROWS, 40))
+    return index_name, single, batches
+
+
+def test_build_batches_rows_across_chunks(built):
+    index_name, _, batches = built
+    names = shard_names(index_name)
+    assert len(names) == 3
+    for name in names:
+        sizes = [size for batch_name, size in batches if batch_name == name]
+        # only the last batch of a shard is smaller than the parallel build threshold
+        assert all(size >= 50 for size in sizes[:-1])
+        assert sum(sizes) == sum(1 for doc_id, _ in ROWS if names[shard_of(doc_id, 3)] == name)
+
+
+def test_sharded_scores_match_single_index(built):
+    index_name, single, _ = built
+    sharded = open_text_index(index_name)
+    single = open_text_index(single)
+    for method in ('full_text', 'ranked_naive', 'boolean_ranked'):
+        assert scores(sharded, 'w3 alpha', method) == pytest.approx(scores(single, 'w3 alpha', method))
+    assert sorted(r['id'] for r in sharded.search('w3', 'exact')) == sorted(r['id'] for r in single.search('w3', 'exact'))
+
+
+def test_sharded_similarity_matches_single_index(built):
+    index_name, single, _ = built
+    sharded = open_vector_index(index_name)
+    single = open_vector_index(single)
+    for method in ('similarity', 'exact_similarity'):
+        expected = single.search('w3 alpha', method, top_k=20, fields=('id', 'score'))
+        results = sharded.search('w3 alpha', method, top_k=20, fields=('id', 'score'))
+        assert [r['score'] for r in results] == pytest.approx([r['score'] for r in expected])
+
+
+@pytest.mark.parametrize("method", ['full_text', 'similarity'])
+def test_sharded_batch_queries_stop_at_their_deadline(built, method):
+    index_name, _, _ = built
+    index = open_vector_index(index_name) if method == 'similarity' else open_text_index(index_name)
+    late, in_time = Deadline(0), Deadline(60000)
+    results = index.search_batch([{'query': 'w3', 'method': method, 'top_k': 5, 'deadline': late},
+                                  {'query': 'w3', 'method': method, 'top_k': 5, 'deadline': in_time}])
+    assert results[0] == [] and late.reached
+    assert len(results[1]) == 5 and not in_time.reached
+
+
+def test_sharded_collection_stats_are_summed(built):
+    index_name, single, _ = built
+    sharded = open_text_index(index_name).collection_stats('w3 alpha missing', 'full_text')
+    expected = open_text_index(single).collection_stats('w3 alpha missing', 'full_text')
+    assert sharded['total_docs'] == expected['total_docs'] == len(ROWS)
+    assert sharded['total_length'] == expected['total_length']
+    assert sharded['doc_freqs'] == expected['doc_freqs']
+    assert sharded['doc_freqs']['alpha'] == len(ROWS)
+
+
+@pytest.mark.parametrize("method", ['full_text', 'exact', 'similarity'])
+def test_sharded_results_are_merged_lazily(built, monkeypatch, method):
+    index_name, _, _ = built
+    index = open_vector_index(index_name) if method == 'similarity' else open_text_index(index_name)
+    top_k = len(ROWS) if method == 'similarity' else None
+    expected = index.search('w3 alpha', method, top_k=top_k, fields=('id', 'score'))
+
+    # the shards are read one result at a time, no page is built
+    monkeypatch.setattr(shards_module, 'merge_ranked', lambda *args: pytest.fail("merged a page"))
+    monkeypatch.setattr(shards_module, 'merge_unranked', lambda *args: pytest.fail("merged a page"))
+    results = index.iter_search('w3 alpha', method, fields=('id', 'score'))
+    first = next(results)
+    results = [first, *results]
+    if method == 'exact':
+        assert results == expected
+    else:
+        # results of the same score may come in another order
+        assert first['score'] == pytest.approx(expected[0]['score'])
+        assert {r['id']: r['score'] for r in results} == pytest.approx({r['id']: r['score'] for r in expected})
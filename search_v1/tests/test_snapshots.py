@@ -0,0 +1,76 @@
+import io
+import json
+import glob
+import tarfile
+
+import pytest
+
+from services.shards import build_index, open_text_index, open_vector_index
+from services.snapshots import SnapshotError, export_snapshot, import_snapshot
+from services.generations import current_index_name
+
+ROWS = [(str(i), f"alpha w{i % 7} text {i}") for i in range(60)]
+
+
+def scores(index, query, method):
+    return {result['id']: result['score'] for result in index.search(query, method, top_k=20, fields=('id', 'score'))}
+
+
+@pytest.fixture(params=[1, 3], ids=["single", "sharded"])
+def snapshot(index_name, hashing_model, request):
+    build_index(index_name, {'shards': request.param}, [ROWS])
+    return index_name, b''.join(export_snapshot(index_name, {'global_id': index_name, 'title': 'items'}))
+
+
+def rewrite(archive, change):
+    """
+    Rebuild a snapshot archive, changing the contents of its members with `change`.
+    """
+    output = io.BytesIO()
+    with tarfile.open(fileobj=io.BytesIO(archive)) as source, tarfile.open(fileobj=output, mode='w') as target:
+        for member in source:
+            data = change(member.name, source.extractfile(member).read())
+            if data is None:
+                continue
+            member.size = len(data)
+            target.addfile(member, io.BytesIO(data))
+    return output.getvalue()
+
+
+def test_imported_snapshot_searches_like_the_index(snapshot):
+    index_id, archive = snapshot
+    expected = {method: scores(open_text_index(index_id) if method == 'full_text' else open_vector_index(index_id),
+                               'w3 alpha', method)
+                for method in ('full_text', 'similarity')}
+
+    assert import_snapshot(io.BytesIO(archive)) == {'global_id': index_id, 'title': 'items'}
+    assert current_index_name(index_id) == f"{index_id}_gen1"
+    assert scores(open_text_index(index_id), 'w3 alpha', 'full_text') == pytest.approx(expected['full_text'])
+    assert scores(open_vector_index(index_id), 'w3 alpha', 'similarity') == pytest.approx(expected['similarity'])
+
+
+def corrupt(name, data):
+    if name.endswith('_ivf.pkl'):
+        return data[:-1] + bytes([data[-1] ^ 1])
+    return data
+
+
+@pytest.mark.parametrize("change, error", [
+    (corrupt, "checksums do not match"),
+    (lambda name, data: None if name == 'checksums.json' else data, "checksums.json is missing"),
+    (lambda name, data: None if name.endswith('_faiss.index') else data, "checksums do not match"),
+    (lambda name, data: json.dumps({**json.loads(data), 'format': 2}).encode() if name == 'snapshot.json' else data,
+     "Unsupported snapshot format"),
+])
+def test_damaged_snapshot_is_rejected(snapshot, change, error):
+    index_id, archive = snapshot
+    with pytest.raises(SnapshotError, match=error):
+        import_snapshot(io.BytesIO(rewrite(archive, change)))
+    # the index is left as it was, without files of the rejected generation
+    assert current_index_name(index_id) == index_id
+    assert glob.glob(f"data/{index_id}_gen*") == glob.glob(f"data/{index_id}_generation.pkl")
+
+
+def test_not_a_snapshot():
+    with pytest.raises(SnapshotError):
+        import_snapshot(io.BytesIO(b"not a tar archive" * 100))
@@ -0,0 +1,49 @@
+import pytest
+
+from services.text_search import TextSearch
+
+FILLER = " ".join(f"filler{i}" for i in range(60))
+
+DOCUMENTS = [
+    ('rare', f"{FILLER} the quokka met a common wombat {FILLER}"),
+    ('common', f"common words {FILLER} common again"),
+    ('short', "Café Common"),
+]
+
+
+@pytest.fixture(params=[False, True], ids=["tokenized", "stored-offsets"])
+def index(index_name, request):
+    index = TextSearch(index_file=index_name, settings={'analyzer': {}, 'store_offsets': request.param})
+    index.add_documents(DOCUMENTS + [(str(i), f"common text {i}") for i in range(20)])
+    index.save_index()
+    return TextSearch(index_file=index_name)
+
+
+def highlighted(snippet):
+    return [snippet['text'][start:end] for start, end in snippet['highlights']]
+
+
+def test_snippet_window_covers_the_rarest_words(index):
+    [snippet] = index.snippets(index.ordinals['rare'], 'quokka common')
+    assert highlighted(snippet) == ['quokka', 'common']
+    assert len(snippet['text'].split()) == 24
+    text = index.document_text(index.ordinals['rare'])
+    assert text[snippet['start']:snippet['end']] == snippet['text']
+
+
+def test_snippet_highlights_the_original_text(index):
+    [snippet] = index.snippets(index.ordinals['short'], 'cafe common')
+    assert snippet['text'] == "Café Common"
+    assert highlighted(snippet) == ['Café', 'Common']
+
+
+def test_snippets_are_only_built_when_requested(index):
+    [plain] = index.search('quokka', 'full_text', fields=('id', 'score'))
+    assert 'snippets' not in plain
+    [result] = index.search('quokka', 'full_text', fields=('id', 'snippets'))
+    assert highlighted(result['snippets'][0]) == ['quokka']
+
+
+def test_documents_without_matches_start_at_the_beginning(index):
+    [snippet] = index.snippets(index.ordinals['common'], 'missing')
+    assert snippet['start'] == 0 and snippet['highlights'] == []
@@ -0,0 +1,62 @@
+import re
+import random
+
+import pytest
+
+from services.term_dictionary import TermDictionary
+from services.text_search import TextSearch
+
+WORDS = [''.join(random.Random(i).choice("abc") for _ in range(random.Random(-i).randint(1, 6))) for i in range(500)]
+DOC_FREQS = {word: random.Random(word).randint(1, 50) for word in WORDS}
+
+
+def naive_completions(prefix, top_n):
+    matches = [(word, freq) for word, freq in DOC_FREQS.items() if word.startswith(prefix)]
+    return sorted(matches, key=lambda match: (-match[1], match[0]))[:top_n]
+
+
+@pytest.fixture(scope="module")
+def dictionary():
+    return TermDictionary(DOC_FREQS)
+
+
+@pytest.mark.parametrize("prefix", ["", "a", "ab", "cab", "abcabc", "d"])
+@pytest.mark.parametrize("top_n", [1, 5, 1000])
+def test_completions_match_a_naive_sort(dictionary, prefix, top_n):
+    assert dictionary.complete(prefix, top_n) == naive_completions(prefix, top_n)
+
+
+def test_autocomplete_completes_the_last_word(index_name):
+    index = TextSearch(index_file=index_name, settings={'analyzer': {}})
+    index.add_documents([(str(i), f"Invoice inventory{i % 3} invite") for i in range(10)] + [('x', "inverse")])
+    index.save_index()
+    index = TextSearch(index_file=index_name)
+
+    completions = index.autocomplete("paid INV", top_n=3)
+    assert [completion['term'] for completion in completions] == ['invite', 'invoice', 'inventory0']
+    assert [completion['doc_count'] for completion in completions] == [10, 10, 4]
+    # nothing to complete after a space
+    assert index.autocomplete("inv ") == []
+    assert index.autocomplete("zzz") == []
+
+
+@pytest.mark.parametrize("pattern", ["a*", "*b", "*ab*", "a*c", "ab*ca*", "*", "*cc*a", "abc", "*d*"])
+def test_wildcard_expansion_matches_a_regex_scan(dictionary, pattern):
+    regex = re.compile(pattern.replace("*", ".*"))
+    expected = sorted((word for word in DOC_FREQS if regex.fullmatch(word)),
+                      key=lambda word: (-DOC_FREQS[word], word))
+    assert dictionary.expand(pattern, 1000) == expected
+    assert dictionary.expand(pattern, 3) == expected[:3]
+
+
+def test_wildcard_queries_match_the_expanded_terms(index_name):
+    index = TextSearch(index_file=index_name, settings={'analyzer': {}})
+    index.add_documents([('1', "invoice 2024"), ('2', "invoice2024 draft"), ('3', "inventory X42-b"),
+                         ('4', "part ax42 z"), ('5', "involved")])
+    index.save_index()
+    index = TextSearch(index_file=index_name)
+
+    assert set(index.boolean_match("inv*2024")) == {'2'}
+    assert set(index.boolean_match("inv* -draft")) == {'1', '3', '5'}
+    assert set(index.boolean_match("*x42*")) == {'3', '4'}
+    assert {result['id'] for result in index.search("invo*", 'full_text')} == {'1', '2', '5'}
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+import services.text_search as text_search_module
+from services.text_search import TextSearch
+from services.segments import segment_file
+
+
+def documents(start, end):
+    return [(str(i), f"alpha w{i % 7} text {i}") for i in range(start, end)]
+
+
+def scores(index, query, method='full_text'):
+    return {result['id']: result['score'] for result in index.search(query, method, fields=('id', 'score'))}
+
+
+def test_streamed_build_flushes_segments_before_save(index_name, monkeypatch):
+    monkeypatch.setattr(text_search_module, 'SEGMENT_BUFFER_SIZE', 100)
+    index = TextSearch(index_file=index_name)
+    for start in range(0, 1000, 100):
+        index.add_documents(documents(start, start + 100))
+        # never more than a segment of texts is held in memory
+        assert len(index.documents) < 100
+
+    assert len(index.segments) == 10
+    assert all(os.path.exists(segment_file(index_name, segment['name'])) for segment in index.segments)
+    assert index.document_text(index.ordinals['5']) == "alpha w5 text 5"
+
+    index.save_index()
+    reloaded = TextSearch(index_file=index_name)
+    assert reloaded.document_text(reloaded.ordinals['999']) == "alpha w5 text 999"
+    assert scores(reloaded, 'w3 text') == pytest.approx(scores(index, 'w3 text'))
+
+
+def test_streamed_build_scores_like_a_single_run(index_name, monkeypatch):
+    whole = TextSearch(index_file=f"{index_name}-whole")
+    whole.add_documents(documents(0, 300))
+    whole.save_index()
+
+    monkeypatch.setattr(text_search_module, 'SEGMENT_BUFFER_SIZE', 64)
+    streamed = TextSearch(index_file=index_name)
+    for start in range(0, 300, 50):
+        streamed.add_documents(documents(start, start + 50))
+    streamed.save_index()
+    streamed = TextSearch(index_file=index_name)
+
+    for method in ('full_text', 'ranked_naive'):
+        assert scores(streamed, 'w3 alpha', method) == pytest.approx(scores(whole, 'w3 alpha', method))
+    assert sorted(r['id'] for r in streamed.search('w3 -text', 'exact')) == []
+    assert len(streamed.search('w3', 'exact')) == len([i for i in range(300) if i % 7 == 3])
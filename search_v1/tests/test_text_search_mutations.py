@@ -0,0 +1,201 @@
+import os
+import shutil
+
+import pytest
+
+import services.text_search as text_search_module
+from services.text_search import TextSearch
+from services.segments import merge_segments
+from services.query_parser import QueryParseError
+
+
+def documents(start, end):
+    return [(str(i), f"alpha w{i % 7} text {i}") for i in range(start, end)]
+
+
+def matches(index, query):
+    return sorted(index.boolean_match(query), key=int)
+
+
+@pytest.fixture
+def index(index_name):
+    index = TextSearch(index_file=index_name)
+    index.add_documents(documents(0, 50))
+    index.save_index()
+    return TextSearch(index_file=index_name)
+
+
+def test_query_cache_is_only_written_by_save(index):
+    os.remove(index.cache_file)
+    assert matches(index, 'w3') == ['3', '10', '17', '24', '31', '38', '45']
+    assert not os.path.exists(index.cache_file)
+
+    index.save_index()
+    assert 'w3' in TextSearch(index_file=index.index_name).cache
+
+
+def test_query_cache_is_dropped_with_journal_changes(index):
+    index.boolean_ordinals('w3')
+    index.save_index()
+    index.delete_document('3')
+
+    reloaded = TextSearch(index_file=index.index_name)
+    assert reloaded.cache == {}
+    assert '3' not in matches(reloaded, 'w3')
+
+
+def test_query_cache_of_another_manifest_is_dropped(index):
+    index.boolean_ordinals('w3')
+    index.save_index()
+    shutil.copy(index.cache_file, f"{index.cache_file}.old")
+
+    index.delete_document('3')
+    index.save_index()
+    # a save interrupted between the manifest and the cache
+    os.replace(f"{index.cache_file}.old", index.cache_file)
+
+    reloaded = TextSearch(index_file=index.index_name)
+    assert reloaded.cache == {}
+    assert '3' not in matches(reloaded, 'w3')
+
+
+SETTINGS = {'filter_columns': ['category'], 'store_positions': True}
+
+METHODS = ['full_text', 'ranked_naive', 'boolean_ranked', 'boolean_bm25']
+
+
+def rows(start, end):
+    return [(str(i), f"alpha w{i % 7} text {i} beta", 'odd' if i % 2 else 'even') for i in range(start, end)]
+
+
+def scores(index, query, method='full_text', filters=None):
+    return {result['id']: result['score']
+            for result in index.search(query, method, fields=('id', 'score'), filters=filters)}
+
+
+@pytest.fixture
+def segmented(index_name, monkeypatch):
+    """
+    An index of 100 documents saved as 5 segments of 20.
+    """
+    monkeypatch.setattr(text_search_module, 'SEGMENT_BUFFER_SIZE', 20)
+    index = TextSearch(index_file=index_name, settings=SETTINGS)
+    for start in range(0, 100, 20):
+        index.add_documents(rows(start, start + 20))
+    index.save_index()
+    assert len(index.segments) == 5
+    return index
+
+
+def fresh(name, documents):
+    index = TextSearch(index_file=name, settings=SETTINGS)
+    index.add_documents(documents)
+    index.save_index()
+    return index
+
+
+
+def test_journal_replay_restores_unsaved_changes(segmented):
+    segmented.delete_document('3')
+    segmented.update_document('10', "alpha w3 zebra", {'category': 'odd'})
+    segmented.add_document('new', "alpha w3 quokka", ('even',))
+    segmented.commit()
+
+    reloaded = TextSearch(index_file=segmented.index_name)
+    assert reloaded.journal.size > 0
+    for method in METHODS:
+        assert scores(reloaded, 'w3 alpha', method) == pytest.approx(scores(segmented, 'w3 alpha', method))
+    assert '3' not in scores(reloaded, 'w3')
+    assert list(scores(reloaded, 'zebra')) == ['10']
+    assert reloaded.document_text(reloaded.ordinals['10']) == "alpha w3 zebra"
+    assert reloaded.document_attributes(reloaded.ordinals['new']) == ('even',)
+    assert reloaded.facet_counts('w3', columns=['category']) == segmented.facet_counts('w3', columns=['category'])
+
+
+def test_deleted_documents_are_gone_before_and_after_merge(segmented):
+    gone = {'3', '10', '17', '50'}
+    before = scores(segmented, 'w3 alpha')
+    for doc_id in gone:
+        segmented.delete_document(doc_id)
+    after_delete = scores(segmented, 'w3 alpha')
+    assert set(after_delete) == set(before) - gone
+
+    segmented.save_index()
+    assert merge_segments(segmented.index_name, expunge_deletes=True) > 0
+    merged = TextSearch(index_file=segmented.index_name)
+    # deleted postings are dropped by the merge, so the statistics are those of a
+    # fresh index of the remaining documents
+    expected = fresh(f"{segmented.index_name}-fresh", [row for row in rows(0, 100) if row[0] not in gone])
+    for method in METHODS:
+        assert scores(merged, 'w3 alpha', method) == pytest.approx(scores(expected, 'w3 alpha', method))
+    assert scores(merged, 'w3', filters='category:odd') == pytest.approx(scores(expected, 'w3', filters='category:odd'))
+    assert merged.document_text(merged.ordinals['24']) == "alpha w3 text 24 beta"
+    assert all(merged.ordinals[doc_id] < len(merged.doc_ids) for doc_id in merged.ordinals)
+
+
+def test_merge_policy_combines_segments_of_a_tier(segmented):
+    # five segments of the same size: the first four are merged
+    assert segmented.needs_merge()
+    assert merge_segments(segmented.index_name) == 1
+    merged = TextSearch(index_file=segmented.index_name)
+    assert [segment['end'] - segment['start'] for segment in merged.segments] == [80, 20]
+    assert scores(merged, 'w3 alpha') == pytest.approx(scores(segmented, 'w3 alpha'))
+
+
+@pytest.mark.parametrize("query, expected", [
+    ('"alpha w3"', {'3', '10', '17', '24', '31', '38', '45', '52', '59', '66', '73', '80', '87', '94'}),
+    ('"w3 alpha"', set()),
+    ('"w3 alpha"~1', {'3', '10', '17', '24', '31', '38', '45', '52', '59', '66', '73', '80', '87', '94'}),
+    ('"alpha beta"', set()),
+    ('"alpha beta"~3', {str(i) for i in range(100)}),
+    ('"text 24 beta" -w1', {'24'}),
+])
+def test_phrase_queries_use_positions(segmented, query, expected):
+    assert set(segmented.boolean_match(query)) == expected
+    # the same after a reload, from the positions of the segments
+    assert set(TextSearch(index_file=segmented.index_name).boolean_match(query)) == expected
+
+
+def test_filters(segmented):
+    odd = scores(segmented, 'w3', filters='category:odd')
+    assert set(odd) == {str(i) for i in range(100) if i % 7 == 3 and i % 2}
+    assert scores(segmented, 'w3', filters='-category:odd') == pytest.approx(
+        {doc_id: score for doc_id, score in scores(segmented, 'w3').items() if doc_id not in odd})
+    segmented.delete_document('3')
+    assert '3' not in scores(segmented, 'w3', filters='category:odd')
+    with pytest.raises(QueryParseError):
+        segmented.search('w3', filters='status:open')
+    with pytest.raises(QueryParseError):
+        segmented.search('w3', filters='category:odd AND')
+
+
+def test_facets(segmented):
+    assert segmented.facet_counts('w3', columns=['category']) == {'category': {'even': 7, 'odd': 7}}
+    assert segmented.facet_counts('w3', columns=['category'], filters='category:even') == {'category': {'even': 7}}
+    segmented.delete_document('3')
+    assert segmented.facet_counts('w3', columns=['category']) == {'category': {'even': 7, 'odd': 6}}
+
+
+def test_failed_save_raises_and_keeps_the_journal(segmented, monkeypatch):
+    segmented.delete_document('3')
+    segmented.commit()
+
+    def fail(path, *args, **kwargs):
+        raise OSError(f"No space left on device: {path}")
+
+    monkeypatch.setattr(text_search_module, 'write_pickle', fail)
+    with pytest.raises(OSError):
+        segmented.save_index()
+    monkeypatch.undo()
+
+    # the delete is replayed from the journal of the last saved manifest
+    assert '3' not in scores(TextSearch(index_file=segmented.index_name), 'w3')
+
+
+def test_every_document_deleted(segmented):
+    segmented.delete_documents([str(i) for i in range(100)])
+    segmented.save_index()
+    for index in (segmented, TextSearch(index_file=segmented.index_name)):
+        for method in METHODS:
+            assert scores(index, 'w3 alpha', method) == {}
+        assert index.search('w3', 'exact') == []
@@ -0,0 +1,122 @@
+import pytest
+
+import services.vector_search as vector_search_module
+from services.shards import build_index
+from services.vector_search import VectorSearch, get_vector_search, embed_query
+
+ROWS = [(str(i), f"alpha w{i % 7} text {i}", 'even' if i % 2 == 0 else 'odd') for i in range(60)]
+
+
+@pytest.fixture
+def built(index_name, hashing_model):
+    build_index(index_name, {'shards': 1, 'filter_columns': ['parity']}, [ROWS])
+    return index_name
+
+
+def test_embedding_model_is_loaded_once(built, monkeypatch):
+    loads = []
+    model_class = vector_search_module.SentenceTransformer
+    monkeypatch.setattr(vector_search_module, 'SentenceTransformer',
+                        lambda *args, **kwargs: loads.append(args) or model_class())
+    monkeypatch.setattr(vector_search_module, '_embedding_models', {})
+    for _ in range(3):
+        VectorSearch(file_id=built).search('w3', 'similarity')
+        embed_query('w3')
+    assert len(loads) == 1
+
+
+def test_vector_index_is_cached_until_saved(built):
+    cached = get_vector_search(built)
+    assert get_vector_search(built) is cached
+
+    vector_search = VectorSearch(file_id=built)
+    vector_search.upsert_documents([('new', 'okapi narwhal')])
+    vector_search.save_index(vector_search.vector_index_file, vector_search.doc_file, vector_search.embedding_file)
+
+    reloaded = get_vector_search(built)
+    assert reloaded is not cached
+    assert reloaded.search('okapi narwhal', 'similarity', top_k=1)[0]['id'] == 'new'
+
+
+@pytest.mark.parametrize("method", ['similarity', 'exact_similarity'])
+def test_search_with_query_embedding(built, method):
+    vector_search = VectorSearch(file_id=built)
+    expected = vector_search.search('w3 alpha', method, top_k=10)
+    results = vector_search.search('w3 alpha', method, top_k=10, embedding=embed_query('w3 alpha'))
+    assert [r['id'] for r in results] == [r['id'] for r in expected]
+    assert [r['score'] for r in results] == pytest.approx([r['score'] for r in expected])
+
+
+@pytest.mark.parametrize("filters", [None, "parity:odd"])
+def test_similarity_page_is_looked_up_in_faiss(built, monkeypatch, filters):
+    vector_search = VectorSearch(file_id=built)
+    # every document scored, best first
+    expected = list(vector_search.iter_search('w3 alpha', 'similarity', fields=('id', 'score'), filters=filters))
+
+    monkeypatch.setattr(VectorSearch, 'similarity_scores', lambda *args, **kwargs: pytest.fail("scored every document"))
+    results = vector_search.search('w3 alpha', 'similarity', top_k=5, offset=2, fields=('id', 'score'), filters=filters)
+    assert [r['score'] for r in results] == pytest.approx([r['score'] for r in expected[2:7]])
+    if filters is not None:
+        assert all(int(r['id']) % 2 == 1 for r in results)
+
+
+def test_index_of_the_legacy_format_is_searched(index_name, hashing_model):
+    import faiss
+    import numpy as np
+    from tests.conftest import HashingModel
+
+    # the files of an index saved before the id map: FAISS IDs hashing the document
+    # IDs, texts in a text file and the embeddings in document order
+    documents = {str(i): f"alpha w{i % 7} text {i}" for i in range(30)}
+    embeddings = HashingModel().encode(list(documents.values()))
+    vectors = embeddings.copy()
+    faiss.normalize_L2(vectors)
+    index = faiss.IndexIDMap(faiss.IndexFlatIP(vectors.shape[1]))
+    index.add_with_ids(vectors, np.array([hash(doc_id) for doc_id in documents], dtype='int64'))
+    faiss.write_index(index, f"data/{index_name}_faiss.index")
+    np.save(f"data/{index_name}_emb.npy", embeddings)
+    with open(f"data/{index_name}_text.txt", 'w') as f:
+        f.writelines(f"{doc_id},{text}\n" for doc_id, text in documents.items())
+
+    vector_search = VectorSearch(file_id=index_name)
+    expected = list(vector_search.iter_search('w3 alpha', 'similarity', fields=('id', 'score')))
+    results = vector_search.search('w3 alpha', 'similarity', top_k=5, fields=('id', 'score', 'text'))
+    assert len(results) == 5
+    assert [r['score'] for r in results] == pytest.approx([r['score'] for r in expected[:5]])
+    assert all(r['text'] == documents[r['id']] for r in results)
+
+    # saved with the new id map from then on
+    vector_search.save_index(vector_search.vector_index_file, vector_search.doc_file, vector_search.embedding_file)
+    reloaded = VectorSearch(file_id=index_name)
+    assert [r['id'] for r in reloaded.search('w3 alpha', 'similarity', top_k=5)] == [r['id'] for r in results]
+
+
+def test_single_document_changes_are_replayed_from_the_journal(built):
+    vector_search = VectorSearch(file_id=built)
+    vector_search.update_document('3', 'okapi narwhal')
+    vector_search.update_document('new', 'zebra quokka')
+    assert vector_search.delete_document('5')
+    assert not vector_search.delete_document('missing')
+
+    reloaded = VectorSearch(file_id=built)
+    assert reloaded.search('okapi narwhal', 'similarity', top_k=1)[0]['id'] == '3'
+    assert reloaded.search('zebra quokka', 'similarity', top_k=1)[0]['id'] == 'new'
+    assert '5' not in [r['id'] for r in reloaded.iter_search('w5', 'similarity', fields=('id',))]
+
+    # checkpointed: the journal is not replayed over the saved index again
+    reloaded.save_index(reloaded.vector_index_file, reloaded.doc_file, reloaded.embedding_file)
+    assert not reloaded.journal.size
+    again = VectorSearch(file_id=built)
+    assert again.doc_ids == reloaded.doc_ids
+    assert again.search('zebra quokka', 'similarity', top_k=1)[0]['id'] == 'new'
+
+
+def test_exact_similarity_reads_the_cached_text_index(built, monkeypatch):
+    from services.index_cache import get_text_search
+    from services.text_search import TextSearch
+
+    vector_search = VectorSearch(file_id=built)
+    get_text_search(built)
+    monkeypatch.setattr(TextSearch, '__init__', lambda *args, **kwargs: pytest.fail("loaded the text index"))
+    for _ in range(2):
+        assert vector_search.search('w3 alpha', 'exact_similarity', top_k=3)